@@ -3,16 +3,19 @@
 
 import os
 from datetime import datetime, timedelta
-import logging
-from logging.handlers import RotatingFileHandler
 import traceback
-from flask import Flask, session, request, jsonify
+from flask import Flask, session, request, jsonify, url_for
 from flask_login import LoginManager
-from flask_session import Session
 from dotenv import load_dotenv
 
 # Import database from the centralized location
 from app.database import db, init_db
+from app.metrics import init_metrics
+from app.profiling import init_profiling
+from app.logging_setup import configure_logging
+from app.compression import init_compression
+from app.static_assets import init_static_assets
+from app.session_store import init_session_store
 
 # Initialize login manager
 login_manager = LoginManager()
@@ -33,8 +36,6 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-please-change')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f'sqlite:///{os.path.join(base_dir, "app.db")}')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['SESSION_TYPE'] = 'filesystem'
-    app.config['SESSION_FILE_DIR'] = os.path.join(base_dir, 'app', 'data', 'sessions')
     app.config['SESSION_PERMANENT'] = True
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
     app.config['SESSION_USE_SIGNER'] = True
@@ -47,36 +48,23 @@ def create_app():
     app.config['IMAGES_FOLDER'] = os.path.join(base_dir, 'app', 'static', 'images')
     app.config['LOG_SESSIONS'] = os.getenv('LOG_SESSIONS', 'false').lower() == 'true'
     
-    # Setup logging for production environment
+    # Leveled logging through a background queue; the rotating log file only in production
+    log_file = None
     if not app.debug and not app.testing:
-        # Ensure log directory exists
         log_dir = os.path.join(base_dir, 'logs')
-        try:
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-        except FileExistsError:
-            # Directory already exists, which is fine
-            pass
-        
-        # Create a rotating file handler
-        file_handler = RotatingFileHandler(
-            os.path.join(log_dir, 'app.log'),
-            maxBytes=10485760,  # 10MB
-            backupCount=10
-        )
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        
-        app.logger.setLevel(logging.INFO)
-        app.logger.info('Instagram Influencer Analyzer startup')
+        os.makedirs(log_dir, exist_ok=True)
+        log_file = os.path.join(log_dir, 'app.log')
+    configure_logging(log_file)
+    app.logger.info('Instagram Influencer Analyzer startup')
     
     # Initialize extensions with the app
     init_db(app)  # Initialize database using the centralized function
+    init_compression(app)  # gzip/Brotli for HTML and JSON; registered first so it runs last
+    init_static_assets(app)  # Fingerprinted static URLs and vendored chart libraries
+    init_metrics(app)  # Request timings and the /metrics endpoint
+    init_profiling(app)  # Opt-in per-request cProfile and SQL counts
     login_manager.init_app(app)
-    Session(app)
+    init_session_store(app)  # SESSION_BACKEND: database rows (default), signed cookies or files
     
     # Error handler for production 500 errors
     @app.errorhandler(500)
@@ -91,7 +79,7 @@ def create_app():
         return jsonify(error="Bad gateway error. Please check your server configuration."), 502
     
     # Ensure folders exist
-    for folder in [app.config['UPLOAD_FOLDER'], app.config['DATA_FOLDER'], app.config['IMAGES_FOLDER'], app.config['SESSION_FILE_DIR']]:
+    for folder in [app.config['UPLOAD_FOLDER'], app.config['DATA_FOLDER'], app.config['IMAGES_FOLDER']]:
         if not os.path.exists(folder):
             os.makedirs(folder)
     
@@ -128,6 +116,13 @@ def create_app():
         else:
             return f"{value/1000000:.1f}M".replace('.0M', 'M')
 
+    @app.template_filter('srcset')
+    def srcset_filter(variants):
+        """Build a srcset attribute from [[path, width], ...] derivative lists"""
+        if not variants:
+            return ''
+        return ', '.join(f"{url_for('static', filename=path)} {width}w" for path, width in variants)
+
     # Debugging: Log session data only if explicitly enabled
     @app.before_request
     def log_session():
@@ -0,0 +1,72 @@
+"""
+Response compression for HTML and JSON.
+
+The dashboard, influencer pages and chart/posts APIs return tens to hundreds
+of kilobytes of very repetitive text. Responses of those types at or above
+COMPRESS_MIN_SIZE bytes are compressed with Brotli when the client accepts it
+and the optional ``brotli`` package is installed, and with gzip otherwise.
+Static files, streamed and already-encoded responses are passed through
+untouched. COMPRESSION_ENABLED=false turns it off, e.g. when nginx does it.
+"""
+
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('text/html', 'application/json', 'text/plain', 'text/css', 'application/javascript')
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_GZIP_LEVEL = 6
+# Brotli's mid-range quality compresses better than gzip -6 at a similar speed
+DEFAULT_BROTLI_QUALITY = 5
+
+
+def _choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def init_compression(app):
+    """Register the compression hook unless COMPRESSION_ENABLED is false"""
+    app.config['COMPRESSION_ENABLED'] = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+    min_size = int(os.getenv('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE))
+    gzip_level = int(os.getenv('COMPRESS_GZIP_LEVEL', DEFAULT_GZIP_LEVEL))
+    brotli_quality = int(os.getenv('COMPRESS_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY))
+
+    @app.after_request
+    def compress_response(response):
+        if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers
+                or not 200 <= response.status_code < 300):
+            return response
+        response.vary.add('Accept-Encoding')
+
+        encoding = _choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        if encoding == 'br':
+            data = brotli.compress(data, quality=brotli_quality)
+        else:
+            data = gzip.compress(data, compresslevel=gzip_level)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        # A strong ETag promises identical bytes; the page cache's weak ones stay valid
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
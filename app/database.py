@@ -11,9 +11,21 @@ migrate = Migrate()
 
 def init_db(app):
     """Initialize database with Flask app."""
+    # Imported here to keep this module free of app-level imports
+    from app.db_tuning import init_sqlite_tuning
+
     db.init_app(app)
     migrate.init_app(app, db)
+
+    # WAL, pragmas, pooling and the write queue must be set up before the
+    # engine opens its first connection
+    init_sqlite_tuning(app, db)
     
+    # Import models so create_all() knows about every table
+    from app.models import user, history, image_store, scrape_cache, search_index, server_session, job_state  # noqa: F401
+
     # Create all tables
     with app.app_context():
-        db.create_all() 
\ No newline at end of file
+        db.create_all()
+        # The caption full-text table is raw SQL (FTS5), so create_all() doesn't know it
+        search_index.create_caption_table() 
\ No newline at end of file
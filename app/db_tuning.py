@@ -0,0 +1,236 @@
+"""
+SQLite engine tuning for production.
+
+Several gunicorn workers and their background processing threads all write to
+the same SQLite file. With the default rollback journal and no busy timeout,
+a long write in one worker makes the others fail with "database is locked".
+This module:
+
+- enables WAL journaling so readers never block the writer,
+- sets per-connection pragmas (synchronous, busy_timeout, mmap_size),
+- gives each worker process a small connection pool, and
+- serializes bulk background writes inside a process through a single
+  writer thread, so threads in the same worker queue up instead of fighting
+  over the lock.
+
+Short writes on the request path (session rows, job state) don't go through
+the queue: they would wait behind a long history save or index rebuild.
+They use their own pooled connection and rely on WAL plus busy_timeout.
+
+Writes from different worker processes are still arbitrated by SQLite itself;
+WAL plus busy_timeout makes them wait for each other instead of erroring.
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Connection pragmas applied to every new SQLite connection
+DEFAULT_BUSY_TIMEOUT_MS = 15000
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024  # 256 MB
+DEFAULT_SYNCHRONOUS = 'NORMAL'
+
+# Pool settings per worker process
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_TIMEOUT = 30
+
+# How long a caller waits for its queued write before giving up (seconds)
+DEFAULT_WRITE_TIMEOUT = 120
+
+
+def is_sqlite_uri(database_uri):
+    """Return True if the SQLAlchemy URI points at a SQLite database"""
+    try:
+        return make_url(database_uri).drivername.startswith('sqlite')
+    except Exception:
+        return False
+
+
+def is_sqlite_file_uri(database_uri):
+    """Return True if the URI points at a file-backed (not in-memory) SQLite database"""
+    if not is_sqlite_uri(database_uri):
+        return False
+    return make_url(database_uri).database not in (None, '', ':memory:')
+
+
+def get_sqlite_pragmas(env=None):
+    """Build the pragma settings from environment variables"""
+    env = os.environ if env is None else env
+    return {
+        'journal_mode': env.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': env.get('SQLITE_SYNCHRONOUS', DEFAULT_SYNCHRONOUS),
+        'busy_timeout': int(env.get('SQLITE_BUSY_TIMEOUT_MS', DEFAULT_BUSY_TIMEOUT_MS)),
+        'mmap_size': int(env.get('SQLITE_MMAP_SIZE', DEFAULT_MMAP_SIZE)),
+    }
+
+
+def build_engine_options(database_uri, env=None):
+    """Return SQLALCHEMY_ENGINE_OPTIONS suited to the configured database.
+
+    File-backed SQLite gets a QueuePool (SQLAlchemy 1.4 would otherwise open
+    and close a connection per checkout) and a driver-level timeout matching
+    busy_timeout. Other databases keep SQLAlchemy's defaults.
+    """
+    env = os.environ if env is None else env
+    if not is_sqlite_file_uri(database_uri):
+        return {}
+
+    busy_timeout_ms = int(env.get('SQLITE_BUSY_TIMEOUT_MS', DEFAULT_BUSY_TIMEOUT_MS))
+    return {
+        'poolclass': QueuePool,
+        'pool_size': int(env.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE)),
+        'max_overflow': int(env.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)),
+        'pool_timeout': int(env.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)),
+        'connect_args': {
+            'timeout': busy_timeout_ms / 1000.0,
+            # Pooled connections are handed to whichever thread checks them out
+            'check_same_thread': False,
+        },
+    }
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """Execute the configured pragmas on a raw sqlite3 connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        # journal_mode is persistent, but setting it is cheap and makes a
+        # freshly created database file switch to WAL immediately
+        cursor.execute(f"PRAGMA journal_mode={pragmas['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={pragmas['synchronous']}")
+        cursor.execute(f"PRAGMA busy_timeout={int(pragmas['busy_timeout'])}")
+        cursor.execute(f"PRAGMA mmap_size={int(pragmas['mmap_size'])}")
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine, pragmas=None):
+    """Attach the pragma hook to an engine and reset its pool after fork.
+
+    Must be called before the engine opens its first connection so that every
+    pooled connection is tuned.
+    """
+    if engine.dialect.name != 'sqlite':
+        return engine
+
+    pragmas = pragmas or get_sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    # Connections must never be shared across processes; if the app is
+    # created before gunicorn forks, give each worker a fresh pool
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+    return engine
+
+
+class WriteQueue:
+    """Runs write jobs one at a time on a single dedicated thread.
+
+    ``context_factory`` is called around each job (for example
+    ``app.app_context``) so jobs can use Flask-SQLAlchemy's scoped session.
+    """
+
+    def __init__(self, context_factory=None, name='sqlite-writer'):
+        self.context_factory = context_factory
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def is_writer_thread(self):
+        """True when called from inside a queued job"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue a write job and return a Future for its result"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.context_factory is not None:
+                    with self.context_factory():
+                        result = fn(*args, **kwargs)
+                else:
+                    result = fn(*args, **kwargs)
+                future.set_result(result)
+            except BaseException as e:
+                logger.exception("Error in queued database write: %s", e)
+                future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def stop(self):
+        """Stop the writer thread once queued jobs have run"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def init_sqlite_tuning(app, db):
+    """Configure the app's engine and write queue.
+
+    Called from init_db before any connection is opened.
+    """
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not is_sqlite_uri(database_uri):
+        return
+
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    for key, value in build_engine_options(database_uri).items():
+        engine_options.setdefault(key, value)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+    with app.app_context():
+        configure_engine(db.engine)
+
+    if os.getenv('SQLITE_WRITE_QUEUE', 'true').lower() == 'true':
+        app.extensions['sqlite_write_queue'] = WriteQueue(context_factory=app.app_context)
+
+
+def run_write(fn, *args, **kwargs):
+    """Run a database write through the app's write queue and wait for it.
+
+    Falls back to running inline when there is no app context, the queue is
+    disabled, or we are already on the writer thread.
+    """
+    from flask import current_app, has_app_context
+
+    if not has_app_context():
+        return fn(*args, **kwargs)
+
+    write_queue = current_app.extensions.get('sqlite_write_queue')
+    if write_queue is None or write_queue.is_writer_thread():
+        return fn(*args, **kwargs)
+
+    timeout = current_app.config.get('SQLITE_WRITE_TIMEOUT', DEFAULT_WRITE_TIMEOUT)
+    return write_queue.submit(fn, *args, **kwargs).result(timeout=timeout)
@@ -0,0 +1,122 @@
+"""
+Leveled, non-blocking logging for the ``app`` package.
+
+Modules log through ``logging.getLogger(__name__)``, which puts them under the
+``app`` logger. That logger has a single QueueHandler: callers only append a
+record to an in-memory queue, and a QueueListener thread does the formatting
+and the writes to stdout (and the rotating log file in production). A slow
+terminal or disk never stalls a request or the processing loop.
+
+The level comes from LOG_LEVEL (default INFO). Per-post and per-image lines
+are logged at DEBUG, so at INFO they cost one level check. When DEBUG is on
+they are still sampled: a record logged with ``extra=sample('post')`` is only
+kept for one in LOG_SAMPLE_EVERY calls of that stage.
+"""
+
+import atexit
+import itertools
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOGGER_NAME = 'app'
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+FILE_LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# Keep one in this many sampled records per stage
+DEFAULT_SAMPLE_EVERY = 100
+
+_listener = None
+_queue_handler = None
+_lock = threading.Lock()
+
+
+def sample(stage):
+    """``extra`` for a log call that should be sampled with the others of its stage"""
+    return {'sample_stage': stage}
+
+
+class SampleFilter(logging.Filter):
+    """Pass every Nth record of each sampling stage; unsampled records always pass"""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, every)
+        self._counters = {}
+
+    def filter(self, record):
+        stage = getattr(record, 'sample_stage', None)
+        if stage is None or self.every == 1:
+            return True
+        counter = self._counters.get(stage)
+        if counter is None:
+            counter = self._counters.setdefault(stage, itertools.count())
+        return next(counter) % self.every == 0
+
+
+def get_log_level(env=None):
+    env = os.environ if env is None else env
+    level = env.get('LOG_LEVEL', 'INFO').upper()
+    return level if isinstance(logging.getLevelName(level), int) else 'INFO'
+
+
+def configure_logging(log_file=None, env=None):
+    """Route the ``app`` logger through a queue to stdout and, optionally, a rotating file.
+
+    Safe to call more than once; only the first call in a process sets things up.
+    """
+    global _listener, _queue_handler
+    env = os.environ if env is None else env
+    with _lock:
+        if _listener is not None:
+            return logging.getLogger(LOGGER_NAME)
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers = [stream_handler]
+        if log_file:
+            file_handler = RotatingFileHandler(log_file, maxBytes=10485760, backupCount=10)  # 10MB
+            file_handler.setFormatter(logging.Formatter(FILE_LOG_FORMAT))
+            handlers.append(file_handler)
+
+        _queue_handler = QueueHandler(queue.SimpleQueue())
+        _queue_handler.addFilter(SampleFilter(int(env.get('LOG_SAMPLE_EVERY', DEFAULT_SAMPLE_EVERY))))
+
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.setLevel(get_log_level(env))
+        logger.addHandler(_queue_handler)
+        logger.propagate = False
+
+        _listener = QueueListener(_queue_handler.queue, *handlers)
+        _listener.start()
+        atexit.register(_stop_listener)
+        return logger
+
+
+def _stop_listener():
+    # Flushes whatever is still queued
+    if _listener is not None:
+        _listener.stop()
+
+
+def _after_fork_in_child():
+    """Worker processes forked for sharded processing have no listener thread;
+    hand their records straight to the listener's handlers instead."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        handler.filters = list(_queue_handler.filters)
+        logger.addHandler(handler)
+    _listener = None
+    _queue_handler = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
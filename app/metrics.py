@@ -0,0 +1,219 @@
+"""
+In-process metrics: counters, histograms and stage timers.
+
+Pipeline code reports what it does with ``inc()`` and ``observe()`` and wraps
+its stages in ``timer()`` (or ``@timed``). Everything lands in a process-wide
+registry served in the Prometheus text format on ``/metrics``. A background
+job can also collect its own figures with ``track_job()``; stage times and
+counters recorded on that thread while it is active are copied into a
+``JobMetrics`` that is attached to the job's status record.
+
+Each gunicorn worker keeps its own registry, so a scrape sees the worker that
+answered it; series carry a ``worker`` label with the process id.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, abort, g, request
+
+# Upper bounds in seconds; sized for everything from a route to a large batch
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+METRIC_PREFIX = 'influencer_analyzer_'
+
+HELP = {
+    'stage_duration_seconds': 'Time spent in a pipeline stage',
+    'http_request_duration_seconds': 'Time to answer a request, by endpoint',
+    'posts_processed_total': 'New posts built into influencer records',
+    'posts_skipped_total': 'Scraped posts skipped because they were already stored',
+    'images_total': 'Image fetches by outcome (downloaded, not_modified, fresh, stale, error)',
+    'scrape_cache_total': 'Usernames served from the scrape cache (hit) or sent to Apify (miss)',
+    'apify_runs_total': 'Apify actor runs by actor',
+    'apify_run_duration_seconds': 'Time from starting an Apify actor run to having its dataset on disk',
+    'llm_calls_total': 'Content analyses by outcome (ok, invalid_response, error, fallback)',
+}
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by (name, labels)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket counts, then sum and count
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self):
+        """Prometheus text exposition of every series"""
+        worker = str(os.getpid())
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    lines.append(f'# HELP {METRIC_PREFIX}{name} {HELP[name]}')
+                lines.append(f'# TYPE {METRIC_PREFIX}{name} {kind}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{METRIC_PREFIX}{name}{_labels(labels, worker)} {value}')
+
+        for (name, labels), histogram in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram):
+                cumulative += count
+                lines.append(f'{METRIC_PREFIX}{name}_bucket{_labels(labels, worker, le=bound)} {cumulative}')
+            lines.append(f'{METRIC_PREFIX}{name}_bucket{_labels(labels, worker, le="+Inf")} {histogram[-1]}')
+            lines.append(f'{METRIC_PREFIX}{name}_sum{_labels(labels, worker)} {histogram[-2]:.6f}')
+            lines.append(f'{METRIC_PREFIX}{name}_count{_labels(labels, worker)} {histogram[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, worker, le=None):
+    pairs = list(labels) + [('worker', worker)]
+    if le is not None:
+        pairs.append(('le', le))
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+REGISTRY = Registry()
+
+
+class JobMetrics:
+    """Stage times and counters recorded for one background job"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_count(self, name, value, labels):
+        key = '.'.join([name] + [str(labels[label]) for label in sorted(labels)])
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'elapsed_seconds': round(time.time() - self.started, 3),
+                'stages': {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+                'counters': dict(self.counters),
+            }
+
+
+_local = threading.local()
+
+
+def current_job():
+    return getattr(_local, 'job', None)
+
+
+@contextmanager
+def track_job(job=None):
+    """Collect this thread's stage times and counters into a JobMetrics"""
+    previous = current_job()
+    _local.job = job or JobMetrics()
+    try:
+        yield _local.job
+    finally:
+        _local.job = previous
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+    job = current_job()
+    if job is not None:
+        job.add_count(name, value, labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextmanager
+def timer(stage):
+    """Time a pipeline stage into stage_duration_seconds (and the current job)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        REGISTRY.observe('stage_duration_seconds', elapsed, stage=stage)
+        job = current_job()
+        if job is not None:
+            job.add_stage(stage, elapsed)
+
+
+def timed(stage):
+    """Decorator form of timer()"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_metrics(app):
+    """Time every request and serve /metrics (bearer METRICS_TOKEN, if set)"""
+    token = os.getenv('METRICS_TOKEN')
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            observe('http_request_duration_seconds', time.perf_counter() - started,
+                    endpoint=request.endpoint or 'unknown', method=request.method,
+                    status=response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,248 @@
+"""
+Mergeable aggregate state for influencer engagement metrics.
+
+Each influencer keeps an ``EngagementAggregate`` next to its posts. It holds
+only summary state: counts, sums, sums of squares and maxima for likes,
+comments and engagement rate, bounded top-k counters for hashtags and
+mentions, and per-period engagement buckets. Aggregates built from different
+batches, worker processes or runs combine with ``merge()`` without looking at
+the posts again, which is what incremental refreshes and sharded processing
+rely on.
+"""
+
+import math
+from datetime import datetime, timedelta
+
+from app.models.apify_client_wrapper import parse_timestamp
+
+# Distinct hashtags/mentions tracked per influencer; only the top 10 are shown
+TOP_K_CAPACITY = 200
+
+PERIODS = ('weekly', 'monthly', 'quarterly')
+
+
+class RunningStats:
+    """Count, sum, sum of squares and max of a stream of numbers"""
+
+    __slots__ = ('count', 'total', 'sum_sq', 'max')
+
+    def __init__(self, count=0, total=0.0, sum_sq=0.0, max=None):
+        self.count = count
+        self.total = total
+        self.sum_sq = sum_sq
+        self.max = max
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.sum_sq += value * value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.sum_sq += other.sum_sq
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    @property
+    def stddev(self):
+        if self.count < 2:
+            return 0.0
+        variance = (self.sum_sq - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'sum_sq': self.sum_sq, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data) if data else cls()
+
+
+class TopK:
+    """Bounded frequency counter (Space-Saving).
+
+    Tracks at most ``capacity`` items. When a new item arrives and the table
+    is full, it replaces the least frequent item and inherits its count, so a
+    count can overestimate by at most ``errors[item]``. Frequent items are
+    always kept. Merging adds the counts of both summaries and trims back to
+    capacity.
+    """
+
+    __slots__ = ('capacity', 'counts', 'errors')
+
+    def __init__(self, capacity=TOP_K_CAPACITY, counts=None, errors=None):
+        self.capacity = capacity
+        self.counts = counts or {}
+        self.errors = errors or {}
+
+    def add(self, item, count=1):
+        if item in self.counts or len(self.counts) < self.capacity:
+            self.counts[item] = self.counts.get(item, 0) + count
+            return
+        victim = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(victim)
+        self.errors.pop(victim, None)
+        self.counts[item] = floor + count
+        self.errors[item] = floor
+
+    def merge(self, other):
+        for item, count in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0) + count
+            if item in other.errors:
+                self.errors[item] = self.errors.get(item, 0) + other.errors[item]
+        if len(self.counts) > self.capacity:
+            keep = sorted(self.counts, key=self.counts.get, reverse=True)[:self.capacity]
+            self.counts = {item: self.counts[item] for item in keep}
+            self.errors = {item: error for item, error in self.errors.items() if item in self.counts}
+        return self
+
+    def most_common(self, n=None):
+        ranked = sorted(self.counts.items(), key=lambda pair: (-pair[1], pair[0]))
+        return ranked if n is None else ranked[:n]
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'counts': self.counts, 'errors': self.errors}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data) if data else cls()
+
+
+def bucket_labels(timestamp):
+    """Week (ending Sunday, like pandas' 'W'), month and quarter labels for a timestamp"""
+    week_end = timestamp.date() + timedelta(days=6 - timestamp.weekday())
+    quarter = (timestamp.month - 1) // 3 + 1
+    return week_end.strftime('%Y-%m-%d'), timestamp.strftime('%Y-%m'), f'{timestamp.year}-Q{quarter}'
+
+
+def _next_label(label, period):
+    if period == 'weekly':
+        return (datetime.strptime(label, '%Y-%m-%d') + timedelta(days=7)).strftime('%Y-%m-%d')
+    if period == 'monthly':
+        year, month = map(int, label.split('-'))
+        return f'{year + month // 12}-{month % 12 + 1:02d}'
+    year, quarter = int(label[:4]), int(label[-1])
+    return f'{year + quarter // 4}-Q{quarter % 4 + 1}'
+
+
+class EngagementAggregate:
+    """Summary of an influencer's posts that can be updated and merged in O(1)"""
+
+    __slots__ = ('likes', 'comments', 'engagement_rate', 'hashtags', 'mentions', 'buckets', 'latest_timestamp')
+
+    def __init__(self):
+        self.likes = RunningStats()
+        self.comments = RunningStats()
+        self.engagement_rate = RunningStats()
+        self.hashtags = TopK()
+        self.mentions = TopK()
+        # Period -> bucket label -> [likes, comments]
+        self.buckets = {period: {} for period in PERIODS}
+        self.latest_timestamp = None
+
+    @property
+    def post_count(self):
+        return self.likes.count
+
+    def add_post(self, post):
+        """Fold one processed post dict into the aggregate"""
+        likes = int(post.get('likes_count') or 0)
+        comments = int(post.get('comments_count') or 0)
+        self.likes.add(likes)
+        self.comments.add(comments)
+        if 'engagement_rate' in post:
+            self.engagement_rate.add(float(post['engagement_rate']))
+        for tag in post.get('hashtags') or []:
+            self.hashtags.add(tag)
+        for mention in post.get('mentions') or []:
+            self.mentions.add(mention)
+
+        timestamp = parse_timestamp(post.get('timestamp'))
+        if timestamp is not None:
+            for period, label in zip(PERIODS, bucket_labels(timestamp)):
+                bucket = self.buckets[period].setdefault(label, [0, 0])
+                bucket[0] += likes
+                bucket[1] += comments
+            iso = timestamp.isoformat()
+            if self.latest_timestamp is None or iso > self.latest_timestamp:
+                self.latest_timestamp = iso
+        return self
+
+    def merge(self, other):
+        """Combine another aggregate (e.g. a new batch or a worker's shard) into this one"""
+        self.likes.merge(other.likes)
+        self.comments.merge(other.comments)
+        self.engagement_rate.merge(other.engagement_rate)
+        self.hashtags.merge(other.hashtags)
+        self.mentions.merge(other.mentions)
+        for period in PERIODS:
+            mine = self.buckets[period]
+            for label, (likes, comments) in other.buckets[period].items():
+                bucket = mine.setdefault(label, [0, 0])
+                bucket[0] += likes
+                bucket[1] += comments
+        if other.latest_timestamp and (self.latest_timestamp is None or other.latest_timestamp > self.latest_timestamp):
+            self.latest_timestamp = other.latest_timestamp
+        return self
+
+    @classmethod
+    def from_posts(cls, posts):
+        aggregate = cls()
+        for post in posts:
+            aggregate.add_post(post)
+        return aggregate
+
+    def series(self, period, followers_count):
+        """Gap-free chart series for one period, oldest first"""
+        buckets = self.buckets[period]
+        if not buckets:
+            return []
+        series = []
+        label, last = min(buckets), max(buckets)
+        while True:
+            likes, comments = buckets.get(label, (0, 0))
+            engagement = likes + comments
+            series.append({
+                'date': label,
+                'likes': int(likes),
+                'comments': int(comments),
+                'engagement': int(engagement),
+                'engagement_rate': float(engagement / followers_count * 100) if followers_count > 0 else 0.0,
+            })
+            if label >= last:
+                return series
+            label = _next_label(label, period)
+
+    def to_dict(self):
+        return {
+            'likes': self.likes.to_dict(),
+            'comments': self.comments.to_dict(),
+            'engagement_rate': self.engagement_rate.to_dict(),
+            'hashtags': self.hashtags.to_dict(),
+            'mentions': self.mentions.to_dict(),
+            'buckets': self.buckets,
+            'latest_timestamp': self.latest_timestamp,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        if not data:
+            return aggregate
+        aggregate.likes = RunningStats.from_dict(data.get('likes'))
+        aggregate.comments = RunningStats.from_dict(data.get('comments'))
+        aggregate.engagement_rate = RunningStats.from_dict(data.get('engagement_rate'))
+        aggregate.hashtags = TopK.from_dict(data.get('hashtags'))
+        aggregate.mentions = TopK.from_dict(data.get('mentions'))
+        buckets = data.get('buckets') or {}
+        aggregate.buckets = {period: dict(buckets.get(period) or {}) for period in PERIODS}
+        aggregate.latest_timestamp = data.get('latest_timestamp')
+        return aggregate
@@ -1,65 +1,213 @@
 import os
-import json
+import re
 import time
 import tempfile
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
 from apify_client import ApifyClient
 import logging
 import dotenv
 
+from app.metrics import inc, observe, timed
+from app.models.jsonl import DEFAULT_CHUNK_SIZE, JsonlWriter, write_chunks
+
 dotenv.load_dotenv(override= True)
 
+logger = logging.getLogger(__name__)
+
+PROFILE_ACTOR_ID = "dSCLg0C3YEZ83HzYX"
+POST_ACTOR_ID = "shu8hvrXbJbY3Eb9W"
+
+# Usernames per actor run, and how many actor runs may be in flight at once
+DEFAULT_SHARD_SIZE = 25
+DEFAULT_MAX_PARALLEL_RUNS = 4
+
+
+def username_from_url(url):
+    """Get the username from a profile URL (handles instagram.com/username/ or instagram.com/username?hl=en)"""
+    return url.split('instagram.com/')[1].split('/')[0].split('?')[0]
+
+
+def parse_timestamp(value):
+    """Apify timestamp (ISO 8601, 'Z' suffix) or date as a naive UTC datetime, or None"""
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_newer_than(value, now=None):
+    """Turn an onlyPostsNewerThan value ("3 months" or a "YYYY-MM-DD" date) into a UTC cutoff datetime"""
+    if not value:
+        return None
+    match = re.match(r'\s*(\d+)\s*(day|week|month|year)s?\s*$', str(value))
+    if not match:
+        return parse_timestamp(value)
+    amount, unit = int(match.group(1)), match.group(2)
+    days = {'day': 1, 'week': 7, 'month': 30, 'year': 365}[unit] * amount
+    return (now or datetime.utcnow()) - timedelta(days=days)
+
+
+def newer_than_for(username, posts_newer_than, newer_than_by_username=None):
+    """The onlyPostsNewerThan value to use for one username"""
+    if newer_than_by_username:
+        return newer_than_by_username.get(username.lower(), posts_newer_than)
+    return posts_newer_than
+
 
 class ApifyWrapper:
     """A wrapper for the Apify Client to scrape Instagram data"""
     
-    def __init__(self, api_token=None):
-        """Initialize the Apify client with an API token"""
+    def __init__(self, api_token=None, client=None):
+        """Initialize the Apify client with an API token
+        
+        A preconfigured client (e.g. FakeApifyClient) can be passed instead;
+        APIFY_FAKE=true uses the fake client without a token.
+        """
+        self.shard_size = max(1, int(os.getenv('APIFY_SHARD_SIZE', DEFAULT_SHARD_SIZE)))
+        self.max_parallel_runs = max(1, int(os.getenv('APIFY_MAX_PARALLEL_RUNS', DEFAULT_MAX_PARALLEL_RUNS)))
+        self.chunk_size = int(os.getenv('APIFY_EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+        
+        if client is None and os.getenv('APIFY_FAKE', 'false').lower() == 'true':
+            from app.models.fake_apify_client import FakeApifyClient
+            client = FakeApifyClient(delay=float(os.getenv('APIFY_FAKE_DELAY', 0)))
+            logger.info("Using fake Apify client (APIFY_FAKE=true)")
+        if client is not None:
+            self.api_token = api_token
+            self.client = client
+            return
+        
         self.api_token = api_token or os.getenv('APIFY_API_TOKEN')
-        print(f"DEBUG: APIFY_API_TOKEN = {self.api_token}")
-        logging.basicConfig(level=logging.INFO)
-        logging.info(f"DEBUG: APIFY_API_TOKEN = {self.api_token}")
         if not self.api_token:
             raise ValueError("Apify API token is not set. Please set the APIFY_API_TOKEN environment variable.")
         self.client = ApifyClient(self.api_token)
     
-    def scrape_instagram_profiles(self, urls):
-        """
-        Scrape Instagram profiles using Apify's Instagram Profile Scraper
-        
-        Args:
-            urls (list): List of Instagram profile URLs
+    def shard(self, urls):
+        """Split URLs into groups of at most shard_size, one actor run each"""
+        return [urls[i:i + self.shard_size] for i in range(0, len(urls), self.shard_size)] or [[]]
+    
+    def _profile_jobs(self, urls):
+        """Actor inputs for the profile scraper, one per shard"""
+        jobs = []
+        for shard in self.shard(urls):
+            usernames = [username_from_url(url) for url in shard]
+            logger.debug("Scraping profiles for usernames: %s", usernames)
+            jobs.append((PROFILE_ACTOR_ID, {"usernames": usernames}))
+        return jobs
+    
+    def _posts_jobs(self, urls, max_posts, posts_newer_than, newer_than_by_username=None):
+        """Actor inputs for the post scraper, one per shard
         
-        Returns:
-            str: Path to the saved JSON file with profile data
+        newer_than_by_username overrides posts_newer_than for some usernames;
+        usernames sharing a cutoff are sharded together.
         """
-        # Extract usernames from URLs
-        usernames = []
+        groups = {}
         for url in urls:
-            # Get the username from the URL (handle formats like instagram.com/username/ or instagram.com/username?hl=en)
-            username = url.split('instagram.com/')[1].split('/')[0].split('?')[0]
-            usernames.append(username)
-        
-        print(f"Scraping profiles for usernames: {usernames}")
+            newer_than = newer_than_for(username_from_url(url), posts_newer_than, newer_than_by_username)
+            groups.setdefault(newer_than, []).append(url)
         
-        # Prepare the Actor input
-        run_input = {"usernames": usernames}
+        jobs = []
+        for posts_newer_than, group in groups.items():
+            jobs.extend(self._posts_group_jobs(group, max_posts, posts_newer_than))
+        return jobs
+    
+    def _posts_group_jobs(self, urls, max_posts, posts_newer_than):
+        jobs = []
+        for shard in self.shard(urls):
+            run_input = {
+                "directUrls": shard,
+                "resultsType": "posts",
+                "resultsLimit": int(max_posts),
+                "searchType": "user",
+                "searchLimit": 1,
+                "addParentData": False
+            }
+            
+            # Add time filter if specified
+            if posts_newer_than:
+                run_input["onlyPostsNewerThan"] = posts_newer_than
+            
+            logger.debug("Scraping posts for URLs: %s, max_posts: %s, newer_than: %s", shard, max_posts, posts_newer_than)
+            jobs.append((POST_ACTOR_ID, run_input))
+        return jobs
+    
+    def _run_into(self, actor_id, run_input, writer):
+        """Run an Actor, wait for it to finish and stream its dataset into writer"""
+        start = time.time()
+        run = self.client.actor(actor_id).call(run_input=run_input)
+        items = self.client.dataset(run["defaultDatasetId"]).iterate_items()
+        count = write_chunks(writer, items, self.chunk_size)
+        actor = 'profile' if actor_id == PROFILE_ACTOR_ID else 'post'
+        inc('apify_runs_total', actor=actor)
+        observe('apify_run_duration_seconds', time.time() - start, actor=actor)
+        logger.debug("Actor %s returned %s items in %.1fs", actor_id, count, time.time() - start)
+        return count
+    
+    @staticmethod
+    def _chain(*callbacks):
+        """Combine on_items callbacks, skipping missing ones"""
+        callbacks = [callback for callback in callbacks if callback is not None]
         
-        # Run the Actor and wait for it to finish
-        run = self.client.actor("dSCLg0C3YEZ83HzYX").call(run_input=run_input)
+        def on_items(items):
+            for callback in callbacks:
+                callback(items)
+        return on_items
+    
+    def _run_jobs(self, jobs, writers=None):
+        """
+        Run (actor_id, run_input, writer) jobs, up to max_parallel_runs at a time
         
-        # Create a temporary file to store the profile data
-        fd, profile_file_path = tempfile.mkstemp(suffix='.json')
-        os.close(fd)
+        Every writer is closed if all runs succeed and discarded otherwise; the
+        first error is re-raised.
+        """
+        writers = {id(writer): writer for writer in (writers or [writer for _, _, writer in jobs])}
+        try:
+            if len(jobs) == 1:
+                self._run_into(*jobs[0])
+            elif jobs:
+                with ThreadPoolExecutor(max_workers=min(self.max_parallel_runs, len(jobs)),
+                                        thread_name_prefix='apify-run') as executor:
+                    futures = [executor.submit(self._run_into, *job) for job in jobs]
+                    for future in futures:
+                        future.result()
+        except Exception:
+            for writer in writers.values():
+                writer.abort()
+            raise
+        for writer in writers.values():
+            writer.close()
+            logger.debug("Saved %s items to %s", writer.count, writer.path)
+    
+    @staticmethod
+    def _writer(output_path, on_items):
+        if output_path is None:
+            fd, output_path = tempfile.mkstemp(suffix='.jsonl')
+            os.close(fd)
+        return JsonlWriter(output_path, on_items)
+    
+    def scrape_instagram_profiles(self, urls, output_path=None, on_items=None):
+        """
+        Scrape Instagram profiles using Apify's Instagram Profile Scraper
         
-        # Fetch and save Actor results 
-        with open(profile_file_path, 'w', encoding='utf-8') as f:
-            profiles = list(self.client.dataset(run["defaultDatasetId"]).iterate_items())
-            json.dump(profiles, f, ensure_ascii=False, indent=2)
+        Args:
+            urls (list): List of Instagram profile URLs
+            output_path (str): JSON Lines file to write the profiles to (a temp file if omitted)
+            on_items (callable): Called with each chunk of profiles as it is written
         
-        print(f"Saved {len(profiles)} profiles to {profile_file_path}")
-        return profile_file_path
+        Returns:
+            str: Path to the saved JSON Lines file with profile data
+        """
+        writer = self._writer(output_path, on_items)
+        self._run_jobs([(actor_id, run_input, writer) for actor_id, run_input in self._profile_jobs(urls)])
+        return writer.path
     
-    def scrape_instagram_posts(self, urls, max_posts=50, posts_newer_than=None):
+    def scrape_instagram_posts(self, urls, max_posts=50, posts_newer_than=None, output_path=None, on_items=None):
         """
         Scrape Instagram posts using Apify's Instagram Post Scraper
         
@@ -67,37 +215,78 @@ class ApifyWrapper:
             urls (list): List of Instagram profile URLs
             max_posts (int): Maximum number of posts to fetch per profile
             posts_newer_than (str): Only fetch posts newer than specified timeframe (e.g., "1 month")
+            output_path (str): JSON Lines file to write the posts to (a temp file if omitted)
+            on_items (callable): Called with each chunk of posts as it is written
         
         Returns:
-            str: Path to the saved JSON file with posts data
+            str: Path to the saved JSON Lines file with posts data
         """
-        # Prepare the Actor input
-        run_input = {
-            "directUrls": urls,
-            "resultsType": "posts",
-            "resultsLimit": int(max_posts),
-            "searchType": "user",
-            "searchLimit": 1,
-            "addParentData": False
-        }
-        
-        # Add time filter if specified
-        if posts_newer_than:
-            run_input["onlyPostsNewerThan"] = posts_newer_than
-        
-        print(f"Scraping posts for URLs: {urls}, max_posts: {max_posts}, newer_than: {posts_newer_than}")
-        
-        # Run the Actor and wait for it to finish
-        run = self.client.actor("shu8hvrXbJbY3Eb9W").call(run_input=run_input)
-        
-        # Create a temporary file to store the posts data
-        fd, posts_file_path = tempfile.mkstemp(suffix='.json')
-        os.close(fd)
-        
-        # Fetch and save Actor results
-        with open(posts_file_path, 'w', encoding='utf-8') as f:
-            posts = list(self.client.dataset(run["defaultDatasetId"]).iterate_items())
-            json.dump(posts, f, ensure_ascii=False, indent=2)
-        
-        print(f"Saved {len(posts)} posts to {posts_file_path}")
-        return posts_file_path 
\ No newline at end of file
+        writer = self._writer(output_path, on_items)
+        jobs = self._posts_jobs(urls, max_posts, posts_newer_than)
+        self._run_jobs([(actor_id, run_input, writer) for actor_id, run_input in jobs])
+        return writer.path
+    
+    @timed('apify_scrape')
+    def scrape_profiles_and_posts(self, urls, max_posts=50, posts_newer_than=None,
+                                  profile_path=None, posts_path=None,
+                                  on_profiles=None, on_posts=None, cache=None,
+                                  newer_than_by_username=None):
+        """
+        Scrape profiles and posts concurrently
+        
+        The profile and post Actor runs are independent, so all of them (one of
+        each per shard of usernames) are started together, up to
+        APIFY_MAX_PARALLEL_RUNS at a time. Wall-clock time approaches that of the
+        slowest single run.
+        
+        Args:
+            urls (list): List of Instagram profile URLs
+            max_posts (int): Maximum number of posts to fetch per profile
+            posts_newer_than (str): Only fetch posts newer than specified timeframe
+            profile_path (str): JSON Lines file for the profiles
+            posts_path (str): JSON Lines file for the posts
+            on_profiles (callable): Called with each chunk of profiles (from a worker thread)
+            on_posts (callable): Called with each chunk of posts (from a worker thread)
+            cache (ScrapeCache): Reuse fresh cached results and only scrape the rest
+            newer_than_by_username (dict): Per-username (lower-cased) posts_newer_than
+                overrides, e.g. the date of the latest stored post for incremental refreshes
+        
+        Returns:
+            tuple: (profile_path, posts_path)
+        """
+        profile_writer = self._writer(profile_path, on_profiles)
+        posts_writer = self._writer(posts_path, on_posts)
+        
+        start = time.time()
+        jobs = []
+        collector = None
+        try:
+            if cache is not None:
+                cached_usernames, urls = cache.partition(urls, max_posts, posts_newer_than, newer_than_by_username)
+                cache.replay(cached_usernames, profile_writer, posts_writer, max_posts, posts_newer_than,
+                             newer_than_by_username)
+                # Only freshly scraped items go back into the cache
+                collector = cache.collector(urls)
+                profile_writer.on_items = self._chain(collector.add_profiles, on_profiles)
+                posts_writer.on_items = self._chain(collector.add_posts, on_posts)
+            
+            if urls:
+                # Interleave so the first runs to start include both kinds
+                profile_jobs = [(a, r, profile_writer) for a, r in self._profile_jobs(urls)]
+                posts_jobs = [(a, r, posts_writer) for a, r in
+                              self._posts_jobs(urls, max_posts, posts_newer_than, newer_than_by_username)]
+                jobs = [job for pair in zip_longest(posts_jobs, profile_jobs) for job in pair if job]
+            
+            self._run_jobs(jobs, [profile_writer, posts_writer])
+        except Exception:
+            profile_writer.abort()
+            posts_writer.abort()
+            if collector is not None:
+                collector.abort()
+            raise
+        
+        if collector is not None:
+            collector.commit(max_posts, posts_newer_than, newer_than_by_username)
+        logger.info("Collected %s profiles and %s posts (%s Actor runs, %.1fs)",
+                    profile_writer.count, posts_writer.count, len(jobs), time.time() - start)
+        return profile_writer.path, posts_writer.path
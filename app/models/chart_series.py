@@ -0,0 +1,117 @@
+"""
+Compact encoding and downsampling for the engagement chart series.
+
+``influencer_api`` normally returns every series as parallel JSON arrays with
+ISO date strings. In compact mode each series is instead sorted by time and
+sent as a start epoch plus per-point deltas, with rounded value columns, and
+can be reduced to a requested number of points with Largest-Triangle-Three-
+Buckets, which keeps the peaks and troughs a chart needs to look the same.
+"""
+
+import calendar
+import re
+from datetime import datetime
+
+from app.models.apify_client_wrapper import parse_timestamp
+
+# Decimal places kept for engagement rates (percentages)
+RATE_DECIMALS = 4
+
+_QUARTER_LABEL = re.compile(r'^(\d{4})-Q([1-4])$')
+_MONTH_LABEL = re.compile(r'^(\d{4})-(\d{2})$')
+
+
+def to_epoch(value):
+    """Seconds since the epoch for a post timestamp or a weekly/monthly/quarterly label, or None"""
+    if value is None:
+        return None
+    text = str(value).strip()
+    match = _QUARTER_LABEL.match(text) or _MONTH_LABEL.match(text)
+    if match:
+        year, part = int(match.group(1)), int(match.group(2))
+        month = (part - 1) * 3 + 1 if 'Q' in text else part
+        if not 1 <= month <= 12:
+            return None
+        parsed = datetime(year, month, 1)
+    else:
+        parsed = parse_timestamp(text)
+    if parsed is None:
+        return None
+    return calendar.timegm(parsed.timetuple())
+
+
+def lttb(xs, ys, threshold):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps out of (xs, ys).
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the point kept
+    from the previous bucket and the average of the next one.
+    """
+    count = len(xs)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    kept = [0]
+    bucket_size = (count - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Average of the next bucket (the last point for the final bucket)
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, count)
+        if next_start >= next_end:
+            next_start, next_end = count - 1, count
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        px, py = xs[previous], ys[previous]
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs((px - avg_x) * (ys[index] - py) - (px - xs[index]) * (avg_y - py))
+            if area > best_area:
+                best, best_area = index, area
+        kept.append(best)
+        previous = best
+    kept.append(count - 1)
+    return kept
+
+
+def compact_series(dates, engagement_rate, likes, comments, points=None):
+    """One chart series as {'t0', 'dt', 'engagement_rate', 'likes', 'comments', 'total'}.
+
+    Points without a parseable date are dropped. ``t0`` is the first point's
+    epoch seconds and ``dt`` the seconds from each point to the next one, so
+    timestamps are small integers. With ``points``, the series is
+    downsampled with LTTB on engagement rate; ``total`` is the count before.
+    """
+    rows = []
+    for date, rate, like, comment in zip(dates, engagement_rate, likes, comments):
+        epoch = to_epoch(date)
+        if epoch is not None:
+            rows.append((epoch, _number(rate), int(_number(like)), int(_number(comment))))
+    rows.sort(key=lambda row: row[0])
+    total = len(rows)
+
+    if points and total > points:
+        rows = [rows[index] for index in lttb([row[0] for row in rows], [row[1] for row in rows], points)]
+
+    epochs = [row[0] for row in rows]
+    return {
+        't0': epochs[0] if epochs else None,
+        'dt': [later - earlier for earlier, later in zip(epochs, epochs[1:])],
+        'engagement_rate': [round(row[1], RATE_DECIMALS) for row in rows],
+        'likes': [row[2] for row in rows],
+        'comments': [row[3] for row in rows],
+        'total': total,
+    }
+
+
+def _number(value):
+    # NaN, infinities and missing values chart as zero, like the full format
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return value if value == value and value not in (float('inf'), float('-inf')) else 0.0
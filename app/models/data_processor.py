@@ -3,18 +3,30 @@ import numpy as np
 import json
 import os
 from datetime import datetime
-import traceback
+import logging
 from wordcloud import WordCloud
 import matplotlib
 matplotlib.use('Agg')  # Set non-interactive backend globally
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
-from collections import defaultdict, Counter
 import requests
 import shutil # Added for clear_data potential image deletion
 import uuid # For unique run IDs
 import re
+import time
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from app.models.aggregates import EngagementAggregate
+from app.models.image_store import ImageStore
+from app.models.jsonl import load_records
+from app.models.records import Influencer, Post, Record, encode_influencers, influencers_from_dicts
+from app.models.tags import TagDictionary
+from app.metrics import inc, timed
+from app.logging_setup import sample
+from app.models import search_index
+from app.models.image_derivatives import submit_derivatives
 
 # Define the path for the data file relative to the script's location
 # This assumes run.py is in the root and calls create_app which sets up paths
@@ -23,6 +35,170 @@ APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DEFAULT_DATA_DIR = os.path.join(APP_ROOT, 'data')
 DEFAULT_IMAGES_PATH = os.path.join(APP_ROOT, 'static', 'images')
 
+logger = logging.getLogger(__name__)
+
+# Influencers in one batch before post processing is sharded across processes
+DEFAULT_SHARD_THRESHOLD = 200
+
+# Post fields the paginated posts API can sort by
+POST_SORT_FIELDS = {
+    'timestamp': 'timestamp',
+    'engagement_rate': 'engagement_rate',
+    'likes': 'likes_count',
+}
+
+
+def _post_sort_value(post, field):
+    value = post.get(field)
+    if field == 'timestamp':
+        return str(value) if value else ''
+    # Missing and NaN values sort as zero
+    return value if isinstance(value, (int, float)) and value == value else 0
+
+
+def build_posts(group, existing_post_ids, followers_count):
+    """Turn one influencer's rows of merged data into new post dicts.
+
+    Pure computation with no downloads or shared state, so it can run in a
+    worker process. Returns (posts, batch aggregate, captions text).
+    """
+    posts = []
+    batch = EngagementAggregate()
+    all_captions_text = ""
+    # Posts are moved into their influencer's dictionary when stored
+    tags = TagDictionary()
+    
+    for _, post in group.iterrows():
+        # Safely get post ID or generate a fallback ID
+        if 'id' in post:
+            post_id = post['id']
+        elif 'shortCode' in post:
+            post_id = f"sc_{post['shortCode']}"
+        else:
+            # Generate a unique ID using hash of post content
+            post_id = f"gen_{hash(str(post))}"
+
+        # Skip if we already have this post
+        if post_id in existing_post_ids:
+            logger.debug("Skipping already processed post %s", post_id, extra=sample('post'))
+            continue
+
+        # Process post
+        logger.debug("Processing post: %s", post_id, extra=sample('post'))
+
+        # Get likes and comments
+        likes_count = post.get('likesCount', 0) if not pd.isna(post.get('likesCount')) else 0
+        comments_count = post.get('commentsCount', 0) if not pd.isna(post.get('commentsCount')) else 0
+
+        # Create post object
+        post_obj = Post({
+            'id': post_id,
+            'shortcode': post.get('shortCode', ''),
+            'caption': post.get('caption', ''),
+            'likes_count': likes_count,
+            'comments_count': comments_count,
+            'timestamp': post.get('timestamp', ''),
+            'display_url': post.get('displayUrl', ''),
+            'is_video': post.get('isVideo', False),
+        }, tags)
+
+        # Calculate engagement rate for this post
+        if followers_count and followers_count > 0:
+            engagement = ((likes_count + comments_count) / followers_count) * 100
+            post_obj['engagement_rate'] = engagement
+
+        # Extract caption for analysis
+        caption = post.get('caption', '')
+        if caption and not pd.isna(caption):
+            all_captions_text += caption + "\n\n"  # Add to full captions text
+
+        # Extract hashtags from post data or caption
+        post_hashtags = []
+        if 'hashtags' in post:
+            # Check if it's a numpy array and handle accordingly
+            if isinstance(post['hashtags'], np.ndarray):
+                if not pd.isna(post['hashtags']).all():  # Only process if not all values are NaN
+                    post_hashtags = post['hashtags'].tolist()
+            # If not an array, check if it's not NaN directly
+            elif isinstance(post['hashtags'], list):
+                post_hashtags = post['hashtags']
+            elif isinstance(post['hashtags'], str) and not pd.isna(post['hashtags']):
+                post_hashtags = post['hashtags'].split(',')
+            # If it's scalar, check for NaN
+            elif not pd.isna(post['hashtags']):
+                # Try to convert to string and split
+                try:
+                    post_hashtags = str(post['hashtags']).split(',')
+                except:
+                    pass
+
+        # If no hashtags found in the field, extract from caption
+        if not post_hashtags and caption and not pd.isna(caption):
+            post_hashtags = re.findall(r'#(\w+)', caption)
+
+        # Clean and store hashtags
+        if post_hashtags:
+            post_obj['hashtags'] = post_hashtags
+
+        # Extract mentions from post data or caption
+        post_mentions = []
+        if 'mentions' in post:
+            # Check if it's a numpy array and handle accordingly
+            if isinstance(post['mentions'], np.ndarray):
+                if not pd.isna(post['mentions']).all():  # Only process if not all values are NaN
+                    post_mentions = post['mentions'].tolist()
+            # If not an array, check if it's not NaN directly
+            elif isinstance(post['mentions'], list):
+                post_mentions = post['mentions']
+            elif isinstance(post['mentions'], str) and not pd.isna(post['mentions']):
+                post_mentions = post['mentions'].split(',')
+            # If it's scalar, check for NaN
+            elif not pd.isna(post['mentions']):
+                # Try to convert to string and split
+                try:
+                    post_mentions = str(post['mentions']).split(',')
+                except:
+                    pass
+
+        # If no mentions found in the field, extract from caption
+        if not post_mentions and caption and not pd.isna(caption):
+            post_mentions = re.findall(r'@(\w+)', caption)
+
+        # Clean and store mentions
+        if post_mentions:
+            post_obj['mentions'] = post_mentions
+
+        # Add post to the list and the running totals
+        posts.append(post_obj)
+        batch.add_post(post_obj)
+    
+    return posts, batch, all_captions_text
+
+
+def _shard_context():
+    """Start method for shard workers.
+
+    The web worker runs several threads (the SQLite writer, the log listener,
+    the session purger), so forking it could hand a child a lock that is held
+    forever. Workers come from a single-threaded fork server instead, or are
+    spawned where there is none.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        # Workers fork from a server that has already imported pandas and this module
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _build_posts_shard(shard_path):
+    """Worker entry point: build posts for the influencers in one shard file"""
+    rows, existing_ids, followers = pd.read_pickle(shard_path)
+    return {
+        username: build_posts(group, existing_ids[username], followers[username])
+        for username, group in rows.groupby('username', sort=False)
+    }
+
 
 class DataProcessor:
     def __init__(self, user_id=None, data_dir=DEFAULT_DATA_DIR):
@@ -30,29 +206,34 @@ class DataProcessor:
         self.posts_data = None
         self.merged_data = None
         self.influencers_data = {}
+        # Tag codes of influencers_data's posts; replaced along with it
+        self.tags = TagDictionary()
         self.countries = {}
         self.data_dir = data_dir
         self.user_id = user_id
+        # Changes whenever influencers_data does; keys rendered-page caches and ETags
+        self.data_version = 0
+        # (username, sort, descending) -> (post count, post indices in that order)
+        self._post_orders = {}
         
         # Debug info for deployment
-        print(f"\n== DataProcessor Initialization ==")
-        print(f"APP_ROOT: {APP_ROOT}")
-        print(f"DEFAULT_DATA_DIR: {DEFAULT_DATA_DIR}")
-        print(f"DEFAULT_IMAGES_PATH: {DEFAULT_IMAGES_PATH}")
-        print(f"User ID: {user_id}")
+        logger.debug("== DataProcessor Initialization ==")
+        logger.debug("APP_ROOT: %s", APP_ROOT)
+        logger.debug("DEFAULT_DATA_DIR: %s", DEFAULT_DATA_DIR)
+        logger.debug("DEFAULT_IMAGES_PATH: %s", DEFAULT_IMAGES_PATH)
+        logger.debug("User ID: %s", user_id)
         
         # Create user-specific data directory if a user_id is provided
         if user_id:
             self.user_data_dir = os.path.join(self.data_dir, f'user_{user_id}')
             try:
                 os.makedirs(self.user_data_dir, exist_ok=True)
-                print(f"Created/verified user data directory: {self.user_data_dir}")
+                logger.debug("Created/verified user data directory: %s", self.user_data_dir)
             except Exception as e:
-                print(f"ERROR creating user data directory {self.user_data_dir}: {str(e)}")
-                traceback.print_exc()
+                logger.exception("Error creating user data directory %s: %s", self.user_data_dir, e)
                 # Fall back to default directory
                 self.user_data_dir = self.data_dir
-                print(f"Using fallback directory: {self.user_data_dir}")
+                logger.warning("Using fallback directory: %s", self.user_data_dir)
                 
             self.data_file_path = os.path.join(self.user_data_dir, 'influencers.json')
             
@@ -62,19 +243,23 @@ class DataProcessor:
                 os.makedirs(os.path.join(self.user_images_dir, 'profiles'), exist_ok=True)
                 os.makedirs(os.path.join(self.user_images_dir, 'posts'), exist_ok=True)
                 os.makedirs(os.path.join(self.user_images_dir, 'misc'), exist_ok=True)
-                print(f"Created/verified user image directories under: {self.user_images_dir}")
+                logger.debug("Created/verified user image directories under: %s", self.user_images_dir)
             except Exception as e:
-                print(f"ERROR creating user image directories {self.user_images_dir}: {str(e)}")
-                traceback.print_exc()
+                logger.exception("Error creating user image directories %s: %s", self.user_images_dir, e)
                 # Fall back to default images directory
                 self.user_images_dir = DEFAULT_IMAGES_PATH
-                print(f"Using fallback image directory: {self.user_images_dir}")
+                logger.warning("Using fallback image directory: %s", self.user_images_dir)
         else:
             # Fallback to global data file for backward compatibility
             self.data_file_path = os.path.join(self.data_dir, 'influencers.json')
             self.user_data_dir = self.data_dir
             self.user_images_dir = DEFAULT_IMAGES_PATH
             
+        # Shared content-addressed store that user image paths link into
+        self.image_store = ImageStore(DEFAULT_IMAGES_PATH)
+        # (target dict, field, future) for thumbnails still being generated
+        self._pending_derivatives = []
+            
         # Check directories are writable
         self._check_directory_permissions()
         self._load_persistent_data()
@@ -83,24 +268,24 @@ class DataProcessor:
         """Verify directories have proper read/write permissions"""
         try:
             # Check user data directory
-            print(f"Checking permissions for {self.user_data_dir}")
+            logger.debug("Checking permissions for %s", self.user_data_dir)
             if os.path.exists(self.user_data_dir):
                 if os.access(self.user_data_dir, os.W_OK):
-                    print(f"✓ User data directory is writable: {self.user_data_dir}")
+                    logger.debug("✓ User data directory is writable: %s", self.user_data_dir)
                 else:
-                    print(f"✗ User data directory is NOT writable: {self.user_data_dir}")
+                    logger.warning("✗ User data directory is NOT writable: %s", self.user_data_dir)
             else:
-                print(f"✗ User data directory does not exist: {self.user_data_dir}")
+                logger.warning("✗ User data directory does not exist: %s", self.user_data_dir)
                 
             # Check user images directory
-            print(f"Checking permissions for {self.user_images_dir}")
+            logger.debug("Checking permissions for %s", self.user_images_dir)
             if os.path.exists(self.user_images_dir):
                 if os.access(self.user_images_dir, os.W_OK):
-                    print(f"✓ User images directory is writable: {self.user_images_dir}")
+                    logger.debug("✓ User images directory is writable: %s", self.user_images_dir)
                 else:
-                    print(f"✗ User images directory is NOT writable: {self.user_images_dir}")
+                    logger.warning("✗ User images directory is NOT writable: %s", self.user_images_dir)
             else:
-                print(f"✗ User images directory does not exist: {self.user_images_dir}")
+                logger.warning("✗ User images directory does not exist: %s", self.user_images_dir)
                 
             # Check if we can write a test file
             test_file_path = os.path.join(self.user_data_dir, 'write_test.txt')
@@ -108,13 +293,12 @@ class DataProcessor:
                 with open(test_file_path, 'w') as f:
                     f.write('write test')
                 os.remove(test_file_path)
-                print(f"✓ Successfully wrote and deleted test file in {self.user_data_dir}")
+                logger.debug("✓ Successfully wrote and deleted test file in %s", self.user_data_dir)
             except Exception as e:
-                print(f"✗ Failed to write test file in {self.user_data_dir}: {str(e)}")
+                logger.warning("✗ Failed to write test file in %s: %s", self.user_data_dir, e)
                 
         except Exception as e:
-            print(f"Error checking directory permissions: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error checking directory permissions: %s", e)
     
     def _get_runs_dir(self):
         """Get the directory for storing run history"""
@@ -127,19 +311,28 @@ class DataProcessor:
         if os.path.exists(self.data_file_path):
             try:
                 with open(self.data_file_path, 'r', encoding='utf-8') as f:
-                    self.influencers_data = json.load(f)
+                    self.tags = TagDictionary()
+                    self.influencers_data = influencers_from_dicts(json.load(f), self.tags)
                 # Rebuild countries mapping from loaded data
                 self.countries = {username: data.get('country', '') 
                                   for username, data in self.influencers_data.items()}
-                print(f"Loaded {len(self.influencers_data)} influencers from {self.data_file_path}")
+                logger.info("Loaded %s influencers from %s", len(self.influencers_data), self.data_file_path)
+                # The file's mtime, so workers that loaded the same file agree on the version
+                self._bump_data_version(os.stat(self.data_file_path).st_mtime_ns)
             except (FileNotFoundError, json.JSONDecodeError, Exception) as e:
-                print(f"Error loading persistent data from {self.data_file_path}: {e}")
+                logger.warning("Error loading persistent data from %s: %s", self.data_file_path, e)
                 # If loading fails, start fresh
                 self.influencers_data = {}
                 self.countries = {}
         else:
-            print(f"Persistent data file not found: {self.data_file_path}. Starting fresh.")
+            logger.info("Persistent data file not found: %s. Starting fresh.", self.data_file_path)
     
+    def _bump_data_version(self, version=None):
+        """Mark influencers_data as changed; versions are nanosecond timestamps"""
+        self.data_version = max(version or time.time_ns(), self.data_version + 1)
+        self._post_orders = {}
+
+    @timed('save_persistent_data')
     def _save_persistent_data(self):
         """Save the current influencers_data to the JSON file."""
         try:
@@ -147,15 +340,16 @@ class DataProcessor:
             os.makedirs(os.path.dirname(self.data_file_path), exist_ok=True)
             with open(self.data_file_path, 'w', encoding='utf-8') as f:
                 # Use custom default handler for non-serializable types if needed
-                json.dump(self.influencers_data, f, indent=4, default=self._json_serializer)
-            print(f"Saved {len(self.influencers_data)} influencers to {self.data_file_path}")
+                json.dump(encode_influencers(self.influencers_data), f, indent=4, default=self._json_serializer)
+            logger.info("Saved %s influencers to %s", len(self.influencers_data), self.data_file_path)
+            self._bump_data_version(os.stat(self.data_file_path).st_mtime_ns)
             
             # Also save this as a new run in the history
             self._save_run()
         except Exception as e:
-            print(f"Error saving persistent data to {self.data_file_path}: {e}")
-            traceback.print_exc()
+            logger.exception("Error saving persistent data to %s: %s", self.data_file_path, e)
     
+    @timed('save_run')
     def _save_run(self):
         """Save the current analysis as a history entry"""
         if not self.user_id or not self.influencers_data:
@@ -178,7 +372,7 @@ class DataProcessor:
                 'influencer_count': influencer_count,
                 'influencers': influencer_names,
                 'countries': countries,
-                'snapshot': self.influencers_data  # Store full data for historical reference
+                'snapshot': encode_influencers(self.influencers_data)  # Store full data for historical reference
             }
             
             # Save to a run-specific file
@@ -192,8 +386,7 @@ class DataProcessor:
             self._update_runs_index(run_id, timestamp, influencer_count, influencer_names, countries)
             
         except Exception as e:
-            print(f"Error saving run history: {e}")
-            traceback.print_exc()
+            logger.exception("Error saving run history: %s", e)
     
     def _update_runs_index(self, run_id, timestamp, influencer_count, influencers, countries):
         """Update the index of all runs"""
@@ -206,7 +399,7 @@ class DataProcessor:
                 with open(index_file, 'r', encoding='utf-8') as f:
                     runs_index = json.load(f)
             except Exception as e:
-                print(f"Error loading runs index: {e}")
+                logger.warning("Error loading runs index: %s", e)
                 runs_index = []
         
         # Add the new run to the index
@@ -242,7 +435,7 @@ class DataProcessor:
                 
             return runs_index
         except Exception as e:
-            print(f"Error loading runs history: {e}")
+            logger.error("Error loading runs history: %s", e)
             return []
             
     def load_run(self, run_id):
@@ -259,18 +452,23 @@ class DataProcessor:
                 run_data = json.load(f)
                 
             # Load the snapshot data
-            self.influencers_data = run_data.get('snapshot', {})
+            self.tags = TagDictionary()
+            self.influencers_data = influencers_from_dicts(run_data.get('snapshot', {}), self.tags)
             # Rebuild countries mapping
             self.countries = {username: data.get('country', '') 
                              for username, data in self.influencers_data.items()}
+            self._bump_data_version()
+            self._update_search_index(search_index.rebuild, self.influencers_data)
                              
             return True
         except Exception as e:
-            print(f"Error loading run {run_id}: {e}")
+            logger.error("Error loading run %s: %s", run_id, e)
             return False
 
     def _json_serializer(self, obj):
         """Custom JSON serializer for objects not serializable by default json code"""
+        if isinstance(obj, Record):
+            return obj.to_dict()
         if isinstance(obj, (datetime.date, datetime)):
             return obj.isoformat()
         # Handle numpy types if they appear
@@ -294,9 +492,18 @@ class DataProcessor:
         elif isinstance(obj, (np.void)): # Handle numpy void types
             return None
         # Add more types here if needed
-        print(f"Warning: Cannot serialize type {type(obj)}: {obj}")
+        logger.warning("Cannot serialize type %s: %s", type(obj), obj)
         return str(obj) # Fallback to string representation
 
+    def _update_search_index(self, update, *args):
+        """Apply a search_index update for this user; failures don't stop processing"""
+        if not self.user_id:
+            return
+        try:
+            update(self.user_id, *args)
+        except Exception as e:
+            logger.exception("Error updating search index: %s", e)
+
     def clear_all_data(self, clear_images=False):
         """Clears persisted data and optionally images."""
         # Clear in-memory data
@@ -304,15 +511,17 @@ class DataProcessor:
         self.posts_data = None
         self.merged_data = None
         self.influencers_data = {}
+        self.tags = TagDictionary()
         self.countries = {}
+        self._bump_data_version()
         
         # Delete the JSON data file
         if os.path.exists(self.data_file_path):
             try:
                 os.remove(self.data_file_path)
-                print(f"Deleted persistent data file: {self.data_file_path}")
+                logger.info("Deleted persistent data file: %s", self.data_file_path)
             except OSError as e:
-                print(f"Error deleting data file {self.data_file_path}: {e}")
+                logger.error("Error deleting data file %s: %s", self.data_file_path, e)
 
         # Optionally clear images
         if clear_images and self.user_id:
@@ -328,16 +537,22 @@ class DataProcessor:
                                 if os.path.isfile(file_path) or os.path.islink(file_path):
                                     os.unlink(file_path)
                             except Exception as e:
-                                print(f'Failed to delete {file_path}. Reason: {e}')
-                        print(f"Cleared image files in: {dir_to_clear}")
+                                logger.warning('Failed to delete %s. Reason: %s', file_path, e)
+                        logger.info("Cleared image files in: %s", dir_to_clear)
                     except OSError as e:
-                        print(f"Error clearing images in {dir_to_clear}: {e}")
+                        logger.error("Error clearing images in %s: %s", dir_to_clear, e)
+
+            # The files above are links into the shared store; drop this user's
+            # references so blobs nobody else uses are removed too
+            self.image_store.release_user(self.user_id)
         
-        print("All data cleared.")
+        self._update_search_index(search_index.clear)
+        logger.info("All data cleared.")
 
 
+    @timed('load_profile_data')
     def load_profile_data(self, file_path):
-        """Load the Instagram profile data JSON file"""
+        """Load the Instagram profile data file (JSON array or JSON Lines)"""
         # Only clear working data variables, not the final results
         self.profile_data = None
         self.posts_data = None
@@ -351,41 +566,37 @@ class DataProcessor:
         if not hasattr(self, 'countries') or self.countries is None:
             self.countries = {}
             
-        print("Loading new profile data while preserving existing influencers.")
+        logger.info("Loading new profile data while preserving existing influencers.")
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            self.profile_data = pd.DataFrame(data)
-            print(f"Profile data loaded: {len(self.profile_data)} rows")
+            self.profile_data = pd.DataFrame(load_records(file_path))
+            logger.info("Profile data loaded: %s rows", len(self.profile_data))
             return self.profile_data['username'].tolist()
         except Exception as e:
-            print(f"Error in load_profile_data: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in load_profile_data: %s", e)
             raise Exception(f"Error loading profile data: {str(e)}")
     
+    @timed('load_posts_data')
     def load_posts_data(self, file_path):
-        """Load the Instagram posts data JSON file"""
+        """Load the Instagram posts data file (JSON array or JSON Lines)"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            self.posts_data = pd.DataFrame(data)
-            print(f"Posts data loaded: {len(self.posts_data)} rows")
+            self.posts_data = pd.DataFrame(load_records(file_path))
+            logger.info("Posts data loaded: %s rows", len(self.posts_data))
             return True
         except Exception as e:
-            print(f"Error in load_posts_data: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in load_posts_data: %s", e)
             raise Exception(f"Error loading posts data: {str(e)}")
     
+    @timed('merge_data')
     def merge_data(self):
         """Merge the profile and posts data"""
         if self.profile_data is None or self.posts_data is None:
             raise Exception("Profile and posts data must be loaded first")
         
         try:
-            print("Starting data merge")
-            print(f"Profile data columns: {self.profile_data.columns.tolist()}")
-            print(f"Posts data columns: {self.posts_data.columns.tolist()}")
+            logger.debug("Starting data merge")
+            logger.debug("Profile data columns: %s", self.profile_data.columns.tolist())
+            logger.debug("Posts data columns: %s", self.posts_data.columns.tolist())
             
             self.merged_data = pd.merge(
                 self.profile_data, 
@@ -394,22 +605,21 @@ class DataProcessor:
                 left_on='username', 
                 right_on='ownerUsername'
             )
-            print(f"Merged data: {len(self.merged_data)} rows")
+            logger.info("Merged data: %s rows", len(self.merged_data))
             return True
         except Exception as e:
-            print(f"Error in merge_data: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in merge_data: %s", e)
             raise Exception(f"Error merging data: {str(e)}")
     
     def set_country(self, username, country):
         """Set the country for a specific influencer"""
         self.countries[username] = country
-        print(f"Set country for {username}: {country}")
+        logger.debug("Set country for %s: %s", username, country)
     
     def download_profile_image(self, username, profile_pic_url):
         """Download profile image for a specific influencer using username as filename"""
         if not profile_pic_url or pd.isna(profile_pic_url):
-            print(f"No profile picture URL for {username}")
+            logger.debug("No profile picture URL for %s", username, extra=sample('image'))
             return None
         
         # Use user-specific directory if user_id is set
@@ -431,31 +641,19 @@ class DataProcessor:
         else:
             rel_path = os.path.join('images/profiles', filename)
         
-        # Check if the profile image already exists
-        if os.path.exists(local_path):
-            print(f"Profile image for {username} already exists at {local_path}")
-            return rel_path
-        
-        # Download image if it doesn't exist
+        # The store decides whether the image is fresh, needs revalidating, or
+        # has to be downloaded (or linked from another user's copy)
         try:
-            response = requests.get(profile_pic_url, timeout=10)
-            if response.status_code == 200:
-                with open(local_path, 'wb') as f:
-                    f.write(response.content)
-                print(f"Downloaded profile image for {username} to {local_path}")
-                return rel_path
-            else:
-                print(f"Failed to download profile image for {username}: Status code {response.status_code}")
-                return None
+            return self.image_store.fetch('profile', username, profile_pic_url, local_path, rel_path,
+                                          user_id=self.user_id)
         except Exception as e:
-            print(f"Error downloading profile image for {username}: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error downloading profile image for %s: %s", username, e)
             return None
 
     def download_post_image(self, post_id, display_url):
         """Download post image using post ID as the filename"""
         if not display_url or pd.isna(display_url):
-            print(f"No display URL for post {post_id}")
+            logger.debug("No display URL for post %s", post_id, extra=sample('image'))
             return None
         
         # Use user-specific directory if user_id is set
@@ -479,27 +677,46 @@ class DataProcessor:
         else:
             rel_path = os.path.join('images/posts', filename)
         
-        # Check if the post image already exists
-        if os.path.exists(local_path):
-            print(f"Post image {post_id} already exists at {local_path}")
-            return rel_path
-        
-        # Download image if it doesn't exist
+        # The store decides whether the image is fresh, needs revalidating, or
+        # has to be downloaded (or linked from another user's copy)
         try:
-            response = requests.get(display_url, timeout=10)
-            if response.status_code == 200:
-                with open(local_path, 'wb') as f:
-                    f.write(response.content)
-                print(f"Downloaded post image {post_id} to {local_path}")
-                return rel_path
-            else:
-                print(f"Failed to download post image {post_id}: Status code {response.status_code}")
-                return None
+            return self.image_store.fetch('post', post_id, display_url, local_path, rel_path,
+                                          user_id=self.user_id)
         except Exception as e:
-            print(f"Error downloading post image {post_id}: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error downloading post image %s: %s", post_id, e)
             return None
 
+    def _schedule_derivatives(self, target, field, rel_path, kind=None, key=None):
+        """Generate thumbnails/WebP variants for a downloaded image in the background.
+
+        The result is stored in target[field] by _collect_derivatives. Variants
+        already generated for the image's current content are kept as they are.
+        """
+        if not rel_path:
+            return
+        if kind and target.get(field):
+            sha256 = self.image_store.current_sha256(kind, key)
+            if sha256 and all(f'/{sha256}_' in path for paths in target[field].values() for path, _ in paths):
+                return
+        source_path = os.path.join(APP_ROOT, 'static', rel_path)
+        if not os.path.exists(source_path):
+            return
+        future = submit_derivatives(source_path, DEFAULT_IMAGES_PATH)
+        self._pending_derivatives.append((target, field, future))
+
+    def _collect_derivatives(self):
+        """Wait for scheduled derivatives and attach their paths"""
+        pending, self._pending_derivatives = self._pending_derivatives, []
+        for target, field, future in pending:
+            try:
+                variants = future.result()
+                if variants:
+                    target[field] = variants
+            except Exception as e:
+                logger.error("Error collecting image derivatives: %s", e)
+        if pending:
+            logger.info("Generated image derivatives for %s images", len(pending))
+
     def download_images(self, image_urls, save_dir='app/static/images/misc'):
         """Legacy method for batch downloading images - kept for backward compatibility"""
         os.makedirs(save_dir, exist_ok=True)
@@ -508,7 +725,7 @@ class DataProcessor:
         for i, url in enumerate(image_urls):
             try:
                 if not url or pd.isna(url):
-                    print(f"Skipping empty URL at index {i}")
+                    logger.debug("Skipping empty URL at index %s", i, extra=sample('image'))
                     continue
                     
                 # Create a unique filename based on the URL
@@ -518,7 +735,7 @@ class DataProcessor:
                 
                 # Check if the image already exists
                 if os.path.exists(local_path):
-                    print(f"Image already exists, skipping download: {local_path}")
+                    logger.debug("Image already exists, skipping download: %s", local_path, extra=sample('image'))
                     local_paths.append(rel_path)
                     continue
                     
@@ -530,15 +747,136 @@ class DataProcessor:
                     
                     # Store the relative path for use with url_for in templates
                     local_paths.append(rel_path)
-                    print(f"Downloaded {url} to {local_path}")
+                    logger.debug("Downloaded %s to %s", url, local_path, extra=sample('image'))
                 else:
-                    print(f"Failed to download {url}: Status code {response.status_code}")
+                    logger.warning("Failed to download %s: Status code %s", url, response.status_code)
             except Exception as e:
-                print(f"Error downloading {url}: {str(e)}")
-                traceback.print_exc()
+                logger.exception("Error downloading %s: %s", url, e)
         
         return local_paths
     
+    def _load_aggregates(self, influencer):
+        """Return the influencer's stored aggregate, building it once from its posts"""
+        data = influencer.get('aggregates')
+        if data and 'likes' in data:
+            return EngagementAggregate.from_dict(data)
+        # Saved before aggregates were kept (or in the earlier flat format)
+        aggregates = EngagementAggregate.from_posts(influencer.get('posts', []))
+        influencer['aggregates'] = aggregates.to_dict()
+        return aggregates
+
+    def _apply_aggregates(self, influencer, aggregates):
+        """Store the aggregate and set the influencer's summary metrics from it"""
+        influencer['aggregates'] = aggregates.to_dict()
+        post_count = aggregates.post_count
+        followers_count = influencer.get('followers_count', 0) or 0
+
+        # Total engagement metrics
+        influencer['likes_total'] = int(aggregates.likes.total)
+        influencer['comments_total'] = int(aggregates.comments.total)
+        influencer['total_engagement'] = influencer['likes_total'] + influencer['comments_total']
+
+        # Average engagement metrics
+        influencer['avg_likes'] = aggregates.likes.mean
+        influencer['avg_comments'] = aggregates.comments.mean
+
+        # Engagement rates
+        if followers_count > 0 and post_count > 0:
+            influencer['engagement_rate'] = (influencer['total_engagement'] / (followers_count * post_count)) * 100
+            influencer['avg_engagement_rate'] = aggregates.engagement_rate.mean
+            influencer['max_engagement_rate'] = aggregates.engagement_rate.max or 0
+        else:
+            influencer['engagement_rate'] = 0
+            influencer['avg_engagement_rate'] = 0
+            influencer['max_engagement_rate'] = 0
+
+        # Top hashtags and mentions (most frequent first)
+        influencer['top_hashtags'] = [
+            {'tag': tag, 'count': count} for tag, count in aggregates.hashtags.most_common(10)
+        ]
+        influencer['top_mentions'] = [
+            {'username': username, 'count': count} for username, count in aggregates.mentions.most_common(10)
+        ]
+
+        # Time-based engagement metrics
+        influencer['engagement_weekly'] = aggregates.series('weekly', followers_count)
+        influencer['engagement_monthly'] = aggregates.series('monthly', followers_count)
+        influencer['engagement_quarterly'] = aggregates.series('quarterly', followers_count)
+        influencer['latest_post_timestamp'] = aggregates.latest_timestamp
+
+    def latest_post_dates(self):
+        """Date of each stored influencer's newest post, for incremental refreshes"""
+        latest = {}
+        for username, influencer in (self.influencers_data or {}).items():
+            if influencer.get('posts'):
+                timestamp = self._load_aggregates(influencer).latest_timestamp
+                if timestamp:
+                    latest[username.lower()] = timestamp[:10]
+        return latest
+
+    def posts_page(self, username, sort='timestamp', descending=True, offset=0, limit=12):
+        """(total, posts) for one page of an influencer's posts in the given order"""
+        influencer = self.influencers_data.get(username)
+        posts = (influencer.get('posts') if influencer else None) or []
+        field = POST_SORT_FIELDS[sort]
+
+        # Orders are dropped when the data version moves; processing appends
+        # posts before it does, so check the count too
+        key = (username, sort, descending)
+        cached = self._post_orders.get(key)
+        if cached and cached[0] == len(posts):
+            order = cached[1]
+        else:
+            order = sorted(range(len(posts)), key=lambda index: _post_sort_value(posts[index], field),
+                           reverse=descending)
+            self._post_orders[key] = (len(posts), order)
+        return len(posts), [posts[index] for index in order[offset:offset + limit]]
+
+    def _build_post_groups(self, grouped_data, usernames, influencers):
+        """Run build_posts for each username, sharded across processes for large batches.
+
+        Each shard's rows are written to a temporary pickle file and workers
+        get only its path, so nothing is shared between concurrent jobs and
+        no large payload goes through the pool's pipes. Post dicts come back
+        per shard. Small batches run inline.
+        """
+        existing_ids = {}
+        followers = {}
+        for username in usernames:
+            influencer = influencers[username]
+            existing_ids[username] = {post.get('id') for post in influencer.get('posts', []) if 'id' in post}
+            followers[username] = influencer.get('followers_count')
+
+        workers = int(os.getenv('PROCESSING_WORKERS', os.cpu_count() or 1))
+        threshold = int(os.getenv('PROCESSING_SHARD_THRESHOLD', DEFAULT_SHARD_THRESHOLD))
+        if len(usernames) < threshold or workers < 2:
+            return {
+                username: build_posts(grouped_data.get_group(username), existing_ids[username], followers[username])
+                for username in usernames
+            }
+
+        # Deal influencers out largest first so shards carry similar post counts
+        sizes = grouped_data.size()
+        ordered = sorted(usernames, key=lambda username: sizes[username], reverse=True)
+        shard_count = min(len(ordered), workers * 4)
+        shards = [ordered[i::shard_count] for i in range(shard_count)]
+        logger.info("Processing %s influencers in %s shards across %s processes", len(usernames), shard_count, workers)
+
+        results = {}
+        with tempfile.TemporaryDirectory(prefix='post_shards_') as shard_dir:
+            shard_paths = []
+            for index, shard in enumerate(shards):
+                path = os.path.join(shard_dir, f'shard_{index}.pkl')
+                pd.to_pickle((pd.concat([grouped_data.get_group(username) for username in shard]),
+                              {username: existing_ids[username] for username in shard},
+                              {username: followers[username] for username in shard}), path)
+                shard_paths.append(path)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_shard_context()) as pool:
+                for shard_results in pool.map(_build_posts_shard, shard_paths):
+                    results.update(shard_results)
+        return results
+
+    @timed('process_influencer_data')
     def process_influencer_data(self):
         """Process the merged data to generate the influencers report"""
         if self.merged_data is None and self.profile_data is None:
@@ -550,20 +888,22 @@ class DataProcessor:
             
             # Get unique influencers from profile data
             if self.profile_data is not None:
-                print(f"Processing {len(self.profile_data)} profiles")
+                logger.info("Processing %s profiles", len(self.profile_data))
+                # One query for every profile's image metadata instead of one per image
+                self.image_store.preload('profile', self.profile_data['username'].tolist(), self.user_id)
                 
                 # Process each profile
                 for _, profile in self.profile_data.iterrows():
                     username = profile['username']
                     
                     # For new profiles or to update existing ones
-                    print(f"Processing profile: {username}")
+                    logger.debug("Processing profile: %s", username, extra=sample('profile'))
                     
                     # Initialize influencer data structure if this is a new profile
                     # or preserve existing structure if it's being updated
                     if username not in influencers:
                         # New profile - create new entry
-                        influencers[username] = {
+                        influencers[username] = Influencer({
                             'username': username,
                             'full_name': profile.get('fullName', ''),
                             'biography': profile.get('biography', ''),
@@ -577,7 +917,7 @@ class DataProcessor:
                             'country': self.countries.get(username, 'Unknown'),
                             'processed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                             'posts': []  # Will be populated with post data
-                        }
+                        }, self.tags)
                     else:
                         # Existing profile - update basic info but preserve advanced metrics
                         # and analyses that may have been previously calculated
@@ -604,31 +944,31 @@ class DataProcessor:
                     profile_pic_url = influencers[username]['profile_pic_url']
                     image_path = self.download_profile_image(username, profile_pic_url)
                     influencers[username]['profile_pic_local'] = image_path
+                    self._schedule_derivatives(influencers[username], 'profile_pic_variants', image_path,
+                                               kind='profile', key=username)
             
             # Process posts if we have merged data
             if self.merged_data is not None:
-                print(f"Processing {len(self.merged_data)} posts")
+                logger.info("Processing %s posts", len(self.merged_data))
+                if 'id' in self.merged_data.columns:
+                    self.image_store.preload('post', self.merged_data['id'].dropna().tolist(), self.user_id)
                 
                 # Group data by username
                 grouped_data = self.merged_data.groupby('username')
-                print(f"Found {len(grouped_data)} influencer groups")
+                logger.info("Found %s influencer groups", len(grouped_data))
                 
                 # Process each influencer group
+                jobs = []
                 for username, group in grouped_data:
-                    print(f"Processing posts for: {username}")
+                    logger.debug("Processing posts for: %s", username, extra=sample('profile'))
                     
                     # Skip if this influencer doesn't exist in our dictionary (shouldn't happen typically)
                     if username not in influencers:
-                        print(f"Warning: Found posts for {username} but no profile data")
+                        logger.warning("Found posts for %s but no profile data", username)
                         continue
                     
                     influencer = influencers[username]
                     
-                    # Track existing post IDs to avoid duplicates
-                    existing_post_ids = set()
-                    if 'posts' in influencer:
-                        existing_post_ids = {post.get('id') for post in influencer['posts'] if 'id' in post}
-                    
                     # Get additional influencer data from posts
                     # Add user data if it's missing from profile
                     if 'full_name' not in influencer or not influencer['full_name']:
@@ -638,278 +978,55 @@ class DataProcessor:
                     if 'country' not in influencer or influencer['country'] == 'Unknown':
                         influencer['country'] = self.countries.get(username, 'Unknown')
                     
-                    # Process posts for this influencer
-                    posts_list = []
-                    post_dates = []
-                    engagement_rates = []
-                    likes_counts = []
-                    comments_counts = []
-                    hashtags = []
-                    captions = []
-                    mentions = []
-                    all_captions_text = ""
-                    
-                    # Keep existing posts in the list
-                    if 'posts' in influencer:
-                        posts_list = influencer['posts']
+                    jobs.append(username)
+                
+                # Build the new post dicts for every influencer, in worker
+                # processes when the batch is large enough
+                results = self._build_post_groups(grouped_data, jobs, influencers)
+                new_post_count = sum(len(results[username][0]) for username in jobs)
+                group_sizes = grouped_data.size()
+                inc('posts_processed_total', new_post_count)
+                inc('posts_skipped_total', int(sum(group_sizes[username] for username in jobs)) - new_post_count)
+                
+                for username in jobs:
+                    influencer = influencers[username]
+                    new_posts, batch, all_captions_text = results[username]
                     
-                    # Process each post for this influencer
-                    for _, post in group.iterrows():
-                        # Safely get post ID or generate a fallback ID
-                        if 'id' in post:
-                            post_id = post['id']
-                        elif 'shortCode' in post:
-                            post_id = f"sc_{post['shortCode']}"
-                        else:
-                            # Generate a unique ID using hash of post content
-                            post_id = f"gen_{hash(str(post))}"
-                        
-                        # Skip if we already have this post
-                        if post_id in existing_post_ids:
-                            print(f"Skipping already processed post {post_id}")
-                            continue
-                        
-                        # Process post
-                        print(f"Processing post: {post_id}")
-                        
-                        # Get likes and comments
-                        likes_count = post.get('likesCount', 0) if not pd.isna(post.get('likesCount')) else 0
-                        comments_count = post.get('commentsCount', 0) if not pd.isna(post.get('commentsCount')) else 0
-                        
-                        # Create post object
-                        post_obj = {
-                            'id': post_id,
-                            'shortcode': post.get('shortCode', ''),
-                            'caption': post.get('caption', ''),
-                            'likes_count': likes_count,
-                            'comments_count': comments_count,
-                            'timestamp': post.get('timestamp', ''),
-                            'display_url': post.get('displayUrl', ''),
-                            'is_video': post.get('isVideo', False),
-                        }
-                        
-                        # Download post image if available
-                        if not pd.isna(post.get('displayUrl')):
-                            image_path = self.download_post_image(post_id, post['displayUrl'])
+                    # Download post images here, in the parent, so the shared image
+                    # store and derivative pool are used from one place
+                    for post_obj in new_posts:
+                        display_url = post_obj.get('display_url')
+                        if display_url and not pd.isna(display_url):
+                            image_path = self.download_post_image(post_obj['id'], display_url)
                             # Store the image path with consistent field name
                             post_obj['image_local'] = image_path
-                        
-                        # Add post metrics to running totals
-                        if not pd.isna(post.get('timestamp')):
-                            post_dates.append(post['timestamp'])
-                            
-                        # Add likes and comments to running totals
-                        likes_counts.append(likes_count)
-                        comments_counts.append(comments_count)
-                        
-                        # Calculate engagement rate for this post
-                        if 'followers_count' in influencer and influencer['followers_count'] > 0:
-                            engagement = ((likes_count + comments_count) / influencer['followers_count']) * 100
-                            post_obj['engagement_rate'] = engagement
-                            engagement_rates.append(engagement)
-                            
-                        # Extract caption for analysis
-                        caption = post.get('caption', '')
-                        if caption and not pd.isna(caption):
-                            captions.append(caption)
-                            all_captions_text += caption + "\n\n"  # Add to full captions text
-                        
-                        # Extract hashtags from post data or caption
-                        post_hashtags = []
-                        if 'hashtags' in post:
-                            # Check if it's a numpy array and handle accordingly
-                            if isinstance(post['hashtags'], np.ndarray):
-                                if not pd.isna(post['hashtags']).all():  # Only process if not all values are NaN
-                                    post_hashtags = post['hashtags'].tolist()
-                            # If not an array, check if it's not NaN directly
-                            elif isinstance(post['hashtags'], list):
-                                post_hashtags = post['hashtags']
-                            elif isinstance(post['hashtags'], str) and not pd.isna(post['hashtags']):
-                                post_hashtags = post['hashtags'].split(',')
-                            # If it's scalar, check for NaN
-                            elif not pd.isna(post['hashtags']):
-                                # Try to convert to string and split
-                                try:
-                                    post_hashtags = str(post['hashtags']).split(',')
-                                except:
-                                    pass
-                        
-                        # If no hashtags found in the field, extract from caption
-                        if not post_hashtags and caption and not pd.isna(caption):
-                            import re
-                            post_hashtags = re.findall(r'#(\w+)', caption)
-                        
-                        # Clean and store hashtags
-                        if post_hashtags:
-                            post_obj['hashtags'] = post_hashtags
-                            hashtags.extend(post_hashtags)
-                        
-                        # Extract mentions from post data or caption
-                        post_mentions = []
-                        if 'mentions' in post:
-                            # Check if it's a numpy array and handle accordingly
-                            if isinstance(post['mentions'], np.ndarray):
-                                if not pd.isna(post['mentions']).all():  # Only process if not all values are NaN
-                                    post_mentions = post['mentions'].tolist()
-                            # If not an array, check if it's not NaN directly
-                            elif isinstance(post['mentions'], list):
-                                post_mentions = post['mentions']
-                            elif isinstance(post['mentions'], str) and not pd.isna(post['mentions']):
-                                post_mentions = post['mentions'].split(',')
-                            # If it's scalar, check for NaN
-                            elif not pd.isna(post['mentions']):
-                                # Try to convert to string and split
-                                try:
-                                    post_mentions = str(post['mentions']).split(',')
-                                except:
-                                    pass
-                        
-                        # If no mentions found in the field, extract from caption
-                        if not post_mentions and caption and not pd.isna(caption):
-                            import re
-                            post_mentions = re.findall(r'@(\w+)', caption)
-                        
-                        # Clean and store mentions
-                        if post_mentions:
-                            post_obj['mentions'] = post_mentions
-                            mentions.extend(post_mentions)
-                        
-                        # Add post to the list
-                        posts_list.append(post_obj)
-                    
-                    # Add posts list to influencer
-                    influencer['posts'] = posts_list
-                    
-                    # Calculate and add aggregate metrics
-                    # Total engagement metrics
-                    influencer['likes_total'] = sum(likes_counts) if likes_counts else 0
-                    influencer['comments_total'] = sum(comments_counts) if comments_counts else 0
-                    influencer['total_engagement'] = influencer['likes_total'] + influencer['comments_total']
-                    
-                    # Average engagement metrics
-                    influencer['avg_likes'] = np.mean(likes_counts) if likes_counts else 0
-                    influencer['avg_comments'] = np.mean(comments_counts) if comments_counts else 0
-                    
-                    # Engagement rates
-                    if influencer.get('followers_count', 0) > 0 and len(posts_list) > 0:
-                        # Overall engagement rate
-                        influencer['engagement_rate'] = (influencer['total_engagement'] / (influencer['followers_count'] * len(posts_list))) * 100
-                        
-                        # Average post engagement rate
-                        influencer['avg_engagement_rate'] = np.mean(engagement_rates) if engagement_rates else 0
-                        influencer['max_engagement_rate'] = max(engagement_rates) if engagement_rates else 0
-                    else:
-                        influencer['engagement_rate'] = 0
-                        influencer['avg_engagement_rate'] = 0
-                        influencer['max_engagement_rate'] = 0
-                    
-                    # Top hashtags (most frequent first)
-                    if hashtags:
-                        hashtag_counter = Counter(hashtags)
-                        influencer['top_hashtags'] = [{'tag': tag, 'count': count} for tag, count in hashtag_counter.most_common(10)]
-                    else:
-                        influencer['top_hashtags'] = []
+                            self._schedule_derivatives(post_obj, 'image_variants', image_path)
                     
-                    # Top mentions (most frequent first)
-                    if mentions:
-                        mention_counter = Counter(mentions)
-                        influencer['top_mentions'] = [{'username': username, 'count': count} for username, count in mention_counter.most_common(10)]
-                    else:
-                        influencer['top_mentions'] = []
+                    # Keep existing posts in the list
+                    # New posts were summarized into a batch aggregate that is merged
+                    # into the stored one, so totals cover the full history in O(new posts)
+                    aggregates = self._load_aggregates(influencer)
+                    influencer['posts'] = influencer.get('posts', []) + new_posts
                     
-                    # Store all captions for LLM analysis
-                    influencer['all_captions'] = all_captions_text
+                    # Store all captions for LLM analysis, newest first
+                    previous_captions = influencer.get('all_captions') or ''
+                    influencer['all_captions'] = all_captions_text + previous_captions
                     
-                    # Generate time-based engagement metrics if we have dates
-                    if post_dates and (likes_counts or comments_counts):
-                        try:
-                            # Convert timestamps to datetime objects
-                            date_objs = [pd.to_datetime(date) for date in post_dates if not pd.isna(date)]
-                            
-                            if date_objs:
-                                # Create a DataFrame for time-based analysis
-                                engagement_df = pd.DataFrame({
-                                    'date': date_objs,
-                                    'likes': likes_counts[:len(date_objs)],  # Align with valid dates
-                                    'comments': comments_counts[:len(date_objs)]  # Align with valid dates
-                                })
-                                
-                                # Sort by date
-                                engagement_df = engagement_df.sort_values('date')
-                                
-                                # Add total engagement column
-                                engagement_df['engagement'] = engagement_df['likes'] + engagement_df['comments']
-                                
-                                # Add engagement rate if we have follower count
-                                if influencer.get('followers_count', 0) > 0:
-                                    engagement_df['engagement_rate'] = (engagement_df['engagement'] / influencer['followers_count']) * 100
-                                
-                                # Weekly engagement aggregation
-                                weekly = engagement_df.groupby(pd.Grouper(key='date', freq='W')).agg({
-                                    'likes': 'sum',
-                                    'comments': 'sum',
-                                    'engagement': 'sum'
-                                }).reset_index()
-                                
-                                if not weekly.empty and influencer.get('followers_count', 0) > 0:
-                                    weekly['engagement_rate'] = (weekly['engagement'] / influencer['followers_count']) * 100
-                                
-                                # Monthly engagement aggregation
-                                monthly = engagement_df.groupby(pd.Grouper(key='date', freq='M')).agg({
-                                    'likes': 'sum',
-                                    'comments': 'sum',
-                                    'engagement': 'sum'
-                                }).reset_index()
-                                
-                                if not monthly.empty and influencer.get('followers_count', 0) > 0:
-                                    monthly['engagement_rate'] = (monthly['engagement'] / influencer['followers_count']) * 100
-                                
-                                # Quarterly engagement aggregation
-                                quarterly = engagement_df.groupby(pd.Grouper(key='date', freq='Q')).agg({
-                                    'likes': 'sum',
-                                    'comments': 'sum',
-                                    'engagement': 'sum'
-                                }).reset_index()
-                                
-                                if not quarterly.empty and influencer.get('followers_count', 0) > 0:
-                                    quarterly['engagement_rate'] = (quarterly['engagement'] / influencer['followers_count']) * 100
-                                
-                                # Convert to serializable format
-                                influencer['engagement_weekly'] = [
-                                    {
-                                        'date': row['date'].strftime('%Y-%m-%d'),
-                                        'likes': int(row['likes']),
-                                        'comments': int(row['comments']),
-                                        'engagement': int(row['engagement']),
-                                        'engagement_rate': float(row.get('engagement_rate', 0))
-                                    } for _, row in weekly.iterrows()
-                                ]
-                                
-                                influencer['engagement_monthly'] = [
-                                    {
-                                        'date': row['date'].strftime('%Y-%m'),
-                                        'likes': int(row['likes']),
-                                        'comments': int(row['comments']),
-                                        'engagement': int(row['engagement']),
-                                        'engagement_rate': float(row.get('engagement_rate', 0))
-                                    } for _, row in monthly.iterrows()
-                                ]
-                                
-                                influencer['engagement_quarterly'] = [
-                                    {
-                                        'date': row['date'].strftime('%Y-Q%q'),
-                                        'likes': int(row['likes']),
-                                        'comments': int(row['comments']),
-                                        'engagement': int(row['engagement']),
-                                        'engagement_rate': float(row.get('engagement_rate', 0))
-                                    } for _, row in quarterly.iterrows()
-                                ]
-                        except Exception as e:
-                            print(f"Error generating time-based metrics for {username}: {e}")
-                            traceback.print_exc()
+                    # Aggregate metrics and time series over the full post history
+                    self._apply_aggregates(influencer, aggregates.merge(batch))
+                
+                # Index only the new posts, unless the index has to be built first
+                if self.user_id and not search_index.is_indexed(self.user_id):
+                    self._update_search_index(search_index.rebuild, influencers)
+                else:
+                    self._update_search_index(search_index.add_posts,
+                                              {username: results[username][0] for username in jobs})
             
+            # Thumbnails were generated in the background while we processed
+            self._collect_derivatives()
+
             self.influencers_data = influencers
-            print(f"Processed {len(influencers)} influencers successfully")
+            logger.info("Processed %s influencers successfully", len(influencers))
 
             # Save the processed data
             self._save_persistent_data()
@@ -917,13 +1034,13 @@ class DataProcessor:
             return influencers
         
         except Exception as e:
-            print(f"Error in process_influencer_data: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error in process_influencer_data: %s", e)
             raise Exception(f"Error processing data: {str(e)}")
     
+    @timed('analyze_with_llm')
     def analyze_with_llm(self, openai_api_key):
         """Analyze influencer content using OpenAI LLM"""
-        print("\n========== STARTING LLM ANALYSIS ==========")
+        logger.info("========== STARTING LLM ANALYSIS ==========")
         
         # Try importing OpenAI and setting up client with proper method
         api_available = False
@@ -937,14 +1054,13 @@ class DataProcessor:
             import pkg_resources
             openai_version = pkg_resources.get_distribution("openai").version
             using_new_api = openai_version.startswith('1.')
-            print(f"✓ Successfully configured OpenAI API (version {openai_version})")
+            logger.info("✓ Successfully configured OpenAI API (version %s)", openai_version)
         except Exception as e:
-            print(f"✗ Error importing OpenAI: {str(e)}")
-            traceback.print_exc()
+            logger.exception("✗ Error importing OpenAI: %s", e)
             api_available = False
         
         for username, influencer in self.influencers_data.items():
-            print(f"\n----- Analyzing content for {username} -----")
+            logger.debug("----- Analyzing content for %s -----", username)
             
             # Get all relevant content for analysis
             biography = influencer.get('biography', '')
@@ -983,7 +1099,7 @@ class DataProcessor:
             
             # Skip if we have no meaningful content to analyze
             if not biography and not captions_text and not hashtags:
-                print(f"✗ No content found for {username}, skipping LLM analysis")
+                logger.info("✗ No content found for %s, skipping LLM analysis", username)
                 # Initialize with empty values
                 influencer['main_interests'] = []
                 influencer['related_interests'] = []
@@ -997,7 +1113,7 @@ class DataProcessor:
             
             if api_available:
                 try:
-                    print(f"→ Constructing prompt for {username}")
+                    logger.debug("→ Constructing prompt for %s", username)
                     
                     # Prepare the prompt with all available information
                     prompt = f"""
@@ -1039,10 +1155,10 @@ class DataProcessor:
                     ```
                     """
                     
-                    print(f"→ Sending request to OpenAI for {username}")
-                    print(f"  Input content summary: Biography ({len(biography)} chars), " +
-                          f"Hashtags ({len(hashtags)}), Mentions ({len(mentions)}), " +
-                          f"Captions ({len(captions_text)} chars)")
+                    logger.debug("→ Sending request to OpenAI for %s", username)
+                    logger.debug("  Input content summary: Biography (%s chars), Hashtags (%s), "
+                                 "Mentions (%s), Captions (%s chars)",
+                                 len(biography), len(hashtags), len(mentions), len(captions_text))
                     
                     # Use the appropriate API call format based on OpenAI version
                     if using_new_api:
@@ -1075,9 +1191,9 @@ class DataProcessor:
                         response_content = response['choices'][0]['message']['content'] if response['choices'] else "No content"
                     
                     truncated_content = response_content[:1000] + "..." if len(response_content) > 1000 else response_content
-                    print(f"← Received response from OpenAI for {username}")
-                    print(f"  Response length: {len(response_content)} characters")
-                    print(f"  Response preview: {truncated_content[:200]}...")
+                    logger.debug("← Received response from OpenAI for %s", username)
+                    logger.debug("  Response length: %s characters", len(response_content))
+                    logger.debug("  Response preview: %s...", truncated_content[:200])
                     
                     # Check if the response contains the expected content
                     if (using_new_api and 'choices' in response and response.choices) or \
@@ -1095,7 +1211,8 @@ class DataProcessor:
                         
                         try:
                             result = json.loads(json_content)
-                            print(f"✓ Successfully parsed JSON response for {username}")
+                            logger.debug("✓ Successfully parsed JSON response for %s", username)
+                            inc('llm_calls_total', result='ok')
                             
                             # Apply the result to the influencer data
                             influencer['main_interests'] = result.get('main_interests', [])
@@ -1113,29 +1230,36 @@ class DataProcessor:
                                 }
                             
                             # Log the analysis results
-                            print(f"  Main interests: {influencer['main_interests']}")
-                            print(f"  Related interests: {influencer['related_interests']}")
-                            print(f"  Key topics: {influencer['key_topics']}")
-                            print(f"  Affiliated brands: {influencer['affiliated_brands']}")
-                            print(f"  Content sentiment: {influencer['content_sentiment']['overall']}")
+                            logger.debug("  Main interests: %s", influencer['main_interests'])
+                            logger.debug("  Related interests: %s", influencer['related_interests'])
+                            logger.debug("  Key topics: %s", influencer['key_topics'])
+                            logger.debug("  Affiliated brands: %s", influencer['affiliated_brands'])
+                            logger.debug("  Content sentiment: %s", influencer['content_sentiment']['overall'])
                             
                         except json.JSONDecodeError as e:
-                            print(f"✗ Failed to parse JSON for {username}: {str(e)}")
-                            print(f"  Raw content: {json_content}")
+                            logger.warning("✗ Failed to parse JSON for %s: %s", username, e)
+                            logger.debug("  Raw content: %s", json_content)
+                            inc('llm_calls_total', result='invalid_response')
                             self._set_mock_analysis(influencer, captions_text, hashtags, mentions)
                     else:
-                        print(f"✗ Unexpected response format for {username}")
+                        logger.warning("✗ Unexpected response format for %s", username)
+                        inc('llm_calls_total', result='invalid_response')
                         self._set_mock_analysis(influencer, captions_text, hashtags, mentions)
                 
                 except Exception as e:
-                    print(f"✗ Error analyzing content for {username} with OpenAI: {str(e)}")
-                    traceback.print_exc()
+                    logger.exception("✗ Error analyzing content for %s with OpenAI: %s", username, e)
+                    inc('llm_calls_total', result='error')
                     self._set_mock_analysis(influencer, captions_text, hashtags, mentions)
             else:
-                print(f"→ Using simple analysis for {username} (OpenAI API not available)")
+                logger.debug("→ Using simple analysis for %s (OpenAI API not available)", username)
+                inc('llm_calls_total', result='fallback')
                 self._set_mock_analysis(influencer, captions_text, hashtags, mentions)
         
-        print("\n========== LLM ANALYSIS COMPLETE ==========\n")
+        # Brands and interests changed; refresh their search terms
+        self._update_search_index(search_index.replace_profiles, self.influencers_data)
+        self._bump_data_version()
+        
+        logger.info("========== LLM ANALYSIS COMPLETE ==========")
         return self.influencers_data
     
     def _set_mock_analysis(self, influencer, text, hashtags=None, mentions=None):
@@ -1281,19 +1405,27 @@ class DataProcessor:
             
             return f"data:image/png;base64,{image_base64}"
         except Exception as e:
-            print(f"Error generating word cloud: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error generating word cloud: %s", e)
             return None 
 
+    @timed('save_to_history_db')
     def save_to_history_db(self, time_filter=None, max_posts=None):
         """Save the analysis results to the database for history tracking"""
-        from app.models.history import History, AnalysisImage
-        from app import db  # Import db from app instead of run.py
+        from app.db_tuning import run_write
 
         if not self.user_id or not self.influencers_data:
-            print("Cannot save to history: missing user_id or influencers_data")
+            logger.warning("Cannot save to history: missing user_id or influencers_data")
             return None
 
+        # Route the write through the process-wide writer so concurrent jobs
+        # don't contend for the SQLite write lock
+        return run_write(self._write_history_records, time_filter=time_filter, max_posts=max_posts)
+
+    def _write_history_records(self, time_filter=None, max_posts=None):
+        """Insert history and image rows for every analyzed influencer"""
+        from app.models.history import History, AnalysisImage
+        from app import db  # Import db from app instead of run.py
+
         # Create a history record for each influencer analyzed
         history_records = []
         
@@ -1305,9 +1437,9 @@ class DataProcessor:
                     profile_username=username,
                     profile_name=data.get('full_name', ''),
                     profile_url=f"https://instagram.com/{username}/",
-                    profile_follower_count=data.get('follower_count', 0),
-                    profile_post_count=data.get('post_count', 0),
-                    analysis_results=data,
+                    profile_follower_count=data.get('followers_count', 0),
+                    profile_post_count=data.get('posts_count', 0),
+                    analysis_results=data.to_dict(),
                     max_posts=max_posts,
                     time_filter=time_filter,
                     analysis_complete=True
@@ -1358,19 +1490,17 @@ class DataProcessor:
                 history_records.append(history)
                 
             except Exception as e:
-                print(f"Error saving {username} to history: {str(e)}")
-                traceback.print_exc()  # This will help with debugging
+                logger.exception("Error saving %s to history: %s", username, e)
                 continue
         
         # Commit all records
         try:
             db.session.commit()
-            print(f"Saved {len(history_records)} influencers to history database")
+            logger.info("Saved %s influencers to history database", len(history_records))
             return history_records
         except Exception as e:
             db.session.rollback()
-            print(f"Error committing history records: {str(e)}")
-            traceback.print_exc()  # Add stack trace for better debugging
+            logger.exception("Error committing history records: %s", e)
             return None
     
     def load_analysis_from_history(self, history_id):
@@ -1378,27 +1508,30 @@ class DataProcessor:
         from app.models.history import History
         
         if not self.user_id:
-            print("Cannot load from history: missing user_id")
+            logger.warning("Cannot load from history: missing user_id")
             return False
             
         # Find the history record
         history = History.query.filter_by(id=history_id, user_id=self.user_id).first()
         if not history:
-            print(f"History record {history_id} not found for user {self.user_id}")
+            logger.warning("History record %s not found for user %s", history_id, self.user_id)
             return False
             
         try:
             # Load the analysis data
             username = history.profile_username
-            self.influencers_data = {username: history.analysis_results}
+            self.tags = TagDictionary()
+            self.influencers_data = {username: Influencer.from_dict(history.analysis_results, self.tags)}
+            self._bump_data_version()
+            self._update_search_index(search_index.rebuild, self.influencers_data)
             
             # Set country if available
             if history.analysis_results.get('country'):
                 self.countries[username] = history.analysis_results['country']
                 
-            print(f"Loaded analysis for {username} from history record {history_id}")
+            logger.info("Loaded analysis for %s from history record %s", username, history_id)
             return True
             
         except Exception as e:
-            print(f"Error loading analysis from history: {str(e)}")
+            logger.error("Error loading analysis from history: %s", e)
             return False 
\ No newline at end of file
@@ -1,11 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+import logging
 import os
 from datetime import datetime
 from app.models.models import Influencer, Analysis, UserSettings
 from app.models.indexes import *  # Import all indexes
 
+logger = logging.getLogger(__name__)
+
 db = SQLAlchemy()
 
 class User(UserMixin, db.Model):
@@ -32,7 +35,7 @@ class User(UserMixin, db.Model):
         try:
             return User.query.filter_by(username=username, is_deleted=False).first()
         except Exception as e:
-            print(f"Error getting user by username: {str(e)}")
+            logger.error("Error getting user by username: %s", e)
             return None
 
     @staticmethod
@@ -40,7 +43,7 @@ class User(UserMixin, db.Model):
         try:
             return User.query.filter_by(email=email, is_deleted=False).first()
         except Exception as e:
-            print(f"Error getting user by email: {str(e)}")
+            logger.error("Error getting user by email: %s", e)
             return None
 
     @staticmethod
@@ -62,7 +65,7 @@ class User(UserMixin, db.Model):
             return user
         except Exception as e:
             db.session.rollback()
-            print(f"Error creating user: {str(e)}")
+            logger.error("Error creating user: %s", e)
             raise
 
     @staticmethod
@@ -75,7 +78,7 @@ class User(UserMixin, db.Model):
                 return user
             return None
         except Exception as e:
-            print(f"Error authenticating user: {str(e)}")
+            logger.error("Error authenticating user: %s", e)
             return None
 
 def init_db(app):
@@ -91,5 +94,5 @@ def init_db(app):
                     password='password123'
                 )
     except Exception as e:
-        print(f"Error initializing database: {str(e)}")
+        logger.error("Error initializing database: %s", e)
         raise 
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+Offline stand-in for ``apify_client.ApifyClient``.
+
+Implements the small part of the client ApifyWrapper uses
+(``actor(id).call(run_input=...)`` and ``dataset(id).iterate_items()``) and
+answers with deterministic synthetic profiles and posts generated from the
+requested usernames. Enable it with ``APIFY_FAKE=true`` to run the URL
+analysis flow without an Apify account, or pass one to
+``ApifyWrapper(client=...)`` directly.
+"""
+
+import hashlib
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.models.apify_client_wrapper import (
+    POST_ACTOR_ID, PROFILE_ACTOR_ID, parse_newer_than, username_from_url
+)
+
+HASHTAGS = ['travel', 'food', 'fashion', 'fitness', 'beauty', 'style', 'photography',
+            'nature', 'art', 'music', 'tech', 'coffee', 'yoga', 'skincare', 'sunset']
+BRANDS = ['nike', 'adidas', 'sephora', 'zara', 'apple', 'starbucks', 'glossier', 'lululemon']
+CATEGORIES = ['Blogger', 'Creator', 'Public figure', 'Photographer', 'Health/beauty']
+
+
+def fake_profile(username):
+    """Synthetic profile-scraper item for a username"""
+    rng = random.Random(f'profile:{username}')
+    return {
+        'username': username,
+        'fullName': username.replace('_', ' ').replace('.', ' ').title(),
+        'biography': f"{rng.choice(CATEGORIES)} | {' '.join('#' + t for t in rng.sample(HASHTAGS, 3))}",
+        'externalUrl': f'https://example.com/{username}',
+        'followersCount': rng.randint(1000, 2000000),
+        'followsCount': rng.randint(50, 3000),
+        'postsCount': rng.randint(50, 3000),
+        'isVerified': rng.random() < 0.2,
+        'profilePicUrl': None,
+        'categoryName': rng.choice(CATEGORIES),
+    }
+
+
+def fake_posts(username, limit, newer_than=None, now=None):
+    """Synthetic post-scraper items for a username, newest first"""
+    rng = random.Random(f'posts:{username}')
+    now = now or datetime.utcnow()
+    followers = fake_profile(username)['followersCount']
+    posts = []
+    for index in range(limit):
+        timestamp = now - timedelta(days=index * rng.uniform(0.5, 3.0), hours=rng.randint(0, 23))
+        if newer_than is not None and timestamp < newer_than:
+            break
+        hashtags = rng.sample(HASHTAGS, rng.randint(1, 5))
+        mentions = rng.sample(BRANDS, rng.randint(0, 2))
+        likes = int(followers * rng.uniform(0.005, 0.08))
+        posts.append({
+            'id': str(int(hashlib.sha1(f'{username}:{index}'.encode()).hexdigest()[:15], 16)),
+            'shortCode': f'{username[:4]}{index:05d}',
+            'ownerUsername': username,
+            'ownerFullName': username.replace('_', ' ').title(),
+            'caption': f"Post {index} by {username} " + ' '.join('#' + t for t in hashtags)
+                       + ''.join(f' @{m}' for m in mentions),
+            'hashtags': hashtags,
+            'mentions': mentions,
+            'likesCount': likes,
+            'commentsCount': int(likes * rng.uniform(0.01, 0.05)),
+            'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'displayUrl': None,
+            'isVideo': rng.random() < 0.15,
+            'type': 'Image',
+        })
+    return posts
+
+
+class _FakeActor:
+    def __init__(self, client, actor_id):
+        self.client = client
+        self.actor_id = actor_id
+
+    def call(self, run_input=None):
+        run_input = run_input or {}
+        if self.client.delay:
+            time.sleep(self.client.delay)
+
+        if self.actor_id == PROFILE_ACTOR_ID:
+            items = [fake_profile(username) for username in run_input.get('usernames', [])]
+        elif self.actor_id == POST_ACTOR_ID:
+            newer_than = parse_newer_than(run_input.get('onlyPostsNewerThan'))
+            limit = int(run_input.get('resultsLimit', 50))
+            items = []
+            for url in run_input.get('directUrls', []):
+                items.extend(fake_posts(username_from_url(url), limit, newer_than))
+        else:
+            raise ValueError(f'Unknown actor {self.actor_id}')
+
+        dataset_id = uuid.uuid4().hex
+        with self.client._lock:
+            self.client.runs.append({'actor_id': self.actor_id, 'run_input': run_input})
+            self.client._datasets[dataset_id] = items
+        return {'id': uuid.uuid4().hex, 'defaultDatasetId': dataset_id, 'status': 'SUCCEEDED'}
+
+
+class _FakeDataset:
+    def __init__(self, items):
+        self.items = items
+
+    def iterate_items(self):
+        yield from self.items
+
+
+class FakeApifyClient:
+    """Answers actor runs with synthetic data; ``delay`` simulates run time (seconds)"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.runs = []
+        self._datasets = {}
+        self._lock = threading.Lock()
+
+    def actor(self, actor_id):
+        return _FakeActor(self, actor_id)
+
+    def dataset(self, dataset_id):
+        with self._lock:
+            items = self._datasets.pop(dataset_id, [])
+        return _FakeDataset(items)
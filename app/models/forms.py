@@ -26,6 +26,11 @@ class URLForm(FlaskForm):
                                   ('6m', 'Last 6 Months'),
                                   ('1y', 'Last Year')
                               ], default='all')
+    refresh_mode = SelectField('Refresh Mode',
+                               choices=[
+                                   ('full', 'Full re-scrape'),
+                                   ('new_only', 'New posts only')
+                               ], default='full')
     submit = SubmitField('Analyze')
     
     def validate_instagram_urls(self, field):
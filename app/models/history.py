@@ -1,9 +1,23 @@
 from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
 from app.database import db  # Import db from centralized location
 from sqlalchemy.dialects.sqlite import JSON # Or postgresql.JSON if using PostgreSQL
 
+# Columns needed to render the history listing - everything except the large
+# analysis_results JSON blob
+HISTORY_SUMMARY_COLUMNS = (
+    'id', 'timestamp', 'user_id', 'profile_username', 'profile_name',
+    'profile_follower_count', 'profile_post_count', 'max_posts', 'time_filter'
+)
+
 class History(db.Model):
     __tablename__ = 'history'
+    __table_args__ = (
+        # Keyset pagination walks (user_id, timestamp) newest first
+        db.Index('idx_history_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('idx_history_user_id_username_timestamp', 'user_id', 'profile_username', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # Foreign key to User model
@@ -37,6 +51,75 @@ class History(db.Model):
             'timestamp': self.timestamp
         }
 
+    @staticmethod
+    def get_page_for_user(user_id, limit=50, before=None, username=None):
+        """Return one page of history summaries for a user, newest first.
+
+        Uses keyset pagination on (timestamp, id) so the cost of a page does not
+        grow with how far back the user pages. ``before`` is the cursor returned
+        for the previous page as a ``(timestamp, id)`` tuple.
+
+        Returns a ``(records, next_cursor)`` tuple where ``next_cursor`` is None
+        when there are no older records.
+        """
+        query = History.query.options(
+            load_only(*HISTORY_SUMMARY_COLUMNS)
+        ).filter(History.user_id == user_id)
+
+        if username:
+            query = query.filter(History.profile_username == username)
+
+        if before is not None:
+            before_timestamp, before_id = before
+            query = query.filter(or_(
+                History.timestamp < before_timestamp,
+                and_(History.timestamp == before_timestamp, History.id < before_id)
+            ))
+
+        # Fetch one extra row to find out whether an older page exists
+        rows = query.order_by(History.timestamp.desc(), History.id.desc()).limit(limit + 1).all()
+
+        records = rows[:limit]
+
+        next_cursor = None
+        if len(rows) > limit and records:
+            next_cursor = (records[-1].timestamp, records[-1].id)
+
+        return records, next_cursor
+
+    @staticmethod
+    def encode_cursor(cursor):
+        """Serialize a pagination cursor for use in a query string"""
+        if not cursor:
+            return None
+        timestamp, record_id = cursor
+        return f"{timestamp.isoformat()}_{record_id}"
+
+    @staticmethod
+    def decode_cursor(value):
+        """Parse a cursor produced by encode_cursor, returning None if invalid"""
+        if not value:
+            return None
+        try:
+            timestamp, record_id = value.rsplit('_', 1)
+            return datetime.fromisoformat(timestamp), int(record_id)
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def get_profile_images(history_ids):
+        """Map history IDs to their profile image path with a single query"""
+        if not history_ids:
+            return {}
+        rows = db.session.query(AnalysisImage.history_id, AnalysisImage.image_path).filter(
+            AnalysisImage.history_id.in_(history_ids),
+            AnalysisImage.image_type == 'profile'
+        ).all()
+        images = {}
+        for history_id, image_path in rows:
+            images.setdefault(history_id, image_path)
+        return images
+
 class AnalysisImage(db.Model):
     __tablename__ = 'analysis_image'
     id = db.Column(db.Integer, primary_key=True)
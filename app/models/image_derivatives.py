@@ -0,0 +1,108 @@
+"""
+Thumbnail and WebP derivative generation for stored images.
+
+Every downloaded image gets resized JPEG and WebP variants at a few widths so
+templates can serve a ``srcset`` instead of the full-size Instagram original.
+Derivatives are keyed by the content hash of the source and live next to the
+blobs in the shared image store, so they are generated once no matter how
+many users reference the image.
+
+Generation runs in a small thread pool: Pillow releases the GIL while
+decoding, resizing and encoding, so downloads keep going in parallel.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from app.models.image_store import STORE_DIRNAME
+
+logger = logging.getLogger(__name__)
+
+# Widths cover the 50/100px profile avatars (at 1x and 2x) and ~300px post cards
+DERIVATIVE_WIDTHS = (100, 200, 320, 640)
+DERIVATIVE_FORMATS = (
+    # (key, Pillow format, extension, save options)
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+_executor = None
+
+
+def get_executor():
+    """Shared worker pool for derivative generation"""
+    global _executor
+    if _executor is None:
+        workers = int(os.getenv('IMAGE_DERIVATIVE_WORKERS', min(4, os.cpu_count() or 1)))
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-derivatives')
+    return _executor
+
+
+def _sha256_of(source_path):
+    """Hash of the source image; blobs in the store are already named by it"""
+    real_path = os.path.realpath(source_path)
+    name, _ = os.path.splitext(os.path.basename(real_path))
+    if len(name) == 64 and os.path.basename(os.path.dirname(os.path.dirname(real_path))) == STORE_DIRNAME:
+        return name
+    with open(real_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _save_atomic(image, path, pil_format, options):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        image.save(tmp_path, pil_format, **options)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def generate_derivatives(source_path, images_root, widths=DERIVATIVE_WIDTHS):
+    """Create resized variants of an image and return their static paths.
+
+    Returns ``{'webp': [[rel_path, width], ...], 'jpeg': [...]}`` with widths in
+    ascending order, or None if the source can't be read. Widths larger than
+    the original are skipped; existing variants are reused.
+    """
+    try:
+        sha256 = _sha256_of(source_path)
+        out_dir = os.path.join(images_root, STORE_DIRNAME, sha256[:2])
+        rel_dir = f'images/{STORE_DIRNAME}/{sha256[:2]}'
+        os.makedirs(out_dir, exist_ok=True)
+
+        variants = {key: [] for key, _, _, _ in DERIVATIVE_FORMATS}
+        with Image.open(source_path) as original:
+            original_width, original_height = original.size
+            target_widths = [w for w in sorted(widths) if w < original_width] or [original_width]
+
+            image = None
+            for width in target_widths:
+                for key, pil_format, extension, options in DERIVATIVE_FORMATS:
+                    filename = f'{sha256}_{width}.{extension}'
+                    out_path = os.path.join(out_dir, filename)
+                    if not os.path.exists(out_path):
+                        if image is None:
+                            # Decode only once, and only when something is missing
+                            image = original.convert('RGB')
+                        height = max(1, round(original_height * width / original_width))
+                        resized = image.resize((width, height), Image.LANCZOS) if width != original_width else image
+                        _save_atomic(resized, out_path, pil_format, options)
+                    variants[key].append([f'{rel_dir}/{filename}', width])
+        return variants
+    except Exception as e:
+        logger.exception("Error generating derivatives for %s: %s", source_path, e)
+        return None
+
+
+def submit_derivatives(source_path, images_root, widths=DERIVATIVE_WIDTHS):
+    """Queue derivative generation on the worker pool and return the Future"""
+    return get_executor().submit(generate_derivatives, source_path, images_root, widths)
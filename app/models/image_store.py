@@ -0,0 +1,409 @@
+"""
+Content-addressed image store shared by all users.
+
+Image bytes are stored once under ``static/images/store/<aa>/<sha256>.jpg``.
+Each user's ``static/images/user_<id>/profiles|posts/<name>.jpg`` path is a
+symlink into the store, and an ``ImageReference`` row records which user holds
+which image. When a second user analyzes the same influencer, the existing
+blob is found by (kind, key) and linked without downloading it again.
+Clearing a user's data drops their references; blobs are only deleted once
+nobody references them.
+
+``ImageSource`` remembers where each (kind, key) image came from: URL, hash,
+size, ETag, Last-Modified and when it was last fetched and validated. Within
+the freshness window a re-run trusts the index and touches neither the network
+nor the filesystem. After it, the image is revalidated with a conditional GET
+and a single stat of the blob; a 304 only bumps ``checked_at``, and a missing
+or truncated blob is downloaded again.
+"""
+
+import glob
+import hashlib
+import os
+import shutil
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+import requests
+
+from app.database import db
+from app.logging_setup import sample
+from app.metrics import inc
+
+logger = logging.getLogger(__name__)
+
+STORE_DIRNAME = 'store'
+
+# How long a validated image is trusted before it is revalidated (hours).
+# Profile pictures change; post images practically never do.
+DEFAULT_MAX_AGE_HOURS = {
+    'profile': 24,
+    'post': 24 * 7,
+}
+
+
+class StoredImage(db.Model):
+    """One unique image blob, keyed by the sha256 of its bytes"""
+    __tablename__ = 'stored_image'
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StoredImage {self.sha256[:12]} ({self.size} bytes)>'
+
+
+class ImageReference(db.Model):
+    """A user's reference to a stored image"""
+    __tablename__ = 'image_reference'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'key', name='uq_image_reference_user_kind_key'),
+        # Cross-user lookup: "has anyone already stored this post/profile?"
+        db.Index('idx_image_reference_kind_key', 'kind', 'key'),
+        db.Index('idx_image_reference_sha256', 'sha256'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'profile' or 'post'
+    key = db.Column(db.String(255), nullable=False)  # username or post ID
+    sha256 = db.Column(db.String(64), db.ForeignKey('stored_image.sha256'), nullable=False)
+    path = db.Column(db.String(512), nullable=False)  # Relative static path of the user's link
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImageReference {self.kind}:{self.key} for user {self.user_id}>'
+
+
+class ImageSource(db.Model):
+    """Freshness metadata for the image behind a (kind, key)"""
+    __tablename__ = 'image_source'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'key', name='uq_image_source_kind_key'),
+        db.Index('idx_image_source_sha256', 'sha256'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    url = db.Column(db.Text, nullable=False)  # Last URL the image was fetched from
+    sha256 = db.Column(db.String(64), db.ForeignKey('stored_image.sha256'), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    etag = db.Column(db.String(255), nullable=True)
+    last_modified = db.Column(db.String(64), nullable=True)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)  # Last 200 response
+    checked_at = db.Column(db.DateTime, default=datetime.utcnow)  # Last 200 or 304
+
+    def __repr__(self):
+        return f'<ImageSource {self.kind}:{self.key} -> {self.sha256[:12]}>'
+
+
+def get_max_age(kind):
+    """Freshness window for a kind of image, from IMAGE_<KIND>_MAX_AGE_HOURS"""
+    hours = os.getenv(f'IMAGE_{kind.upper()}_MAX_AGE_HOURS')
+    if hours is None:
+        hours = DEFAULT_MAX_AGE_HOURS.get(kind, 24)
+    return timedelta(hours=float(hours))
+
+
+def _source_snapshot(source):
+    """Plain copy of an ImageSource row, safe to use across sessions and threads"""
+    return {
+        'url': source.url,
+        'sha256': source.sha256,
+        'size': source.size,
+        'etag': source.etag,
+        'last_modified': source.last_modified,
+        'fetched_at': source.fetched_at,
+        'checked_at': source.checked_at,
+    }
+
+
+def _has_db():
+    """The reference index needs an app context; without one the store still
+    deduplicates bytes on disk but can't look up other users' images"""
+    from flask import has_app_context
+    return has_app_context()
+
+
+class ImageStore:
+    """Stores image bytes by content hash and links them into user directories"""
+
+    def __init__(self, images_root):
+        self.images_root = images_root
+        self.store_root = os.path.join(images_root, STORE_DIRNAME)
+        # Metadata loaded by preload() and kept current by fetch()
+        self._sources = {}
+        self._references = {}
+
+    def blob_path(self, sha256):
+        """Absolute path of the blob for a hash"""
+        return os.path.join(self.store_root, sha256[:2], f'{sha256}.jpg')
+
+    def put_bytes(self, data):
+        """Write bytes to the store if not already present and return their hash.
+
+        A blob with the wrong size (a damaged earlier write) is replaced.
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(sha256)
+        if not self.blob_intact(sha256, len(data)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial blob
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                # mkstemp creates 0600 files; the web server must be able to read them
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return sha256
+
+    def blob_intact(self, sha256, size):
+        """Cheap integrity check: the blob exists and has the recorded size"""
+        try:
+            return os.stat(self.blob_path(sha256)).st_size == size
+        except OSError:
+            return False
+
+    def preload(self, kind, keys, user_id=None):
+        """Load source metadata and the user's references for many keys at once.
+
+        fetch() then answers from memory instead of querying per image.
+        """
+        if not _has_db():
+            return
+        keys = list({str(key) for key in keys})
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            for key in chunk:
+                self._sources[(kind, key)] = None
+                self._references[(user_id, kind, key)] = None
+            for source in ImageSource.query.filter(ImageSource.kind == kind, ImageSource.key.in_(chunk)):
+                self._sources[(kind, source.key)] = _source_snapshot(source)
+            references = ImageReference.query.filter(
+                ImageReference.user_id == user_id,
+                ImageReference.kind == kind,
+                ImageReference.key.in_(chunk),
+            )
+            for reference in references:
+                self._references[(user_id, kind, reference.key)] = (reference.sha256, reference.path)
+
+    def current_sha256(self, kind, key):
+        """Hash of the image currently recorded for (kind, key), if known"""
+        source = self._get_source(kind, str(key))
+        return source['sha256'] if source else None
+
+    def _get_source(self, kind, key):
+        if (kind, key) in self._sources:
+            return self._sources[(kind, key)]
+        if not _has_db():
+            return None
+        source = ImageSource.query.filter_by(kind=kind, key=key).first()
+        return _source_snapshot(source) if source else None
+
+    def _get_reference(self, user_id, kind, key):
+        if (user_id, kind, key) in self._references:
+            return self._references[(user_id, kind, key)]
+        if not _has_db():
+            return None
+        reference = ImageReference.query.filter_by(user_id=user_id, kind=kind, key=key).first()
+        return (reference.sha256, reference.path) if reference else None
+
+    def _link(self, sha256, local_path):
+        """Point local_path at the blob, replacing whatever was there"""
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        target = os.path.relpath(self.blob_path(sha256), os.path.dirname(local_path))
+        tmp_path = f'{local_path}.{os.getpid()}.tmp'
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.symlink(target, tmp_path)
+        except (OSError, NotImplementedError):
+            # Filesystems without symlink support get a hard link or a copy
+            try:
+                os.link(self.blob_path(sha256), tmp_path)
+            except OSError:
+                shutil.copy2(self.blob_path(sha256), tmp_path)
+        os.replace(tmp_path, local_path)
+
+    def _save(self, user_id, kind, key, rel_path, source):
+        """Record the blob, its source metadata and the user's reference to it"""
+        if not _has_db():
+            return
+
+        from app.db_tuning import run_write
+
+        def write():
+            sha256 = source['sha256']
+            if db.session.get(StoredImage, sha256) is None:
+                db.session.add(StoredImage(sha256=sha256, size=source['size']))
+
+            row = ImageSource.query.filter_by(kind=kind, key=key).first()
+            if row is None:
+                row = ImageSource(kind=kind, key=key)
+                db.session.add(row)
+            for field, value in source.items():
+                setattr(row, field, value)
+
+            replaced = None
+            reference = ImageReference.query.filter_by(user_id=user_id, kind=kind, key=key).first()
+            if reference is None:
+                db.session.add(ImageReference(
+                    user_id=user_id, kind=kind, key=key, sha256=sha256, path=rel_path
+                ))
+            else:
+                if reference.sha256 != sha256:
+                    replaced = reference.sha256
+                reference.sha256 = sha256
+                reference.path = rel_path
+            db.session.flush()
+
+            orphaned = self._delete_orphans([replaced]) if replaced else []
+            db.session.commit()
+            return orphaned
+
+        orphaned = run_write(write)
+        self._sources[(kind, key)] = dict(source)
+        self._references[(user_id, kind, key)] = (source['sha256'], rel_path)
+        self._remove_blobs(orphaned)
+
+    def fetch(self, kind, key, url, local_path, rel_path, user_id=None, timeout=10):
+        """Make sure local_path holds the current image for (kind, key).
+
+        Fresh entries already linked for this user return immediately. Stale
+        ones are revalidated with a conditional GET, and only downloaded again
+        if they changed or their blob is missing or truncated. Returns rel_path
+        or None on failure.
+        """
+        key = str(key)
+        now = datetime.utcnow()
+        source = self._get_source(kind, key)
+        reference = self._get_reference(user_id, kind, key)
+
+        if source is not None and now - source['checked_at'] < get_max_age(kind):
+            if reference == (source['sha256'], rel_path):
+                inc('images_total', kind=kind, result='fresh')
+                return rel_path
+            if self.blob_intact(source['sha256'], source['size']):
+                inc('images_total', kind=kind, result='fresh')
+                logger.debug("Reusing stored image for %s %s", kind, key, extra=sample('image'))
+                self._link(source['sha256'], local_path)
+                self._save(user_id, kind, key, rel_path, source)
+                return rel_path
+
+        intact = source is not None and self.blob_intact(source['sha256'], source['size'])
+        headers = {}
+        if intact:
+            if source['etag']:
+                headers['If-None-Match'] = source['etag']
+            if source['last_modified']:
+                headers['If-Modified-Since'] = source['last_modified']
+        elif source is not None:
+            logger.info("Stored image for %s %s is missing or truncated, downloading again", kind, key)
+
+        try:
+            response = requests.get(url, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            if not intact:
+                inc('images_total', kind=kind, result='error')
+                raise
+            # Serve the stale copy rather than nothing; revalidate next run
+            logger.warning("Could not revalidate %s image %s, keeping stored copy: %s", kind, key, e)
+            response = None
+
+        if response is not None and response.status_code == 304 and intact:
+            source = dict(source, url=url, checked_at=now)
+            inc('images_total', kind=kind, result='not_modified')
+            logger.debug("%s image %s not modified", kind, key, extra=sample('image'))
+        elif response is not None and response.status_code == 200:
+            data = response.content
+            source = {
+                'url': url,
+                'sha256': self.put_bytes(data),
+                'size': len(data),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': now,
+                'checked_at': now,
+            }
+            inc('images_total', kind=kind, result='downloaded')
+            logger.debug("Downloaded %s image %s to store as %s", kind, key, source['sha256'][:12], extra=sample('image'))
+        elif intact:
+            inc('images_total', kind=kind, result='stale')
+            if response is not None:
+                logger.warning("Revalidating %s image %s failed with status %s, keeping stored copy", kind, key, response.status_code)
+        else:
+            inc('images_total', kind=kind, result='error')
+            logger.warning("Failed to download %s image %s: Status code %s", kind, key, response.status_code)
+            return None
+
+        if reference != (source['sha256'], rel_path) or not os.path.lexists(local_path):
+            self._link(source['sha256'], local_path)
+        self._save(user_id, kind, key, rel_path, source)
+        return rel_path
+
+    def _delete_orphans(self, shas):
+        """Delete StoredImage/ImageSource rows for hashes no reference uses any more.
+
+        Must run inside a write; returns the hashes whose blobs can be removed.
+        """
+        orphaned = []
+        for sha256 in shas:
+            if not ImageReference.query.filter_by(sha256=sha256).first():
+                ImageSource.query.filter_by(sha256=sha256).delete(synchronize_session=False)
+                StoredImage.query.filter_by(sha256=sha256).delete(synchronize_session=False)
+                orphaned.append(sha256)
+        return orphaned
+
+    def _remove_blobs(self, shas):
+        """Delete blob files and their derivatives from disk"""
+        for sha256 in shas:
+            blob_path = self.blob_path(sha256)
+            # The blob plus any thumbnails generated from it (<sha256>_<width>.<ext>)
+            paths = [blob_path] + glob.glob(os.path.join(os.path.dirname(blob_path), f'{sha256}_*'))
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error("Error deleting stored image %s: %s", path, e)
+            # Remove the shard directory once it's empty
+            try:
+                os.rmdir(os.path.dirname(blob_path))
+            except OSError:
+                pass
+
+    def release_user(self, user_id):
+        """Drop all of a user's references and delete blobs nobody else uses.
+
+        Returns the number of blobs deleted.
+        """
+        if not _has_db():
+            return 0
+
+        from app.db_tuning import run_write
+
+        def write():
+            shas = {sha for (sha,) in db.session.query(ImageReference.sha256).filter_by(user_id=user_id)}
+            ImageReference.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+            orphaned = self._delete_orphans(shas)
+            db.session.commit()
+            return orphaned
+
+        try:
+            orphaned = run_write(write)
+        except Exception as e:
+            logger.exception("Error releasing images for user %s: %s", user_id, e)
+            return 0
+
+        self._remove_blobs(orphaned)
+        self._sources.clear()
+        self._references.clear()
+        logger.info("Released images for user %s, deleted %s unreferenced blobs", user_id, len(orphaned))
+        return len(orphaned)
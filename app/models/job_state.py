@@ -0,0 +1,67 @@
+"""
+Inputs of a user's analysis job, kept server-side and keyed by job id.
+
+The session only carries ``job_id``; the submitted URLs and settings, the
+uploaded file paths and the usernames parsed from the uploaded profile file
+live in a ``JobState`` row. The country selection form reads the usernames
+from the row instead of re-parsing the upload on every round trip.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert
+
+from app.database import db
+
+# A user's jobs older than this are deleted when they start a new one
+MAX_AGE = timedelta(days=7)
+
+
+class JobState(db.Model):
+    __tablename__ = 'job_state'
+    __table_args__ = (
+        db.Index('idx_job_state_user_id_created_at', 'user_id', 'created_at'),
+    )
+    job_id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'urls' or 'upload'
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # URL jobs
+    instagram_urls = db.Column(db.JSON, nullable=True)
+    max_posts = db.Column(db.Integer, nullable=True)
+    time_filter = db.Column(db.String(20), nullable=True)
+    refresh_mode = db.Column(db.String(20), nullable=True)
+    # Upload jobs
+    profile_path = db.Column(db.String(500), nullable=True)
+    posts_path = db.Column(db.String(500), nullable=True)
+    usernames = db.Column(db.JSON, nullable=True)  # Parsed from profile_path once, in file order
+
+    def __repr__(self):
+        return f'<JobState {self.job_id} ({self.kind}) for user {self.user_id}>'
+
+
+def create_job(user_id, kind, **fields):
+    """Store a new job's inputs and return its id.
+
+    Runs on the request's own connection rather than the write queue, so
+    starting a job never waits behind a running job's bulk writes.
+    """
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        conn.execute(delete(JobState).where(JobState.user_id == user_id,
+                                            JobState.created_at < now - MAX_AGE))
+        conn.execute(insert(JobState).values(job_id=job_id, user_id=user_id, kind=kind,
+                                             created_at=now, **fields))
+    return job_id
+
+
+def get_job(job_id, user_id):
+    """The user's job with this id, or None"""
+    if not job_id:
+        return None
+    job = db.session.get(JobState, job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    return job
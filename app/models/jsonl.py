@@ -0,0 +1,101 @@
+"""
+Reading and writing Instagram data files.
+
+Scrapes are saved as JSON Lines (one compact object per line) so they can be
+written while the Apify dataset is still being paged through. Files uploaded
+by users are regular JSON arrays; the readers here accept both.
+"""
+
+import json
+import os
+import threading
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+class JsonlWriter:
+    """Appends chunks of items to a JSON Lines file from any number of threads.
+
+    The file is written under a temporary name and renamed by close(), so
+    readers never see a partial export; abort() discards it instead.
+    """
+
+    def __init__(self, path, on_items=None):
+        self.path = path
+        self.on_items = on_items
+        self.count = 0
+        self._tmp_path = f'{path}.part'
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, items):
+        """Write a chunk of items; on_items is called with it under the same lock"""
+        if not items:
+            return
+        data = ''.join(json.dumps(item, ensure_ascii=False, separators=(',', ':')) + '\n' for item in items)
+        with self._lock:
+            self._file.write(data)
+            self.count += len(items)
+            if self.on_items is not None:
+                self.on_items(items)
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def write_chunks(writer, items, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Feed an iterable into a JsonlWriter chunk by chunk; returns the item count"""
+    count = 0
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        count += 1
+        if len(chunk) >= chunk_size:
+            writer.write(chunk)
+            chunk = []
+    writer.write(chunk)
+    return count
+
+
+def write_jsonl(path, items, chunk_size=DEFAULT_CHUNK_SIZE, on_items=None):
+    """Stream items into path as JSON Lines, a chunk at a time.
+
+    ``on_items`` is called with each chunk after it has been written. Returns
+    the number of items written.
+    """
+    writer = JsonlWriter(path, on_items)
+    try:
+        write_chunks(writer, items, chunk_size)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.count
+
+
+def iter_records(path):
+    """Yield the objects in a JSON Lines file or a JSON array file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first == '[':
+            f.seek(0)
+            yield from json.load(f)
+            return
+        f.seek(0)
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_records(path):
+    """Read all objects from a JSON Lines or JSON array file into a list"""
+    return list(iter_records(path))
@@ -0,0 +1,239 @@
+"""
+Compact in-memory records for influencers and their posts.
+
+A user's ``influencers_data`` can hold thousands of posts, and every post as
+a plain dict carries its own hash table of a dozen string keys. ``Post`` and
+``Influencer`` keep the known fields in ``__slots__`` instead and put any
+other key in a small overflow dict, so a post costs a fraction of the memory.
+
+Both behave like mutable mappings (``rec['likes_count']``, ``.get()``,
+``in``, ``.update()``, Jinja attribute access), so code that treated them as
+dicts keeps working. They are converted back to plain dicts only at the JSON
+boundary, with ``to_dict()``, or with ``encode_influencers()`` when saving a
+user's data, which keeps post tags as ids into one tag table per file.
+"""
+
+from collections.abc import MutableMapping
+
+from app.models.tags import TagDictionary, TagTable
+
+
+class Record(MutableMapping):
+    """Mapping over fixed slots plus an overflow dict for any other key.
+
+    An unset slot means the key is absent, as with a dict.
+    """
+
+    __slots__ = ('_extra',)
+    FIELDS = ()
+    _field_set = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+
+    def __init__(self, data=None, **kwargs):
+        self._extra = None
+        if data:
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+
+    @classmethod
+    def from_dict(cls, data):
+        return data if isinstance(data, cls) else cls(data)
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._field_set:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._field_set:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def copy(self):
+        return type(self)(self)
+
+    def to_dict(self, table=None):
+        """Plain dict for JSON, including nested records; see ``Post.to_dict`` for table"""
+        return {key: _plain(value, table) for key, value in self.items()}
+
+
+def _plain(value, table=None):
+    if isinstance(value, Record):
+        return value.to_dict(table)
+    if isinstance(value, list) and value and isinstance(value[0], Record):
+        return [_plain(item, table) for item in value]
+    return value
+
+
+class TaggedRecord(Record):
+    """Record holding the TagDictionary that its (or its posts') tag codes refer to"""
+
+    __slots__ = ('_tags',)
+
+    def __init__(self, data=None, tags=None, **kwargs):
+        # Set first: assigning the fields may encode tags into it
+        self._tags = tags if tags is not None else TagDictionary()
+        super().__init__(data, **kwargs)
+
+    @classmethod
+    def from_dict(cls, data, tags=None):
+        """``data`` itself if it's already a record using ``tags``, else a copy that does"""
+        if isinstance(data, cls) and (tags is None or data._tags is tags):
+            return data
+        return cls(data, tags)
+
+
+# Post tag fields and the keys their table ids are saved under
+TAG_ID_FIELDS = (('hashtags', 'hashtag_ids'), ('mentions', 'mention_ids'))
+
+
+class Post(TaggedRecord):
+    """One processed Instagram post; hashtags and mentions are stored as tag codes"""
+
+    FIELDS = (
+        'id', 'shortcode', 'caption', 'likes_count', 'comments_count', 'timestamp',
+        'display_url', 'is_video', 'engagement_rate', 'hashtags', 'mentions',
+        'image_local', 'image_variants',
+    )
+    __slots__ = tuple(field for field in FIELDS if field not in ('hashtags', 'mentions')) + (
+        'hashtag_codes', 'mention_codes')
+
+    @property
+    def hashtags(self):
+        return self._tags.decode(self.hashtag_codes)
+
+    @hashtags.setter
+    def hashtags(self, tags):
+        self.hashtag_codes = self._tags.encode(tags or [])
+
+    @hashtags.deleter
+    def hashtags(self):
+        del self.hashtag_codes
+
+    @property
+    def mentions(self):
+        return self._tags.decode(self.mention_codes)
+
+    @mentions.setter
+    def mentions(self, tags):
+        self.mention_codes = self._tags.encode(tags or [])
+
+    @mentions.deleter
+    def mentions(self):
+        del self.mention_codes
+
+    def to_dict(self, table=None):
+        """Plain dict for JSON; with a TagTable, tags are saved as ids into it"""
+        if table is None:
+            return super().to_dict()
+        data = {}
+        for key in self:
+            if key == 'hashtags':
+                data['hashtag_ids'] = table.ids(self.hashtag_codes, self._tags)
+            elif key == 'mentions':
+                data['mention_ids'] = table.ids(self.mention_codes, self._tags)
+            else:
+                data[key] = self[key]
+        return data
+
+
+class Influencer(TaggedRecord):
+    """One analyzed profile; ``posts`` holds Post records sharing its TagDictionary"""
+
+    FIELDS = (
+        'username', 'full_name', 'biography', 'external_url', 'followers_count',
+        'follows_count', 'is_verified', 'posts_count', 'profile_pic_url',
+        'business_category', 'country', 'processed_at', 'posts',
+        'profile_pic_local', 'profile_pic_variants', 'all_captions', 'aggregates',
+        'likes_total', 'comments_total', 'total_engagement', 'avg_likes',
+        'avg_comments', 'engagement_rate', 'avg_engagement_rate',
+        'max_engagement_rate', 'top_hashtags', 'top_mentions', 'engagement_weekly',
+        'engagement_monthly', 'engagement_quarterly', 'latest_post_timestamp',
+        'main_interests', 'related_interests', 'key_topics', 'affiliated_brands',
+        'content_sentiment',
+    )
+    __slots__ = FIELDS
+
+    def __setitem__(self, key, value):
+        if key == 'posts' and value:
+            value = [Post.from_dict(post, self._tags) for post in value]
+        super().__setitem__(key, value)
+
+
+def encode_influencers(influencers):
+    """JSON-ready form of a {username: Influencer} mapping, with post tags as tag table ids"""
+    table = TagTable()
+    encoded = {username: Influencer.from_dict(influencer).to_dict(table)
+               for username, influencer in influencers.items()}
+    return {'influencers': encoded, 'tag_table': table.tags}
+
+
+def _decode_tag_ids(influencer, table):
+    for post in influencer.get('posts') or ():
+        for field, ids_key in TAG_ID_FIELDS:
+            if ids_key in post:
+                post[field] = table.decode(post.pop(ids_key))
+    return influencer
+
+
+def influencers_from_dicts(data, tags=None):
+    """Convert loaded JSON into Influencer records whose posts share ``tags``.
+
+    Takes ``encode_influencers`` output or, from older files, a plain
+    {username: dict} mapping with tag strings in the posts.
+    """
+    tags = tags if tags is not None else TagDictionary()
+    data = data or {}
+    # Influencer values are dicts, so a list here can only be a tag table
+    if isinstance(data.get('tag_table'), list):
+        table = TagTable(data['tag_table'])
+        data = {username: _decode_tag_ids(influencer, table)
+                for username, influencer in (data.get('influencers') or {}).items()}
+    return {username: Influencer.from_dict(influencer, tags) for username, influencer in data.items()}
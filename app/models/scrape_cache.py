@@ -0,0 +1,252 @@
+"""
+Cache of Apify scrape results, keyed by Instagram username.
+
+Scraped profiles and posts are public data, so they are shared by all users.
+Each username's results live in two JSON Lines files under
+``DATA_FOLDER/scrape_cache`` and a ``ScrapeCacheEntry`` row records when they
+were fetched and with which ``max_posts`` and ``onlyPostsNewerThan``.
+
+A new request reuses an entry if it is younger than the freshness window and
+covers the request: the cached window reaches at least as far back, and it
+holds at least as many posts (or everything the account had in the window).
+Only the remaining usernames are sent to Apify.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from app.database import db
+from app.metrics import inc
+from app.models.apify_client_wrapper import (
+    newer_than_for, parse_newer_than, parse_timestamp, username_from_url
+)
+from app.models.jsonl import iter_records
+
+DEFAULT_TTL_HOURS = 6
+
+logger = logging.getLogger(__name__)
+
+# Usernames are used in file names
+_SAFE_USERNAME = re.compile(r'^[A-Za-z0-9._]+$')
+
+
+class ScrapeCacheEntry(db.Model):
+    """One username's cached profile and posts"""
+    __tablename__ = 'scrape_cache_entry'
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(150), unique=True, nullable=False, index=True)  # Lower-cased
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    max_posts = db.Column(db.Integer, nullable=False)
+    posts_newer_than = db.Column(db.String(50), nullable=True)  # None means all time
+    posts_cutoff = db.Column(db.DateTime, nullable=True)  # fetched_at minus the window
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def covers(self, max_posts, cutoff):
+        """Whether this entry holds everything a request for (max_posts, cutoff) needs"""
+        if self.posts_cutoff is not None and (cutoff is None or cutoff < self.posts_cutoff):
+            return False
+        # Fewer posts than asked for means the account had no more in the window
+        return self.max_posts >= max_posts or self.post_count < self.max_posts
+
+    def __repr__(self):
+        return f'<ScrapeCacheEntry {self.username} ({self.post_count} posts)>'
+
+
+def get_ttl():
+    """Freshness window from SCRAPE_CACHE_TTL_HOURS; 0 disables the cache"""
+    return timedelta(hours=float(os.getenv('SCRAPE_CACHE_TTL_HOURS', DEFAULT_TTL_HOURS)))
+
+
+class _Collector:
+    """Routes freshly scraped items into per-username cache files.
+
+    Lines are buffered per username and appended to temp files, so no file
+    handles are held open across chunks. Chunks may arrive from several actor
+    runs at once.
+    """
+
+    FLUSH_LINES = 200
+
+    def __init__(self, cache, usernames):
+        self.cache = cache
+        self.usernames = {username.lower() for username in usernames if _SAFE_USERNAME.match(username)}
+        self.post_counts = {username: 0 for username in self.usernames}
+        self.profiles = set()
+        self._buffers = {}
+        self._lock = threading.Lock()
+        # Concurrent requests for the same username must not share temp files
+        self._suffix = f'.{uuid.uuid4().hex[:8]}.part'
+
+    def _add(self, path, item):
+        line = self.cache.dumps(item)
+        buffer = self._buffers.setdefault(path, [])
+        buffer.append(line)
+        if len(buffer) >= self.FLUSH_LINES:
+            self._flush(path)
+
+    def _flush(self, path):
+        lines = self._buffers.pop(path, [])
+        if lines:
+            with open(path + self._suffix, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+
+    def add_profiles(self, items):
+        with self._lock:
+            for item in items:
+                username = str(item.get('username', '')).lower()
+                if username in self.usernames:
+                    self.profiles.add(username)
+                    self._add(self.cache.profile_path(username), item)
+
+    def add_posts(self, items):
+        with self._lock:
+            for item in items:
+                username = str(item.get('ownerUsername', '')).lower()
+                if username in self.usernames:
+                    self.post_counts[username] += 1
+                    self._add(self.cache.posts_path(username), item)
+
+    def _part_paths(self):
+        for username in self.usernames:
+            yield (username, self.cache.profile_path(username) + self._suffix,
+                   self.cache.posts_path(username) + self._suffix)
+
+    def commit(self, max_posts, posts_newer_than, newer_than_by_username=None):
+        """Publish the files and record cache entries for usernames with a profile"""
+        with self._lock:
+            for path in list(self._buffers):
+                self._flush(path)
+        now = datetime.utcnow()
+        stored = []
+        for username, profile_part, posts_part in self._part_paths():
+            if username not in self.profiles:
+                # Nothing usable came back (private or missing account); don't cache
+                for part in (profile_part, posts_part):
+                    if os.path.exists(part):
+                        os.remove(part)
+                continue
+            if not os.path.exists(posts_part):
+                open(posts_part, 'w').close()
+            os.replace(profile_part, self.cache.profile_path(username))
+            os.replace(posts_part, self.cache.posts_path(username))
+            stored.append(username)
+        self.cache.record(stored, self.post_counts, max_posts, posts_newer_than, now, newer_than_by_username)
+        return stored
+
+    def abort(self):
+        self._buffers.clear()
+        for _, profile_part, posts_part in self._part_paths():
+            for part in (profile_part, posts_part):
+                if os.path.exists(part):
+                    os.remove(part)
+
+
+class ScrapeCache:
+    """Per-username cache of Apify profile and post results"""
+
+    def __init__(self, cache_dir, ttl=None):
+        self.cache_dir = cache_dir
+        self.ttl = get_ttl() if ttl is None else ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def dumps(item):
+        return json.dumps(item, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    def profile_path(self, username):
+        return os.path.join(self.cache_dir, f'{username.lower()}.profile.jsonl')
+
+    def posts_path(self, username):
+        return os.path.join(self.cache_dir, f'{username.lower()}.posts.jsonl')
+
+    @property
+    def enabled(self):
+        return self.ttl > timedelta(0)
+
+    def partition(self, urls, max_posts, posts_newer_than, newer_than_by_username=None):
+        """Split profile URLs into (cached usernames, URLs that need scraping)"""
+        if not self.enabled:
+            return [], list(urls)
+
+        now = datetime.utcnow()
+        by_username = {}
+        for url in urls:
+            username = username_from_url(url)
+            if _SAFE_USERNAME.match(username):
+                by_username.setdefault(username.lower(), url)
+
+        entries = {}
+        names = list(by_username)
+        for i in range(0, len(names), 500):
+            query = ScrapeCacheEntry.query.filter(ScrapeCacheEntry.username.in_(names[i:i + 500]))
+            entries.update({entry.username: entry for entry in query})
+
+        cached, to_scrape = [], []
+        for url in urls:
+            username = username_from_url(url)
+            entry = entries.get(username.lower())
+            cutoff = parse_newer_than(newer_than_for(username, posts_newer_than, newer_than_by_username), now)
+            if (entry is not None and now - entry.fetched_at < self.ttl
+                    and entry.covers(int(max_posts), cutoff)
+                    and os.path.exists(self.posts_path(username))):
+                cached.append(username.lower())
+            else:
+                to_scrape.append(url)
+        inc('scrape_cache_total', len(cached), result='hit')
+        inc('scrape_cache_total', len(to_scrape), result='miss')
+        return cached, to_scrape
+
+    def replay(self, usernames, profile_writer, posts_writer, max_posts, posts_newer_than,
+               newer_than_by_username=None):
+        """Write cached results into the output files, trimmed to the request"""
+        for username in usernames:
+            cutoff = parse_newer_than(newer_than_for(username, posts_newer_than, newer_than_by_username))
+            profile_writer.write(list(iter_records(self.profile_path(username))))
+
+            posts = list(iter_records(self.posts_path(username)))
+            if cutoff is not None:
+                posts = [post for post in posts
+                         if (parse_timestamp(post.get('timestamp')) or datetime.max) >= cutoff]
+            posts.sort(key=lambda post: parse_timestamp(post.get('timestamp')) or datetime.min, reverse=True)
+            posts_writer.write(posts[:int(max_posts)])
+        if usernames:
+            logger.info("Reused cached scrape results for %s profiles", len(usernames))
+            logger.debug("Cached profiles reused: %s", usernames)
+
+    def collector(self, urls):
+        """Collector for the usernames about to be scraped"""
+        return _Collector(self, [username_from_url(url) for url in urls])
+
+    def record(self, usernames, post_counts, max_posts, posts_newer_than, fetched_at,
+               newer_than_by_username=None):
+        """Upsert cache entries once their files are in place"""
+        if not usernames:
+            return
+
+        from app.db_tuning import run_write
+
+        def write():
+            existing = {
+                entry.username: entry
+                for entry in ScrapeCacheEntry.query.filter(ScrapeCacheEntry.username.in_(usernames))
+            }
+            for username in usernames:
+                entry = existing.get(username)
+                if entry is None:
+                    entry = ScrapeCacheEntry(username=username)
+                    db.session.add(entry)
+                newer_than = newer_than_for(username, posts_newer_than, newer_than_by_username)
+                entry.fetched_at = fetched_at
+                entry.max_posts = int(max_posts)
+                entry.posts_newer_than = newer_than
+                entry.posts_cutoff = parse_newer_than(newer_than, fetched_at)
+                entry.post_count = post_counts.get(username, 0)
+            db.session.commit()
+
+        run_write(write)
+        logger.info("Cached scrape results for %s profiles", len(usernames))
@@ -0,0 +1,351 @@
+"""
+Inverted index over a user's analyzed influencers.
+
+Each row maps a term (a hashtag, a mention, an affiliated brand or a main
+interest) to the influencer, and for post-level terms the post, it came from.
+``process_influencer_data`` adds rows for new posts and ``analyze_with_llm``
+replaces each influencer's brand and interest rows, so a search is one
+indexed query instead of a scan over every profile and post.
+
+Post captions go into a full-text table maintained alongside it: SQLite FTS5
+with bm25 ranking when the SQLite build has it, otherwise a plain table
+searched with LIKE.
+
+A ``SearchIndexState`` row records that a user's index has been built, so a
+user whose influencers have no tags or captions isn't rebuilt on every search.
+"""
+
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import OperationalError
+
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+POST_KINDS = ('hashtag', 'mention')
+PROFILE_KINDS = ('brand', 'interest')
+KINDS = POST_KINDS + PROFILE_KINDS
+
+# Rows per executemany batch
+_INSERT_BATCH = 1000
+
+CAPTION_TABLE = 'post_caption_search'
+
+# Whether CAPTION_TABLE is an FTS5 table; set by create_caption_table()
+_caption_fts = False
+
+# Snippet markers around matched words; plain text so clients can escape safely
+SNIPPET_MARK = '**'
+
+
+class SearchTerm(db.Model):
+    """One occurrence of a term for a user's influencer (and post)"""
+    __tablename__ = 'search_term'
+    __table_args__ = (
+        # Covers searches, so they never touch the table itself
+        db.Index('idx_search_term_lookup', 'user_id', 'term', 'kind', 'username', 'post_id'),
+        db.Index('idx_search_term_user_username', 'user_id', 'username', 'kind'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    term = db.Column(db.String(255), nullable=False)  # Lower-cased, without # or @
+    username = db.Column(db.String(150), nullable=False)
+    post_id = db.Column(db.String(64), nullable=True)  # None for profile-level terms
+
+    def __repr__(self):
+        return f'<SearchTerm {self.kind}:{self.term} -> {self.username}>'
+
+
+class SearchIndexState(db.Model):
+    """Marks a user's index as built, even when it has no rows"""
+    __tablename__ = 'search_index_state'
+    user_id = db.Column(db.Integer, primary_key=True)
+    indexed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SearchIndexState user {self.user_id} at {self.indexed_at}>'
+
+
+def create_caption_table():
+    """Create the caption table: FTS5 if SQLite supports it, else a plain indexed table"""
+    global _caption_fts
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {CAPTION_TABLE} USING fts5("
+                    "caption, user_id UNINDEXED, username UNINDEXED, post_id UNINDEXED, "
+                    "tokenize = 'unicode61 remove_diacritics 2')"
+                ))
+        except OperationalError as e:
+            logger.warning("FTS5 not available, caption search falls back to LIKE: %s", e)
+        with engine.begin() as conn:
+            sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = :name"),
+                               {'name': CAPTION_TABLE}).scalar()
+        _caption_fts = bool(sql) and 'fts5' in sql.lower()
+
+    if not _caption_fts:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {CAPTION_TABLE} ("
+                "caption TEXT, user_id INTEGER NOT NULL, username VARCHAR(150) NOT NULL, post_id VARCHAR(64))"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS idx_{CAPTION_TABLE}_user ON {CAPTION_TABLE} (user_id, username)"
+            ))
+
+
+def normalize_term(term):
+    return str(term).strip().lstrip('#@').lower()
+
+
+def parse_query(query):
+    """Split a search box query into (kinds, term); '#x' and '@x' pick the kind"""
+    query = (query or '').strip()
+    if query.startswith('#'):
+        return ('hashtag',), normalize_term(query)
+    if query.startswith('@'):
+        return ('mention',), normalize_term(query)
+    return KINDS, normalize_term(query)
+
+
+def _post_rows(user_id, username, posts):
+    for post in posts:
+        post_id = str(post.get('id', ''))[:64]
+        for kind, tags in (('hashtag', post.get('hashtags')), ('mention', post.get('mentions'))):
+            for term in {normalize_term(tag) for tag in tags or []}:
+                if term:
+                    yield {'user_id': user_id, 'kind': kind, 'term': term[:255],
+                           'username': username, 'post_id': post_id}
+
+
+def _profile_rows(user_id, username, influencer):
+    for kind, field in (('brand', 'affiliated_brands'), ('interest', 'main_interests')):
+        for term in {normalize_term(value) for value in influencer.get(field) or []}:
+            if term:
+                yield {'user_id': user_id, 'kind': kind, 'term': term[:255],
+                       'username': username, 'post_id': None}
+
+
+def _caption_rows(user_id, username, posts):
+    for post in posts:
+        caption = post.get('caption')
+        if isinstance(caption, str) and caption.strip():
+            yield {'caption': caption, 'user_id': user_id, 'username': username,
+                   'post_id': str(post.get('id', ''))[:64]}
+
+
+def _insert_captions(rows):
+    statement = text(f"INSERT INTO {CAPTION_TABLE} (caption, user_id, username, post_id) "
+                     "VALUES (:caption, :user_id, :username, :post_id)")
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= _INSERT_BATCH:
+            db.session.execute(statement, batch)
+            batch = []
+    if batch:
+        db.session.execute(statement, batch)
+
+
+def _insert(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= _INSERT_BATCH:
+            db.session.execute(SearchTerm.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(SearchTerm.__table__.insert(), batch)
+
+
+def _mark_indexed(user_id):
+    db.session.merge(SearchIndexState(user_id=user_id, indexed_at=datetime.utcnow()))
+
+
+def _delete(user_id, usernames=None, kinds=None):
+    query = SearchTerm.query.filter(SearchTerm.user_id == user_id)
+    if kinds is not None:
+        query = query.filter(SearchTerm.kind.in_(kinds))
+    if usernames is None:
+        query.delete(synchronize_session=False)
+        if kinds is None:
+            db.session.execute(text(f"DELETE FROM {CAPTION_TABLE} WHERE user_id = :user_id"),
+                               {'user_id': user_id})
+        return
+    usernames = list(usernames)
+    for i in range(0, len(usernames), 500):
+        query.filter(SearchTerm.username.in_(usernames[i:i + 500])).delete(synchronize_session=False)
+
+
+def add_posts(user_id, posts_by_username):
+    """Index newly processed posts, {username: [post, ...]}"""
+    from app.db_tuning import run_write
+
+    def write():
+        for username, posts in posts_by_username.items():
+            _insert(_post_rows(user_id, username, posts))
+            _insert_captions(_caption_rows(user_id, username, posts))
+        db.session.commit()
+
+    run_write(write)
+
+
+def replace_profiles(user_id, influencers):
+    """Re-index the brand and interest terms of {username: influencer}"""
+    from app.db_tuning import run_write
+
+    def write():
+        _delete(user_id, influencers.keys(), PROFILE_KINDS)
+        for username, influencer in influencers.items():
+            _insert(_profile_rows(user_id, username, influencer))
+        db.session.commit()
+
+    run_write(write)
+
+
+def rebuild(user_id, influencers):
+    """Replace everything indexed for a user with the given influencers"""
+    from app.db_tuning import run_write
+
+    def write():
+        _delete(user_id)
+        for username, influencer in influencers.items():
+            _insert(_post_rows(user_id, username, influencer.get('posts') or []))
+            _insert(_profile_rows(user_id, username, influencer))
+            _insert_captions(_caption_rows(user_id, username, influencer.get('posts') or []))
+        _mark_indexed(user_id)
+        db.session.commit()
+
+    run_write(write)
+
+
+def clear(user_id):
+    """Empty a user's index; it stays marked as built, since it matches their (cleared) data"""
+    from app.db_tuning import run_write
+
+    def write():
+        _delete(user_id)
+        _mark_indexed(user_id)
+        db.session.commit()
+
+    run_write(write)
+
+
+def is_indexed(user_id):
+    """Whether the user's index has been built, by rebuild() or clear()"""
+    return db.session.query(SearchIndexState.user_id).filter(SearchIndexState.user_id == user_id).first() is not None
+
+
+def search(user_id, query, limit=100):
+    """Influencers matching a query, with the kinds matched and matching post ids.
+
+    Returns a list of {'username', 'kinds', 'post_ids', 'matches'} ordered by
+    number of matches.
+    """
+    kinds, term = parse_query(query)
+    if not term:
+        return []
+    matching = (SearchTerm.user_id == user_id, SearchTerm.term == term, SearchTerm.kind.in_(kinds))
+
+    # Rank in SQL, then fetch post ids only for the influencers returned
+    matches = func.count(SearchTerm.id)
+    top = (db.session.query(SearchTerm.username)
+           .filter(*matching)
+           .group_by(SearchTerm.username)
+           .order_by(matches.desc(), SearchTerm.username)
+           .limit(limit)
+           .all())
+    usernames = [username for username, in top]
+    if not usernames:
+        return []
+    rows = (db.session.query(SearchTerm.username, SearchTerm.kind, SearchTerm.post_id)
+            .filter(*matching, SearchTerm.username.in_(usernames))
+            .all())
+
+    results = OrderedDict((username, {'username': username, 'kinds': {}, 'post_ids': {}, 'matches': 0})
+                          for username in usernames)
+    for username, kind, post_id in rows:
+        result = results[username]
+        result['kinds'][kind] = True
+        if post_id:
+            result['post_ids'][post_id] = True
+        result['matches'] += 1
+    for result in results.values():
+        result['kinds'] = list(result['kinds'])
+        result['post_ids'] = list(result['post_ids'])
+    return list(results.values())
+
+
+def _caption_words(query):
+    """Words of a caption query; a trailing '*' on a word means prefix match"""
+    return [word for word in re.findall(r"[\w'*]+", query or '') if word.strip("*'")]
+
+
+def _fts_query(words):
+    """FTS5 MATCH expression with every word quoted, so user input can't be query syntax"""
+    parts = []
+    for word in words:
+        prefix = word.endswith('*')
+        quoted = '"' + word.rstrip('*').replace('"', '""') + '"'
+        parts.append(quoted + ('*' if prefix else ''))
+    return ' '.join(parts)
+
+
+def search_captions(user_id, query, limit=50, distinct_usernames=False):
+    """Posts whose caption contains every word of the query, best match first.
+
+    Returns a list of {'username', 'post_id', 'snippet', 'rank'}; rank is the
+    bm25 score with FTS5 (lower is better) and None with the LIKE fallback.
+    With ``distinct_usernames`` it returns the sorted usernames that have at
+    least one matching post instead, and ``limit`` is ignored.
+    """
+    words = _caption_words(query)
+    if not words:
+        return []
+
+    if _caption_fts:
+        if distinct_usernames:
+            rows = db.session.execute(text(
+                f"SELECT DISTINCT username FROM {CAPTION_TABLE} "
+                f"WHERE {CAPTION_TABLE} MATCH :match AND user_id = :user_id ORDER BY username"
+            ), {'match': _fts_query(words), 'user_id': user_id})
+            return [username for username, in rows]
+
+        rows = db.session.execute(text(
+            f"SELECT username, post_id, "
+            f"snippet({CAPTION_TABLE}, 0, :mark, :mark, '...', 16), rank "
+            f"FROM {CAPTION_TABLE} WHERE {CAPTION_TABLE} MATCH :match AND user_id = :user_id "
+            "ORDER BY rank LIMIT :limit"
+        ), {'match': _fts_query(words), 'user_id': user_id, 'limit': limit, 'mark': SNIPPET_MARK})
+        return [{'username': username, 'post_id': post_id, 'snippet': snippet, 'rank': rank}
+                for username, post_id, snippet, rank in rows]
+
+    params = {'user_id': user_id, 'limit': limit}
+    clauses = []
+    for i, word in enumerate(words):
+        params[f'word{i}'] = f"%{word.rstrip('*')}%"
+        clauses.append(f'caption LIKE :word{i}')
+    if distinct_usernames:
+        rows = db.session.execute(text(
+            f"SELECT DISTINCT username FROM {CAPTION_TABLE} "
+            f"WHERE user_id = :user_id AND {' AND '.join(clauses)} ORDER BY username"
+        ), params)
+        return [username for username, in rows]
+    rows = db.session.execute(text(
+        f"SELECT username, post_id, caption FROM {CAPTION_TABLE} "
+        f"WHERE user_id = :user_id AND {' AND '.join(clauses)} ORDER BY rowid DESC LIMIT :limit"
+    ), params)
+    return [{'username': username, 'post_id': post_id, 'snippet': caption[:160], 'rank': None}
+            for username, post_id, caption in rows]
+
+
+def caption_engine():
+    return 'fts5' if _caption_fts else 'like'
@@ -0,0 +1,15 @@
+from datetime import datetime
+
+from app.database import db
+
+
+class ServerSession(db.Model):
+    """One browser session's data, looked up by the id in its cookie"""
+    __tablename__ = 'server_session'
+    session_id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)  # Tagged JSON, as in Flask's cookie sessions
+    # Purged in the background once past
+    expiry = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ServerSession {self.session_id[:8]} until {self.expiry}>'
@@ -0,0 +1,75 @@
+"""
+Dictionary encoding for hashtags and mentions.
+
+The same few thousand tags repeat across every post of a user, so posts keep
+them as compact ``array('I')`` codes into a ``TagDictionary`` instead of lists
+of separate strings. Each DataProcessor owns one dictionary and replaces it
+whenever it replaces its ``influencers_data``, so tags live no longer than
+the data that uses them. ``Post`` decodes codes back to strings on access.
+
+Saved JSON keeps the codes too: ``encode_influencers`` writes each post's tags
+as indexes into a ``tag_table`` list stored once per file, and
+``influencers_from_dicts`` reads that back as well as the older files whose
+posts carry the tag strings themselves.
+"""
+
+import threading
+from array import array
+
+
+class TagDictionary:
+    """Interns tag strings as small integer codes; codes are never reused"""
+
+    def __init__(self):
+        self._codes = {}
+        self._tags = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tags)
+
+    def code(self, tag):
+        """Code for a tag, assigning the next one if it's new"""
+        code = self._codes.get(tag)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(tag)
+                if code is None:
+                    code = len(self._tags)
+                    self._tags.append(tag)
+                    self._codes[tag] = code
+        return code
+
+    def tag(self, code):
+        return self._tags[code]
+
+    def encode(self, tags):
+        return array('I', [self.code(str(tag)) for tag in tags])
+
+    def decode(self, codes):
+        tags = self._tags
+        return [tags[code] for code in codes]
+
+
+class TagTable:
+    """Dense, file-local numbering of the tags one JSON file uses"""
+
+    def __init__(self, tags=()):
+        self.tags = list(tags)
+        self._ids = {}
+
+    def ids(self, codes, dictionary):
+        """File ids for a post's codes in ``dictionary``, adding tags not seen yet"""
+        ids = self._ids
+        result = []
+        for tag in dictionary.decode(codes):
+            tag_id = ids.get(tag)
+            if tag_id is None:
+                tag_id = ids[tag] = len(self.tags)
+                self.tags.append(tag)
+            result.append(tag_id)
+        return result
+
+    def decode(self, ids):
+        tags = self.tags
+        return [tags[tag_id] for tag_id in ids]
@@ -0,0 +1,121 @@
+"""
+Rendered-page cache for the dashboard and influencer detail pages.
+
+Both pages are a pure function of the user's ``influencers_data``, which only
+changes when a job saves, an analysis finishes or a run is loaded. Each of
+those bumps ``DataProcessor.data_version``, so the rendered HTML is cached per
+(user, page, username) together with the version it was rendered from and
+reused until the version moves on. A weak ETag derived from the page, the
+username, the data version and a hash of the templates (or BUILD_ID) is sent
+with ``X-Data-Version``, so a browser revalidating an unchanged page gets a
+304 without the page being rendered or sent, and a deploy that changes the
+templates invalidates every ETag.
+
+The cache is an in-memory LRU bounded by PAGE_CACHE_MAX_MB per worker
+(0 turns it off). Pages carrying flashed messages are never cached.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+DEFAULT_MAX_MB = 64
+
+
+class PageCache:
+    """LRU of rendered, encoded HTML keyed by page, each entry tagged with its data version"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, html):
+        size = len(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            self._entries[key] = (version, html)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+_build_id = None
+
+
+def build_id():
+    """BUILD_ID if set, else a hash of the template files; part of every ETag"""
+    global _build_id
+    if _build_id is None:
+        digest = hashlib.sha256(os.getenv('BUILD_ID', '').encode('utf-8'))
+        if not os.getenv('BUILD_ID'):
+            template_folder = os.path.join(current_app.root_path, current_app.template_folder)
+            for root, dirs, files in os.walk(template_folder):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, template_folder).encode('utf-8'))
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+        _build_id = digest.hexdigest()[:12]
+    return _build_id
+
+
+def page_etag(page, version, username=None):
+    """ETag for one user's rendering of a page at a data version"""
+    key = f'{current_user.id}\0{page}\0{username or ""}\0{version}\0{build_id()}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:24]
+
+
+PAGE_CACHE = PageCache(int(float(os.getenv('PAGE_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024))
+
+
+def cached_page(page, version, render, username=None):
+    """Response for a rendered page, reusing the cached HTML for this data version.
+
+    ``render`` is called only on a miss. Answers a matching If-None-Match
+    with 304.
+    """
+    etag = page_etag(page, version, username)
+    # Flashes are consumed by the render and would be replayed from the cache
+    cacheable = PAGE_CACHE.max_bytes > 0 and not session.get('_flashes')
+    if cacheable and request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        key = (current_user.id, page, username)
+        html = PAGE_CACHE.get(key, version) if cacheable else None
+        if html is None:
+            html = render().encode('utf-8')
+            if cacheable:
+                PAGE_CACHE.put(key, version, html)
+        response = make_response(html)
+
+    response.headers['X-Data-Version'] = str(version)
+    if cacheable:
+        response.set_etag(etag, weak=True)
+        # Always revalidate; the ETag makes that cheap
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
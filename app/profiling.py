@@ -0,0 +1,167 @@
+"""
+Opt-in request profiling.
+
+With PROFILING_ENABLED=true a request is profiled when it carries the
+``X-Profile: 1`` header, or at random with probability PROFILE_SAMPLE_RATE.
+A profiled request runs under cProfile and has the SQL statements it issues
+counted and timed. The last PROFILE_KEEP profiles are kept in memory per
+worker and served by ``/debug/profiles`` next to ``/debug/logs``, each as the
+top functions by cumulative time plus the raw stats in pstats format
+(``?format=pstats``, loadable with ``pstats.Stats`` or snakeviz).
+
+SQL run by the write queue's thread (``run_write``) is not part of the
+request thread and is not counted.
+"""
+
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import g, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile'
+
+DEFAULT_KEEP = 20
+# Functions listed per profile, by cumulative time
+DEFAULT_TOP_FUNCTIONS = 40
+# Slowest SQL statements listed per profile
+SLOWEST_QUERIES = 5
+
+_local = threading.local()
+
+
+class ProfileStore:
+    """The last N request profiles of this process"""
+
+    def __init__(self, keep=DEFAULT_KEEP):
+        self._profiles = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            profile['id'] = f'{os.getpid()}-{next(self._ids)}'
+            self._profiles.append(profile)
+        return profile['id']
+
+    def list(self, user_id=None):
+        """Newest first, without the raw stats"""
+        with self._lock:
+            profiles = [p for p in reversed(self._profiles) if user_id is None or p['user_id'] == user_id]
+        return [{key: value for key, value in p.items() if key not in ('functions', 'stats', 'sql_slowest')}
+                for p in profiles]
+
+    def get(self, profile_id, user_id=None):
+        with self._lock:
+            for profile in self._profiles:
+                if profile['id'] == profile_id and (user_id is None or profile['user_id'] == user_id):
+                    return profile
+        return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'queries', None) is not None:
+        _local.query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = getattr(_local, 'queries', None)
+    if queries is not None:
+        queries.append((time.perf_counter() - _local.query_started, statement))
+
+
+def _top_functions(stats, limit):
+    """[{'function', 'calls', 'total_seconds', 'cumulative_seconds', 'callers'}] by cumulative time"""
+    rows = []
+    for (filename, line, name), (primitive, calls, total, cumulative, callers) in stats.stats.items():
+        rows.append({
+            'function': pstats.func_std_string((filename, line, name)),
+            'calls': calls,
+            'total_seconds': round(total, 6),
+            'cumulative_seconds': round(cumulative, 6),
+            'callers': sorted(pstats.func_std_string(caller) for caller in callers)[:5],
+        })
+    rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+    return rows[:limit]
+
+
+def _should_profile(sample_rate):
+    if request.headers.get(PROFILE_HEADER) == '1':
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def init_profiling(app):
+    """Register the profiling hooks if PROFILING_ENABLED is set"""
+    app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    if not app.config['PROFILING_ENABLED']:
+        return
+    sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    top_functions = int(os.getenv('PROFILE_TOP_FUNCTIONS', DEFAULT_TOP_FUNCTIONS))
+    store = app.extensions['request_profiles'] = ProfileStore(int(os.getenv('PROFILE_KEEP', DEFAULT_KEEP)))
+
+    @app.before_request
+    def start_profile():
+        # Profiles are listed per user, so anonymous requests would be unreachable;
+        # reading profiles back shouldn't evict them
+        if (not current_user.is_authenticated or request.path.startswith('/debug/profiles')
+                or not _should_profile(sample_rate)):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return
+        g.profiler = profiler
+        g.profile_started = time.perf_counter()
+        _local.queries = []
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        duration = time.perf_counter() - g.pop('profile_started')
+        queries, _local.queries = _local.queries, None
+
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        profile_id = store.add({
+            'timestamp': datetime.now().isoformat(),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'user_id': current_user.id if current_user.is_authenticated else None,
+            'duration_ms': round(duration * 1000, 2),
+            'sql_count': len(queries),
+            'sql_ms': round(sum(seconds for seconds, _ in queries) * 1000, 2),
+            'sql_slowest': [{'ms': round(seconds * 1000, 2), 'statement': statement[:500]}
+                            for seconds, statement in sorted(queries, key=lambda q: q[0], reverse=True)[:SLOWEST_QUERIES]],
+            'functions': _top_functions(stats, top_functions),
+            'stats': marshal.dumps(stats.stats),
+        })
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    @app.teardown_request
+    def discard_profile(exc):
+        # A request that raised never reaches after_request
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _local.queries = None
@@ -1,12 +1,11 @@
 import os
 import json
+import logging
 import time
 import uuid
 import threading
 from datetime import datetime
 from functools import wraps
-import shutil # Import shutil for directory operations
-import traceback
 
 from flask import (
     Blueprint, render_template, redirect, url_for, request,
@@ -17,11 +16,20 @@ from wtforms import SelectField, validators
 from flask_login import login_required, current_user
 
 from app.models.forms import URLForm, CountryForm, UploadForm
-from app.models.data_processor import DataProcessor
-from app.models.apify_client_wrapper import ApifyWrapper
+from app.models.data_processor import DataProcessor, POST_SORT_FIELDS
+from app.models.apify_client_wrapper import ApifyWrapper, parse_newer_than
+from app.models.chart_series import compact_series
+from app.models.jsonl import iter_records
+from app.models.scrape_cache import ScrapeCache
+from app.models import search_index
 from app.models.history import History
+from app.models.job_state import create_job, get_job
+from app.metrics import current_job, timer, track_job
+from app.page_cache import cached_page
 from app import db
 
+logger = logging.getLogger(__name__)
+
 # Create the blueprint
 main_bp = Blueprint('main', __name__)
 
@@ -45,6 +53,15 @@ background_data_by_user = {}
 # Add this near the top with other global variables
 processing_status_by_user = {}  # Maps user_id to processing status info
 
+# Number of history records shown per page
+HISTORY_PAGE_SIZE = 50
+
+# Post cards rendered with the influencer page and per posts API page
+POSTS_PAGE_SIZE = 12
+
+# Upper bound for ?points= on the compact chart payload
+CHART_MAX_POINTS = 5000
+
 # Helper function to get the data processor for the current user
 def get_data_processor():
     """Get the DataProcessor instance for the current user or create one if it doesn't exist"""
@@ -103,7 +120,7 @@ def is_analysis_complete():
 # Helper function to set analysis complete status for the current user
 def set_analysis_complete(value):
     if not hasattr(current_user, 'is_authenticated') or not current_user.is_authenticated:
-        print("Warning: Attempting to set analysis complete status without authenticated user")
+        logger.warning("Attempting to set analysis complete status without authenticated user")
         return
         
     user_id = current_user.id
@@ -137,11 +154,10 @@ def update_progress(step, progress, status=None, message=None, complete=False):
             user_id = current_user.id
         else:
             # Try to get user ID from the stored global state if needed
-            print("User not authenticated in update_progress")
+            logger.warning("User not authenticated in update_progress")
             return
     except Exception as e:
-        print(f"Error getting user ID in update_progress: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error getting user ID in update_progress: %s", e)
         return
     
     # Check if this is the final update and we're setting complete=True
@@ -157,8 +173,7 @@ def update_progress(step, progress, status=None, message=None, complete=False):
             if not message:
                 message = "Processing complete! Redirecting to dashboard..."
         except Exception as e:
-            print(f"Error setting complete state: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error setting complete state: %s", e)
     
     try:
         # Ensure progress_data_by_user exists
@@ -179,12 +194,10 @@ def update_progress(step, progress, status=None, message=None, complete=False):
         # Update progress data for this user in global dictionary
         progress_data_by_user[user_id] = progress_data
         
-        print(f"Progress updated: Step {step}, {progress}%, Message: {message}, Complete: {complete}")
+        logger.debug("Progress updated: step %s, %s%%, message: %s, complete: %s", step, progress, message, complete)
     except Exception as e:
-        print(f"Error updating progress: {str(e)}")
-        print(f"Step: {step}, Progress: {progress}, Message: {message}, Complete: {complete}")
-        print(f"User ID: {user_id}")
-        traceback.print_exc()
+        logger.exception("Error updating progress for user %s (step %s, %s%%, message: %s, complete: %s): %s",
+                         user_id, step, progress, message, complete, e)
 
 # Helper function to get/set processing status
 def get_processing_status():
@@ -211,6 +224,9 @@ def set_processing_status(status, message=None, urls=None, redirect_url=None):
         'urls': urls,
         'redirect_url': redirect_url
     }
+    job = current_job()
+    if job is not None:
+        processing_status_by_user[user_id]['job_metrics'] = job.to_dict()
 
 def clear_processing_status():
     """Clear the processing status for the current user"""
@@ -221,6 +237,25 @@ def clear_processing_status():
     if user_id in processing_status_by_user:
         del processing_status_by_user[user_id]
 
+# Decorator to collect stage timings and counters for a background job
+def background_job(stage):
+    """Run a background task under track_job(); the figures land in the job's status and background data"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track_job() as job:
+                try:
+                    with timer(stage):
+                        return fn(*args, **kwargs)
+                finally:
+                    if current_user.is_authenticated:
+                        get_background_data()['job_metrics'] = job.to_dict()
+                        status = get_processing_status()
+                        if status is not None:
+                            status['job_metrics'] = job.to_dict()
+        return wrapper
+    return decorator
+
 # Decorator to inject processing status into templates
 def inject_processing_status():
     """Inject processing status into all templates"""
@@ -246,11 +281,14 @@ def index():
         instagram_urls = form.instagram_urls.data.strip().split('\n')
         max_posts = form.max_posts.data
         time_filter = form.time_filter.data
+        refresh_mode = form.refresh_mode.data
         
-        # Store settings in session
-        session['instagram_urls'] = instagram_urls
-        session['max_posts'] = max_posts
-        session['time_filter'] = time_filter
+        # Keep the job's inputs server-side; the session only carries its id
+        session['job_id'] = create_job(current_user.id, 'urls',
+                                       instagram_urls=instagram_urls,
+                                       max_posts=max_posts,
+                                       time_filter=time_filter,
+                                       refresh_mode=refresh_mode)
         
         # Reset progress data
         update_progress(1, 0, {}, 'Initializing data processing...', False)
@@ -263,7 +301,7 @@ def index():
                              redirect_url=url_for('main.dashboard'))
         
         # Start processing in a separate thread
-        background_task = copy_current_request_context(lambda: process_urls_in_background(instagram_urls, max_posts, time_filter))
+        background_task = copy_current_request_context(lambda: process_urls_in_background(instagram_urls, max_posts, time_filter, refresh_mode))
         processing_thread = threading.Thread(target=background_task)
         processing_thread.daemon = True
         processing_thread.start()
@@ -304,66 +342,66 @@ def upload_files():
             posts_filename = secure_filename(posts_file.filename)
             posts_path = os.path.join(user_uploads_dir, posts_filename)
             posts_file.save(posts_path)
-            
-            # Save the file paths in the session
-            session['profile_path'] = profile_path
-            session['posts_path'] = posts_path
-            
-            return redirect(url_for('main.select_countries'))
         
         except Exception as e:
             error = f"Error uploading files: {str(e)}"
+        
+        if error is None:
+            try:
+                # Parse the usernames once; the country form is built from them on every round trip
+                usernames = [profile['username'] for profile in iter_records(profile_path) if 'username' in profile]
+            except Exception as e:
+                error = f"Error processing profile data: {str(e)}"
+            else:
+                session['job_id'] = create_job(current_user.id, 'upload',
+                                               profile_path=profile_path,
+                                               posts_path=posts_path,
+                                               usernames=usernames)
+                return redirect(url_for('main.select_countries'))
     
     return render_template('upload.html', form=form, error=error)
 
 @main_bp.route('/select-countries', methods=['GET', 'POST'])
 @login_required
 def select_countries():
-    if 'profile_path' not in session or 'posts_path' not in session:
+    job = get_job(session.get('job_id'), current_user.id)
+    if job is None or job.kind != 'upload':
         flash('Please upload your Instagram data files first.', 'warning')
         return redirect(url_for('main.upload_files'))
+    profile_path, posts_path = job.profile_path, job.posts_path
     
     # Create a base form
     form = CountryForm()
     error = None
-    usernames = []
+    usernames = list(job.usernames or [])
     
-    # Dynamically add country fields based on the uploaded profile data
+    # Dynamically add country fields for the usernames parsed at upload time
     try:
-        # Read the profile data file
-        with open(session['profile_path'], 'r', encoding='utf-8') as f:
-            profile_data = json.load(f)
-        
-        # Extract usernames from the profile data
-        for profile in profile_data:
-            if 'username' in profile:
-                username = profile['username']
-                usernames.append(username)
-                
-                # Create the field name
-                field_name = f'country_{username}'
+        for username in usernames:
+            # Create the field name
+            field_name = f'country_{username}'
+            
+            # Add the field to the form class if it doesn't exist
+            if field_name not in form._fields:
+                country_choices = [
+                    ('', 'Select Country'),
+                    ('Australia', 'Australia'),
+                    ('Canada', 'Canada'),
+                    ('India', 'India'),
+                    ('Malaysia', 'Malaysia'),
+                    ('Singapore', 'Singapore'),
+                    ('Sri Lanka', 'Sri Lanka'),
+                    ('United Kingdom', 'United Kingdom'),
+                    ('United States', 'United States'),
+                    ('Other', 'Other')
+                ]
                 
-                # Add the field to the form class if it doesn't exist
-                if field_name not in form._fields:
-                    country_choices = [
-                        ('', 'Select Country'),
-                        ('Australia', 'Australia'),
-                        ('Canada', 'Canada'),
-                        ('India', 'India'),
-                        ('Malaysia', 'Malaysia'),
-                        ('Singapore', 'Singapore'),
-                        ('Sri Lanka', 'Sri Lanka'),
-                        ('United Kingdom', 'United Kingdom'),
-                        ('United States', 'United States'),
-                        ('Other', 'Other')
-                    ]
-                    
-                    setattr(CountryForm, field_name, SelectField(
-                        f'Country for @{username}',
-                        choices=country_choices,
-                        validators=[validators.DataRequired(message='Please select a country')]
-                    ))
-        
+                setattr(CountryForm, field_name, SelectField(
+                    f'Country for @{username}',
+                    choices=country_choices,
+                    validators=[validators.DataRequired(message='Please select a country')]
+                ))
+    
         # Re-instantiate the form to include the new fields
         form = CountryForm()
         
@@ -381,8 +419,8 @@ def select_countries():
             
             # Store country mapping in background data
             background_data = get_background_data()
-            background_data['profile_path'] = session['profile_path']
-            background_data['posts_path'] = session['posts_path']
+            background_data['profile_path'] = profile_path
+            background_data['posts_path'] = posts_path
             background_data['country_mapping'] = country_mapping
             
             # Reset progress data
@@ -391,8 +429,8 @@ def select_countries():
             
             # Start processing in a separate thread
             background_task = copy_current_request_context(lambda: process_data_in_background(
-                session['profile_path'], 
-                session['posts_path'],
+                profile_path,
+                posts_path,
                 country_mapping
             ))
             processing_thread = threading.Thread(target=background_task)
@@ -427,7 +465,8 @@ def dashboard():
         clear_processing_status()
     
     # Add a reset button to the template context
-    return render_template('dashboard.html', influencers=influencers_data, show_reset=True)
+    return cached_page('dashboard', data_processor.data_version,
+                       lambda: render_template('dashboard.html', influencers=influencers_data, show_reset=True))
 
 @main_bp.route('/influencer/<username>')
 @login_required
@@ -447,7 +486,56 @@ def influencer_detail(username):
         flash(f"Influencer @{username} not found", 'warning')
         return redirect(url_for('main.dashboard'))
 
-    return render_template('influencer_detail.html', influencer=influencer)
+    def render():
+        # Only the first page of posts; the rest are fetched from influencer_posts_api
+        posts_total, posts = data_processor.posts_page(username, limit=POSTS_PAGE_SIZE)
+        return render_template('influencer_detail.html', influencer=influencer,
+                               posts=posts, posts_total=posts_total)
+
+    return cached_page('influencer_detail', data_processor.data_version, render, username=username)
+
+@main_bp.route('/api/influencer/<username>/posts')
+@login_required
+def influencer_posts_api(username):
+    """One page of an influencer's posts, as data and as rendered post cards.
+
+    ``sort`` is timestamp, engagement_rate or likes; ``order`` is desc (default) or asc.
+    """
+    data_processor = get_data_processor()
+    if username not in data_processor.influencers_data:
+        return jsonify({'error': 'Influencer not found'}), 404
+
+    sort = request.args.get('sort', 'timestamp')
+    if sort not in POST_SORT_FIELDS:
+        return jsonify({'error': f"sort must be one of: {', '.join(POST_SORT_FIELDS)}"}), 400
+    order = 'asc' if request.args.get('order') == 'asc' else 'desc'
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', POSTS_PAGE_SIZE, type=int), 1), 100)
+
+    total, posts = data_processor.posts_page(username, sort, order == 'desc',
+                                             offset=(page - 1) * per_page, limit=per_page)
+    return jsonify({
+        'username': username,
+        'sort': sort,
+        'order': order,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'has_more': page * per_page < total,
+        'posts': [{
+            'id': post.get('id'),
+            'shortcode': post.get('shortcode'),
+            'timestamp': post.get('timestamp'),
+            'caption': post.get('caption') if isinstance(post.get('caption'), str) else '',
+            'likes_count': post.get('likes_count', 0),
+            'comments_count': post.get('comments_count', 0),
+            'engagement_rate': post.get('engagement_rate') or 0,
+            'image_url': (url_for('static', filename=post['image_local']) if post.get('image_local')
+                          else post.get('display_url')),
+            'hashtags': post.get('hashtags') or [],
+        } for post in posts],
+        'html': render_template('_post_cards.html', posts=posts),
+    })
 
 @main_bp.route('/api/influencer/<username>')
 @login_required
@@ -569,13 +657,23 @@ def influencer_api(username):
         'top_hashtags': clean_value(influencer.get('top_hashtags', [])),
         'top_mentions': clean_value(influencer.get('top_mentions', []))
     }
+
+    # Compact mode: epoch deltas instead of ISO dates, optionally downsampled to ?points=
+    if request.args.get('format') == 'compact':
+        points = request.args.get('points', type=int)
+        if points is not None:
+            points = min(max(points, 3), CHART_MAX_POINTS)
+        for name, series in (('post_engagement', post_engagement), ('weekly_engagement', weekly_engagement),
+                             ('monthly_engagement', monthly_engagement), ('quarterly_engagement', quarterly_engagement)):
+            response_data[name] = compact_series(series['dates'], series['engagement_rate'],
+                                                 series['likes'], series['comments'], points)
+        response_data['format'] = 'compact'
     
     # Additional error handling with try-except
     try:
         return jsonify(response_data)
     except Exception as e:
-        print(f"Error serializing data for {username}: {e}")
-        traceback.print_exc()
+        logger.exception("Error serializing data for %s: %s", username, e)
         # Fallback with minimal data
         return jsonify({
             'error': str(e),
@@ -585,13 +683,87 @@ def influencer_api(username):
             'quarterly_engagement': {'dates': [], 'engagement_rate': [], 'likes': [], 'comments': []}
         })
 
+@main_bp.route('/api/search')
+@login_required
+def search_api():
+    """Influencers whose posts use a hashtag or mention, or who have a matching brand or interest.
+
+    ``q`` is '#tag', '@mention' or a bare term matching any kind.
+    """
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    started = time.perf_counter()
+
+    # Data processed before the index existed is indexed on first search
+    if not search_index.is_indexed(current_user.id):
+        search_index.rebuild(current_user.id, get_data_processor().influencers_data or {})
+
+    results = search_index.search(current_user.id, query, limit=limit)
+    return jsonify({
+        'query': query,
+        'results': results,
+        'count': len(results),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+@main_bp.route('/api/search/captions')
+@login_required
+def caption_search_api():
+    """Full-text search over the user's post captions, best match first.
+
+    With ``?distinct=usernames`` only the influencers that have a matching
+    post are returned, however many posts match.
+    """
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    started = time.perf_counter()
+
+    if not search_index.is_indexed(current_user.id):
+        search_index.rebuild(current_user.id, get_data_processor().influencers_data or {})
+
+    if request.args.get('distinct') == 'usernames':
+        usernames = search_index.search_captions(current_user.id, query, distinct_usernames=True)
+        return jsonify({
+            'query': query,
+            'engine': search_index.caption_engine(),
+            'usernames': usernames,
+            'count': len(usernames),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+        })
+
+    results = search_index.search_captions(current_user.id, query, limit=limit)
+    return jsonify({
+        'query': query,
+        'engine': search_index.caption_engine(),
+        'results': results,
+        'count': len(results),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
 @main_bp.route('/history')
 @login_required
 def history():
     """Display user's analysis history from the database"""
     from app.models.history import History
-    user_history = History.query.filter_by(user_id=current_user.id).order_by(History.timestamp.desc()).all()
-    return render_template('history.html', history=user_history)
+    username = request.args.get('username', '').strip() or None
+    cursor = History.decode_cursor(request.args.get('before'))
+
+    user_history, next_cursor = History.get_page_for_user(
+        current_user.id,
+        limit=HISTORY_PAGE_SIZE,
+        before=cursor,
+        username=username
+    )
+    profile_images = History.get_profile_images([record.id for record in user_history])
+
+    return render_template(
+        'history.html',
+        history=user_history,
+        profile_images=profile_images,
+        username_filter=username,
+        next_cursor=History.encode_cursor(next_cursor),
+        is_first_page=cursor is None
+    )
 
 @main_bp.route('/history/<int:history_id>')
 @login_required
@@ -653,7 +825,7 @@ def progress_stream():
             try:
                 # Check if user ID is still valid in our progress data
                 if user_id not in progress_data_by_user:
-                    print(f"User ID {user_id} not found in progress data")
+                    logger.warning("User ID %s not found in progress data", user_id)
                     yield f"data: {json.dumps({'error': 'User data not found'})}\n\n"
                     break
                     
@@ -667,15 +839,15 @@ def progress_stream():
                     retry_count = 0
                 
                 if progress_data.get('complete', False):
-                    print("Processing complete, ending SSE stream")
+                    logger.debug("Processing complete, ending SSE stream")
                     break
                     
                 time.sleep(0.5)
             except Exception as e:
-                print(f"Error in SSE stream: {str(e)}")
+                logger.error("Error in SSE stream: %s", e)
                 retry_count += 1
                 if retry_count > 5:  # After 5 retries, give up
-                    print("Too many errors in SSE stream, closing connection")
+                    logger.error("Too many errors in SSE stream, closing connection")
                     break
                 time.sleep(1)  # Wait a bit longer on error
     
@@ -707,7 +879,7 @@ def check_progress():
         return jsonify(progress_data_by_user[user_id])
         
     except Exception as e:
-        print(f"Error in check_progress endpoint: {str(e)}")
+        logger.error("Error in check_progress endpoint: %s", e)
         return jsonify({
             'step': 1,
             'progress': 0,
@@ -716,6 +888,7 @@ def check_progress():
             'complete': False
         }), 500
 
+@background_job('upload_job')
 def process_data_in_background(profile_path, posts_path, country_mapping):
     try:
         # Get the data processor for the current user
@@ -755,7 +928,7 @@ def process_data_in_background(profile_path, posts_path, country_mapping):
         update_progress(4, 100, {'visualization': 'complete'}, 'Processing complete!', True)
 
     except Exception as e:
-        print(f"Error in background processing: {str(e)}")
+        logger.exception("Error in background processing: %s", e)
         update_progress(
             max(get_progress_data()['step'], 1),  # Keep current step
             get_progress_data()['progress'],  # Keep current progress
@@ -765,17 +938,13 @@ def process_data_in_background(profile_path, posts_path, country_mapping):
         )
 
 # New function to process Instagram URLs
-def process_urls_in_background(instagram_urls, max_posts, time_filter):
+@background_job('url_job')
+def process_urls_in_background(instagram_urls, max_posts, time_filter, refresh_mode='full'):
     try:
-        # Deployment debugging logs
-        print("\n==== DEPLOYMENT DEBUG INFO ====")
-        print(f"Starting background processing at: {datetime.now().isoformat()}")
-        print(f"Current working directory: {os.getcwd()}")
-        print(f"App root: {APP_ROOT}")
-        print(f"User ID: {current_user.id if current_user.is_authenticated else 'Not authenticated'}")
-        print(f"URLs to process: {instagram_urls}")
-        print(f"Max posts: {max_posts}")
-        print(f"Time filter: {time_filter}")
+        logger.info("Starting URL job for user %s: %s URLs, max_posts=%s, time_filter=%s, refresh_mode=%s",
+                    current_user.id if current_user.is_authenticated else None,
+                    len(instagram_urls), max_posts, time_filter, refresh_mode)
+        logger.debug("URLs to process: %s (cwd %s, app root %s)", instagram_urls, os.getcwd(), APP_ROOT)
         
         # Check for required directories
         user_id = current_user.id if current_user.is_authenticated else None
@@ -783,21 +952,21 @@ def process_urls_in_background(instagram_urls, max_posts, time_filter):
             data_dir = os.path.join(current_app.config['DATA_FOLDER'], f'user_{user_id}')
             images_dir = os.path.join(current_app.config['IMAGES_FOLDER'], f'user_{user_id}')
             
-            print(f"Data directory: {data_dir} (exists: {os.path.exists(data_dir)})")
-            print(f"Images directory: {images_dir} (exists: {os.path.exists(images_dir)})")
+            logger.debug("Data directory: %s (exists: %s)", data_dir, os.path.exists(data_dir))
+            logger.debug("Images directory: %s (exists: %s)", images_dir, os.path.exists(images_dir))
             
             # Try to create directories if they don't exist
             if not os.path.exists(data_dir):
                 os.makedirs(data_dir, exist_ok=True)
-                print(f"Created data directory: {data_dir}")
+                logger.info("Created data directory: %s", data_dir)
             
             if not os.path.exists(images_dir):
                 os.makedirs(images_dir, exist_ok=True)
-                print(f"Created images directory: {images_dir}")
+                logger.info("Created images directory: %s", images_dir)
         
         # Check OpenAI API key
         openai_api_key = os.getenv('OPENAI_API_KEY')
-        print(f"OpenAI API key available: {'Yes' if openai_api_key else 'No'}")
+        logger.debug("OpenAI API key available: %s", 'yes' if openai_api_key else 'no')
         
         # Update processing status
         set_processing_status('processing', f'Processing {len(instagram_urls)} Instagram profiles...', instagram_urls)
@@ -819,7 +988,7 @@ def process_urls_in_background(instagram_urls, max_posts, time_filter):
             time.sleep(0.5)  # Small delay for visual effect
         except Exception as e:
             error_msg = f"Failed to initialize Apify client: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             update_progress(1, 10, {'init': 'complete', 'apify': 'error'}, error_msg)
             return
         
@@ -834,72 +1003,56 @@ def process_urls_in_background(instagram_urls, max_posts, time_filter):
         elif time_filter == '1y':
             posts_newer_than = "1 year"
         
+        # In "new posts only" mode, profiles we already have are scraped from the
+        # date of their latest stored post (or the time filter, if that's later)
+        newer_than_by_username = None
+        if refresh_mode == 'new_only':
+            newer_than_by_username = {}
+            window_cutoff = parse_newer_than(posts_newer_than)
+            for username, latest_date in data_processor.latest_post_dates().items():
+                if window_cutoff is None or parse_newer_than(latest_date) > window_cutoff:
+                    newer_than_by_username[username] = latest_date
+            logger.info("Incremental refresh for %s known profiles", len(newer_than_by_username))
+        
         # Get user-specific directory for downloads
         user_data_dir = os.path.join(current_app.config['DATA_FOLDER'], f'user_{user_id}')
         os.makedirs(user_data_dir, exist_ok=True)
         
-        # Step 1: Profile Scraping (15-40%)
+        # Steps 1-2: Profile and Posts Scraping (15-60%)
         update_progress(1, 15, {'profile': 'working', 'urls': 'working'}, f'Fetching {len(instagram_urls)} Instagram profiles...')
         time.sleep(0.7)  # Small delay for visual effect
         
+        scraped_usernames = []
         try:
-            # Simulated progress updates during profile scraping
-            update_progress(1, 20, {'profile': 'working', 'urls': 'complete'}, 'URLs validated, retrieving profile data...')
-            time.sleep(0.5)
-            
-            # Remove output_dir parameter as it's not in the method signature
-            temp_profile_path = apify_client.scrape_instagram_profiles(instagram_urls)
-            
-            update_progress(1, 30, {'profile': 'working'}, 'Processing profile information...')
-            time.sleep(0.5)
-            
-            # Move the temporary file to the user's directory
-            profile_filename = f"profiles_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
-            profile_path = os.path.join(user_data_dir, profile_filename)
-            shutil.copy2(temp_profile_path, profile_path)
-            os.remove(temp_profile_path)  # Remove the temporary file
+            update_progress(1, 20, {'profile': 'working', 'posts': 'working', 'urls': 'complete'},
+                            f'URLs validated, retrieving profiles and posts (max {max_posts} per profile)...')
             
-            update_progress(1, 40, {'profile': 'complete'}, 'Profile data retrieved successfully')
-            time.sleep(0.5)
-        except Exception as e:
-            error_msg = f"Failed to scrape profile data: {str(e)}"
-            print(error_msg)
-            update_progress(1, 30, {'profile': 'error'}, error_msg)
-            return
-        
-        # Step 2: Posts Scraping (40-60%)
-        update_progress(2, 40, {'posts': 'working'}, f'Retrieving posts (max {max_posts} per profile)...')
-        time.sleep(0.5)
-        
-        try:
-            # Simulated progress updates during posts scraping
-            update_progress(2, 45, {'posts': 'working', 'media': 'working'}, 'Connecting to Instagram data APIs...')
-            time.sleep(0.5)
-            
-            # Remove output_dir parameter as it's not in the method signature
-            temp_posts_path = apify_client.scrape_instagram_posts(
-                instagram_urls, 
-                max_posts, 
-                posts_newer_than
+            # Profile and post Actor runs are independent, so they run at the same
+            # time (sharded for long URL lists) and stream straight into the user's
+            # directory; usernames for the default country mapping are collected
+            # on the way
+            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+            profile_path, posts_path = apify_client.scrape_profiles_and_posts(
+                instagram_urls,
+                max_posts,
+                posts_newer_than,
+                profile_path=os.path.join(user_data_dir, f"profiles_{timestamp}.jsonl"),
+                posts_path=os.path.join(user_data_dir, f"posts_{timestamp}.jsonl"),
+                on_profiles=lambda profiles: scraped_usernames.extend(
+                    profile['username'] for profile in profiles if 'username' in profile
+                ),
+                # Profiles scraped recently (by anyone) are reused instead of re-run
+                cache=ScrapeCache(os.path.join(current_app.config['DATA_FOLDER'], 'scrape_cache')),
+                newer_than_by_username=newer_than_by_username
             )
             
-            update_progress(2, 50, {'posts': 'working', 'media': 'complete'}, 'Downloading post content...')
-            time.sleep(0.5)
-            
-            update_progress(2, 55, {'posts': 'working'}, 'Processing post data...')
-            
-            # Move the temporary file to the user's directory
-            posts_filename = f"posts_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
-            posts_path = os.path.join(user_data_dir, posts_filename)
-            shutil.copy2(temp_posts_path, posts_path)
-            os.remove(temp_posts_path)  # Remove the temporary file
-            
-            update_progress(2, 60, {'posts': 'complete'}, 'Post data retrieved successfully')
+            update_progress(1, 40, {'profile': 'complete'}, 'Profile data retrieved successfully')
+            update_progress(2, 60, {'posts': 'complete', 'media': 'complete'}, 'Post data retrieved successfully')
             time.sleep(0.5)
         except Exception as e:
-            error_msg = f"Failed to scrape posts data: {str(e)}"
-            print(error_msg)
-            update_progress(2, 50, {'posts': 'error'}, error_msg)
+            error_msg = f"Failed to scrape Instagram data: {str(e)}"
+            logger.exception(error_msg)
+            update_progress(1, 30, {'profile': 'error', 'posts': 'error'}, error_msg)
             return
         
         # Save paths to background data
@@ -912,15 +1065,7 @@ def process_urls_in_background(instagram_urls, max_posts, time_filter):
         time.sleep(0.5)
         
         # Create default country mapping (use "Other" for all profiles)
-        country_mapping = {}
-        try:
-            with open(profile_path, 'r', encoding='utf-8') as f:
-                profile_data = json.load(f)
-                for profile in profile_data:
-                    if 'username' in profile:
-                        country_mapping[profile['username']] = 'Other'
-        except Exception as e:
-            print(f"Error creating country mapping: {str(e)}")
+        country_mapping = {username: 'Other' for username in scraped_usernames}
         
         # Store country mapping in background data
         background_data['country_mapping'] = country_mapping
@@ -975,7 +1120,7 @@ def process_urls_in_background(instagram_urls, max_posts, time_filter):
                 update_progress(4, 95, {'ai': 'complete', 'interests': 'complete'}, 'AI content analysis complete')
                 time.sleep(0.5)
             except Exception as e:
-                print(f"Error in LLM analysis: {str(e)}")
+                logger.exception("Error in LLM analysis: %s", e)
                 update_progress(4, 95, {'ai': 'warning', 'interests': 'warning'}, 'Content analysis completed with warnings')
         else:
             update_progress(4, 95, {'ai': 'warning', 'interests': 'warning'}, 'OpenAI API key not found, using basic analysis only')
@@ -995,7 +1140,7 @@ def process_urls_in_background(instagram_urls, max_posts, time_filter):
                              instagram_urls, redirect_url=url_for('main.dashboard'))
         
     except Exception as e:
-        print(f"Error in background processing: {str(e)}")
+        logger.exception("Error in background processing: %s", e)
         # Update progress and set error status
         update_progress(
             max(get_progress_data()['step'], 1),  # Keep current step
@@ -1024,7 +1169,7 @@ def clear_data():
         flash('All application data and images have been cleared.', 'success')
         return jsonify({'success': True})
     except Exception as e:
-        print(f"Error clearing data: {e}")
+        logger.exception("Error clearing data: %s", e)
         flash('An error occurred while clearing data.', 'danger')
         return jsonify({'success': False}), 500
 
@@ -1045,7 +1190,7 @@ def reset_dashboard():
         flash('All application data and images have been cleared.', 'success')
         return redirect(url_for('main.dashboard'))
     except Exception as e:
-        print(f"Error clearing data: {e}")
+        logger.exception("Error clearing data: %s", e)
         flash('An error occurred while clearing data.', 'danger')
         return redirect(url_for('main.dashboard'))
 
@@ -1076,7 +1221,8 @@ def debug_logs():
         'progress_data': progress_data_by_user.get(user_id, {}),
         'is_analysis_complete': analysis_complete_by_user.get(user_id, False),
         'background_data': background_data_by_user.get(user_id, {}),
-        'processing_status': processing_status_by_user.get(user_id, {})
+        'processing_status': processing_status_by_user.get(user_id, {}),
+        'profiling_enabled': current_app.config.get('PROFILING_ENABLED', False)
     }
     
     # Include environment info
@@ -1105,4 +1251,27 @@ def debug_logs():
         }
     }
     
-    return jsonify(debug_info) 
\ No newline at end of file
+    return jsonify(debug_info) 
+
+@main_bp.route('/debug/profiles')
+@login_required
+def debug_profiles():
+    """Recent request profiles for the current user (see app/profiling.py)"""
+    store = current_app.extensions.get('request_profiles')
+    if store is None:
+        return jsonify({'error': 'Profiling is disabled; set PROFILING_ENABLED=true'}), 404
+    return jsonify({'worker': os.getpid(), 'profiles': store.list(current_user.id)})
+
+@main_bp.route('/debug/profiles/<profile_id>')
+@login_required
+def debug_profile(profile_id):
+    """One request profile as JSON, or its raw stats with ?format=pstats"""
+    store = current_app.extensions.get('request_profiles')
+    profile = store.get(profile_id, current_user.id) if store is not None else None
+    if profile is None:
+        # Profiles live in the worker that served the request
+        return jsonify({'error': 'Profile not found in this worker', 'worker': os.getpid()}), 404
+    if request.args.get('format') == 'pstats':
+        return Response(profile['stats'], mimetype='application/octet-stream',
+                        headers={'Content-Disposition': f'attachment; filename=profile-{profile_id}.pstats'})
+    return jsonify({key: value for key, value in profile.items() if key != 'stats'})
@@ -0,0 +1,195 @@
+"""
+Pluggable server-side session storage.
+
+SESSION_BACKEND picks where ``session`` lives:
+
+- ``sqlite`` (default): a ``server_session`` row in the app database, found by
+  the random id in the session cookie. Opening a session is one primary-key
+  lookup; a row is only written when the session changed or its expiry is due
+  for a refresh, and expired rows are deleted by a background thread every
+  SESSION_PURGE_INTERVAL seconds instead of on the request path.
+- ``cookie``: Flask's signed cookie sessions, for deployments that keep only
+  the login and a few ids in the session.
+- ``filesystem``: the previous Flask-Session file per session under
+  ``app/data/sessions``.
+"""
+
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer, want_bytes
+from sqlalchemy import delete, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+from app.database import db
+from app.db_tuning import run_write
+from app.models.server_session import ServerSession
+
+DEFAULT_BACKEND = 'sqlite'
+DEFAULT_PURGE_INTERVAL = 3600  # seconds
+# A row's expiry is pushed forward at most this often while the session is in use
+MAX_REFRESH_INTERVAL = timedelta(hours=1)
+
+
+class StoredSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and whether it was changed"""
+
+    def __init__(self, initial=None, sid=None, new=False, expiry=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expiry = expiry
+        self.modified = False
+
+
+class SqlSessionInterface(SessionInterface):
+    """Sessions stored as ``ServerSession`` rows, purged in the background once expired"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, app, purge_interval=DEFAULT_PURGE_INTERVAL):
+        self.app = app
+        self.purge_interval = purge_interval
+        self._purger_pid = None
+        self._lock = threading.Lock()
+
+    def _signer(self, app):
+        if not app.config.get('SESSION_USE_SIGNER'):
+            return None
+        return Signer(app.secret_key, salt='flask-session', key_derivation='hmac')
+
+    def _new_session(self, app):
+        session = StoredSession(sid=secrets.token_urlsafe(32), new=True)
+        session.permanent = app.config.get('SESSION_PERMANENT', True)
+        # Nothing worth storing yet; anonymous requests shouldn't leave rows behind
+        session.modified = False
+        return session
+
+    def open_session(self, app, request):
+        self._ensure_purger()
+        cookie = request.cookies.get(app.session_cookie_name)
+        if not cookie:
+            return self._new_session(app)
+        sid = cookie
+        signer = self._signer(app)
+        if signer is not None:
+            try:
+                sid = signer.unsign(want_bytes(cookie)).decode('utf-8')
+            except BadSignature:
+                return self._new_session(app)
+
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(ServerSession.data, ServerSession.expiry)
+                .where(ServerSession.session_id == sid, ServerSession.expiry > datetime.utcnow())
+            ).first()
+        if row is None:
+            return self._new_session(app)
+        try:
+            data = self.serializer.loads(row.data.decode('utf-8'))
+        except ValueError:
+            return self._new_session(app)
+        return StoredSession(data, sid=sid, expiry=row.expiry)
+
+    def _refresh_due(self, app, session, expiry):
+        lifetime = app.permanent_session_lifetime
+        return expiry - session.expiry >= min(MAX_REFRESH_INTERVAL, lifetime / 10)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if not session.new and session.modified:
+                # Emptied (e.g. logout): drop the row and the cookie
+                self._delete(session.sid)
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+
+        expiry = datetime.utcnow() + app.permanent_session_lifetime
+        if not session.modified and (session.new or not self._refresh_due(app, session, expiry)):
+            return
+
+        # Written on this request's own connection, not queued behind bulk writes
+        self._store(session.sid, self.serializer.dumps(dict(session)).encode('utf-8'), expiry)
+        cookie = session.sid
+        signer = self._signer(app)
+        if signer is not None:
+            cookie = signer.sign(want_bytes(session.sid)).decode('utf-8')
+        response.set_cookie(
+            app.session_cookie_name, cookie,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    @staticmethod
+    def _store(sid, data, expiry):
+        with db.engine.begin() as conn:
+            updated = conn.execute(
+                update(ServerSession).where(ServerSession.session_id == sid).values(data=data, expiry=expiry)
+            )
+            if updated.rowcount == 0:
+                conn.execute(insert(ServerSession).values(session_id=sid, data=data, expiry=expiry))
+
+    @staticmethod
+    def _delete(sid):
+        with db.engine.begin() as conn:
+            conn.execute(delete(ServerSession).where(ServerSession.session_id == sid))
+
+    @staticmethod
+    def purge_expired():
+        """Delete expired sessions; returns how many were removed"""
+        with db.engine.begin() as conn:
+            return conn.execute(delete(ServerSession).where(ServerSession.expiry <= datetime.utcnow())).rowcount
+
+    def _ensure_purger(self):
+        # Started lazily so each gunicorn worker (forked after create_app) gets its own
+        if self.purge_interval <= 0 or self._purger_pid == os.getpid():
+            return
+        with self._lock:
+            if self._purger_pid == os.getpid():
+                return
+            self._purger_pid = os.getpid()
+            threading.Thread(target=self._purge_loop, name='session-purger', daemon=True).start()
+
+    def _purge_loop(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    purged = run_write(self.purge_expired)
+                if purged:
+                    self.app.logger.info('Purged %d expired sessions', purged)
+            except Exception as e:
+                self.app.logger.error('Error purging expired sessions: %s', e)
+            time.sleep(self.purge_interval)
+
+
+def init_session_store(app):
+    """Install the session backend chosen by SESSION_BACKEND"""
+    backend = os.getenv('SESSION_BACKEND', DEFAULT_BACKEND).lower()
+    app.config['SESSION_BACKEND'] = backend
+    if backend == 'cookie':
+        # Flask's built-in signed cookie sessions
+        return
+    if backend == 'filesystem':
+        from flask_session import Session
+
+        app.config['SESSION_TYPE'] = 'filesystem'
+        app.config.setdefault('SESSION_FILE_DIR', os.path.join(app.config['DATA_FOLDER'], 'sessions'))
+        Session(app)
+        return
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}; expected sqlite, cookie or filesystem")
+    app.session_interface = SqlSessionInterface(
+        app, purge_interval=float(os.getenv('SESSION_PURGE_INTERVAL', DEFAULT_PURGE_INTERVAL)))
@@ -0,0 +1,94 @@
+"""
+Fingerprinted static URLs and vendored front-end libraries.
+
+``url_for('static', filename=...)`` for stylesheets, scripts and fonts gets a
+``v`` query argument derived from the file's content, and responses for such
+URLs are marked immutable, so browsers keep them until the file changes
+instead of revalidating on every page. Images are left alone: they are many,
+and their paths already change with their content.
+
+``vendor_url(name)`` points templates at a pinned copy of a chart library
+under ``static/vendor`` (downloaded when the Docker image is built) and falls
+back to the same pinned version on its CDN while the local copy is missing.
+"""
+
+import hashlib
+import os
+import threading
+
+from flask import request, url_for
+
+# Extensions whose static URLs are fingerprinted
+FINGERPRINT_EXTENSIONS = ('.css', '.js', '.woff', '.woff2', '.ttf', '.svg')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# name -> (path under static/, CDN URL of the same version)
+VENDOR_ASSETS = {
+    'chart.js': ('vendor/chart.js/4.4.1/chart.umd.js',
+                 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js'),
+    'chartjs-plugin-annotation': ('vendor/chartjs-plugin-annotation/3.0.1/chartjs-plugin-annotation.min.js',
+                                  'https://cdn.jsdelivr.net/npm/chartjs-plugin-annotation@3.0.1/dist/chartjs-plugin-annotation.min.js'),
+    'moment': ('vendor/moment/2.29.4/moment.min.js',
+               'https://cdnjs.cloudflare.com/ajax/libs/moment.js/2.29.4/moment.min.js'),
+}
+
+
+class Fingerprints:
+    """Short content hashes of static files, recomputed when a file's mtime or size changes"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        path = os.path.join(self.static_folder, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(filename)
+        if cached and cached[0] == key:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()[:12]
+        with self._lock:
+            self._hashes[filename] = (key, fingerprint)
+        return fingerprint
+
+
+def init_static_assets(app):
+    fingerprints = Fingerprints(app.static_folder)
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint != 'static' or 'v' in values:
+            return
+        filename = values.get('filename') or ''
+        if filename.lower().endswith(FINGERPRINT_EXTENSIONS):
+            fingerprint = fingerprints.get(filename)
+            if fingerprint:
+                values['v'] = fingerprint
+
+    @app.after_request
+    def cache_fingerprinted(response):
+        # A stale ?v= would be cached for a year, so only mark the current one immutable
+        if (request.endpoint == 'static' and response.status_code == 200
+                and request.args.get('v')
+                and request.args['v'] == fingerprints.get(request.view_args.get('filename', ''))):
+            response.cache_control.max_age = None
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    @app.template_global()
+    def vendor_url(name):
+        """Local pinned copy of a vendored library, or the same version on its CDN"""
+        path, cdn_url = VENDOR_ASSETS[name]
+        if os.path.exists(os.path.join(app.static_folder, path)):
+            return url_for('static', filename=path)
+        return cdn_url
@@ -0,0 +1,3 @@
+# Benchmarks for the Instagram Influencer Analyzer
+# Run individual benchmarks as modules from the repository root, e.g.
+#   python -m benchmarks.sqlite_concurrency
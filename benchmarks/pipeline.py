@@ -0,0 +1,194 @@
+"""
+Stage-by-stage benchmark for the DataProcessor pipeline.
+
+Generates Apify-shaped profile and post exports with the offline stand-in
+(app/models/fake_apify_client.py), streamed to JSON Lines so it scales to 10k
+profiles and 1M posts, then runs the pipeline the way the URL flow does and
+records wall time, CPU time and memory for each stage:
+
+    load_profile_data, load_posts_data, merge_data,
+    process_influencer_data, _save_persistent_data, _save_run
+
+Everything runs against a throwaway data directory and SQLite database.
+Prints a JSON report; with --baseline it also compares against an earlier
+report and exits non-zero when a stage got slower than --max-regression.
+
+Usage:
+    python -m benchmarks.pipeline --profiles 1000 --posts 100
+    python -m benchmarks.pipeline --profiles 10000 --posts 100 --no-memory
+    python -m benchmarks.pipeline --output current.json --baseline main.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+STAGES = (
+    'load_profile_data', 'load_posts_data', 'merge_data',
+    'process_influencer_data', '_save_persistent_data', '_save_run',
+)
+
+
+def generate(directory, profiles, posts_per_profile):
+    """Write synthetic profile and post exports; returns their paths"""
+    from app.models.fake_apify_client import fake_posts, fake_profile
+    from app.models.jsonl import write_jsonl
+
+    usernames = [f'bench_{index:06d}' for index in range(profiles)]
+    now = datetime(2024, 1, 1)
+    profile_path = os.path.join(directory, 'profiles.jsonl')
+    posts_path = os.path.join(directory, 'posts.jsonl')
+    write_jsonl(profile_path, (fake_profile(username) for username in usernames))
+    write_jsonl(posts_path, (post for username in usernames
+                             for post in fake_posts(username, posts_per_profile, now=now)))
+    return profile_path, posts_path
+
+
+def rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_stage(name, fn, memory, log):
+    if memory:
+        tracemalloc.start()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    with contextlib.redirect_stdout(log):
+        fn()
+    result = {
+        'stage': name,
+        'seconds': round(time.perf_counter() - wall, 3),
+        'cpu_seconds': round(time.process_time() - cpu, 3),
+        'peak_rss_mb': rss_mb(),
+    }
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['allocated_mb'] = round(current / 1024 / 1024, 2)
+        result['peak_traced_mb'] = round(peak / 1024 / 1024, 2)
+    print(f"{name}: {result['seconds']}s", file=sys.stderr)
+    return result
+
+
+def run_pipeline(work_dir, profile_path, posts_path, user_id, memory, log):
+    from app import create_app
+    from app.models.data_processor import DataProcessor
+
+    app = create_app()
+    results = []
+    with app.app_context():
+        processor = DataProcessor(user_id=user_id, data_dir=os.path.join(work_dir, 'data'))
+        try:
+            results.append(run_stage('load_profile_data', lambda: processor.load_profile_data(profile_path), memory, log))
+            results.append(run_stage('load_posts_data', lambda: processor.load_posts_data(posts_path), memory, log))
+            results.append(run_stage('merge_data', processor.merge_data, memory, log))
+
+            # process_influencer_data saves at the end; time the saves as their own stages
+            processor._save_persistent_data = lambda: None
+            results.append(run_stage('process_influencer_data', processor.process_influencer_data, memory, log))
+            del processor._save_persistent_data
+
+            processor._save_run = lambda: None
+            results.append(run_stage('_save_persistent_data', processor._save_persistent_data, memory, log))
+            del processor._save_run
+            results.append(run_stage('_save_run', processor._save_run, memory, log))
+        finally:
+            with contextlib.redirect_stdout(log):
+                processor.clear_all_data()
+            shutil.rmtree(processor.user_images_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline_path, max_regression):
+    """Stages slower than the baseline by more than max_regression (a fraction)"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {stage['stage']: stage for stage in json.load(f)['results']}
+    regressions = []
+    for stage in results:
+        before = baseline.get(stage['stage'])
+        # Ignore noise on stages that take a few milliseconds
+        if not before or before['seconds'] < 0.05:
+            continue
+        change = stage['seconds'] / before['seconds'] - 1
+        stage['baseline_seconds'] = before['seconds']
+        stage['change'] = round(change, 3)
+        if change > max_regression:
+            regressions.append(stage['stage'])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='DataProcessor pipeline benchmark')
+    parser.add_argument('--profiles', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=100, help='posts per profile')
+    parser.add_argument('--user-id', type=int, default=999999, help='user id for the throwaway run')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip tracemalloc (it slows every stage down)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated data directory')
+    parser.add_argument('--output', help='write the JSON report to this file as well as stdout')
+    parser.add_argument('--baseline', help='earlier JSON report to compare stage times against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='allowed slowdown per stage against the baseline (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='pipeline-bench-')
+    # Point the app at a throwaway database before it is imported
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    # Keep pipeline logging out of the JSON report on stdout
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    try:
+        started = time.perf_counter()
+        profile_path, posts_path = generate(work_dir, args.profiles, args.posts)
+        generate_seconds = round(time.perf_counter() - started, 3)
+        print(f'generated data in {generate_seconds}s', file=sys.stderr)
+
+        with open(os.devnull, 'w') as log:
+            results = run_pipeline(work_dir, profile_path, posts_path, args.user_id, args.memory, log)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'pipeline',
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {
+            'profiles': args.profiles,
+            'posts_per_profile': args.posts,
+            'posts': args.profiles * args.posts,
+            'memory_tracing': args.memory,
+            'cpu_count': os.cpu_count(),
+            'generate_seconds': generate_seconds,
+        },
+        'results': results,
+        'total_seconds': round(sum(stage['seconds'] for stage in results), 3),
+    }
+    regressions = []
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        report['regressions'] = regressions
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    if regressions:
+        sys.exit(1)
+    return report
+
+
+if __name__ == '__main__':
+    main()
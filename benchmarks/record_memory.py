@@ -0,0 +1,115 @@
+"""
+Memory benchmark for the influencer/post record types (app/models/records.py).
+
+Builds a synthetic influencers.json the shape DataProcessor saves (profiles
+and posts from the offline Apify stand-in), then measures with tracemalloc
+how much memory one user's cached ``influencers_data`` takes when loaded as
+plain dicts and as slotted Influencer/Post records. Prints a JSON report.
+
+Usage:
+    python -m benchmarks.record_memory --influencers 500 --posts 100
+    python -m benchmarks.record_memory --output results.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.fake_apify_client import fake_posts, fake_profile
+from app.models.records import influencers_from_dicts
+
+
+def build_snapshot(influencers, posts_per_influencer):
+    """influencers.json content for synthetic profiles"""
+    now = datetime(2024, 1, 1)
+    data = {}
+    for index in range(influencers):
+        username = f'bench_user_{index}'
+        profile = fake_profile(username)
+        followers = profile['followersCount']
+        posts = []
+        for post in fake_posts(username, posts_per_influencer, now=now):
+            posts.append({
+                'id': post['id'],
+                'shortcode': post['shortCode'],
+                'caption': post['caption'],
+                'likes_count': post['likesCount'],
+                'comments_count': post['commentsCount'],
+                'timestamp': post['timestamp'],
+                'display_url': f"https://cdn.example.com/{post['id']}.jpg",
+                'is_video': post['isVideo'],
+                'image_local': f"images/posts/{post['id']}.jpg",
+                'engagement_rate': (post['likesCount'] + post['commentsCount']) / followers * 100,
+                'hashtags': post['hashtags'],
+                'mentions': post['mentions'],
+            })
+        data[username] = {
+            'username': username,
+            'full_name': profile['fullName'],
+            'biography': profile['biography'],
+            'followers_count': followers,
+            'posts_count': profile['postsCount'],
+            'country': 'Unknown',
+            'posts': posts,
+        }
+    return json.dumps(data)
+
+
+def measure(text, convert):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    data = json.loads(text)
+    if convert:
+        data = influencers_from_dicts(data)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return {
+        'format': 'records' if convert else 'dicts',
+        'resident_mb': round(current / 1024 / 1024, 2),
+        'peak_mb': round(peak / 1024 / 1024, 2),
+        'load_seconds': round(elapsed, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='In-memory size of influencers_data')
+    parser.add_argument('--influencers', type=int, default=500)
+    parser.add_argument('--posts', type=int, default=100, help='posts per influencer')
+    parser.add_argument('--output', help='write the JSON report to this file as well as stdout')
+    args = parser.parse_args(argv)
+
+    text = build_snapshot(args.influencers, args.posts)
+    results = [measure(text, convert=False), measure(text, convert=True)]
+    report = {
+        'benchmark': 'record_memory',
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {
+            'influencers': args.influencers,
+            'posts_per_influencer': args.posts,
+            'json_mb': round(len(text) / 1024 / 1024, 2),
+        },
+        'results': results,
+        'reduction': round(1 - results[1]['resident_mb'] / results[0]['resident_mb'], 3),
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
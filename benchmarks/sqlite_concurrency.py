@@ -0,0 +1,219 @@
+"""
+Concurrency benchmark for the SQLite tuning layer (app/db_tuning.py).
+
+Simulates several gunicorn workers, each with a few background threads, saving
+analysis history at the same time. Each write mirrors save_to_history_db: one
+history row with a JSON payload plus a handful of image rows, committed in one
+transaction, followed by a history listing read.
+
+Runs the workload against an untuned database (rollback journal, NullPool,
+pysqlite's default 5s timeout) and against the tuned configuration (WAL,
+pragmas, QueuePool and a per-process write queue), then prints a JSON report.
+
+Usage:
+    python -m benchmarks.sqlite_concurrency --workers 3 --threads 4 --writes 50
+    python -m benchmarks.sqlite_concurrency --mode tuned --output results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, Text, create_engine, select
+)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.db_tuning import WriteQueue, build_engine_options, configure_engine, get_sqlite_pragmas
+
+metadata = MetaData()
+
+history_table = Table(
+    'history', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('timestamp', DateTime, index=True),
+    Column('user_id', Integer, nullable=False),
+    Column('profile_username', String(150), nullable=False),
+    Column('analysis_results', Text),
+)
+
+image_table = Table(
+    'analysis_image', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('history_id', Integer, nullable=False),
+    Column('image_type', String(20), nullable=False),
+    Column('image_path', String(512), nullable=False),
+)
+
+IMAGES_PER_WRITE = 12
+
+
+def make_engine(db_path, mode):
+    """Create an engine configured the old way or through the tuning layer"""
+    uri = f'sqlite:///{db_path}'
+    if mode == 'default':
+        return create_engine(uri, poolclass=NullPool)
+
+    engine = create_engine(uri, **build_engine_options(uri))
+    return configure_engine(engine, get_sqlite_pragmas())
+
+
+def save_history(engine, user_id, thread_id, index, payload):
+    """One save_to_history_db-sized transaction"""
+    with engine.begin() as conn:
+        result = conn.execute(history_table.insert().values(
+            timestamp=datetime.utcnow(),
+            user_id=user_id,
+            profile_username=f'influencer_{thread_id}_{index}',
+            analysis_results=payload,
+        ))
+        history_id = result.inserted_primary_key[0]
+        conn.execute(image_table.insert(), [
+            {
+                'history_id': history_id,
+                'image_type': 'post',
+                'image_path': f'images/user_{user_id}/posts/{history_id}_{n}.jpg',
+            }
+            for n in range(IMAGES_PER_WRITE)
+        ])
+
+
+def read_history(engine, user_id):
+    """The history listing query"""
+    with engine.connect() as conn:
+        conn.execute(
+            select(history_table.c.id, history_table.c.timestamp, history_table.c.profile_username)
+            .where(history_table.c.user_id == user_id)
+            .order_by(history_table.c.timestamp.desc())
+            .limit(50)
+        ).fetchall()
+
+
+def run_worker(args):
+    """Body of one simulated gunicorn worker process"""
+    db_path, mode, worker_id, threads, writes, payload_kb = args
+    engine = make_engine(db_path, mode)
+    write_queue = WriteQueue() if mode == 'tuned' else None
+    payload = json.dumps({'captions': 'x' * (payload_kb * 1024)})
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def thread_body(thread_id):
+        for index in range(writes):
+            start = time.perf_counter()
+            try:
+                if write_queue is not None:
+                    write_queue.submit(save_history, engine, worker_id, thread_id, index, payload).result()
+                else:
+                    save_history(engine, worker_id, thread_id, index, payload)
+                read_history(engine, worker_id)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+            except OperationalError as e:
+                with lock:
+                    errors.append(str(e.orig))
+
+    workers = [threading.Thread(target=thread_body, args=(t,)) for t in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    if write_queue is not None:
+        write_queue.stop()
+    engine.dispose()
+    return latencies, errors
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def run_mode(mode, workers, threads, writes, payload_kb):
+    """Run the workload for one configuration and summarize it"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        setup_engine = make_engine(db_path, mode)
+        metadata.create_all(setup_engine)
+        setup_engine.dispose()
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(run_worker, [
+                (db_path, mode, worker_id, threads, writes, payload_kb)
+                for worker_id in range(workers)
+            ])
+        wall_time = time.perf_counter() - start
+
+    latencies = [lat for worker_latencies, _ in results for lat in worker_latencies]
+    errors = [err for _, worker_errors in results for err in worker_errors]
+    attempted = workers * threads * writes
+
+    return {
+        'mode': mode,
+        'attempted_writes': attempted,
+        'completed_writes': len(latencies),
+        'failed_writes': len(errors),
+        'locked_errors': sum(1 for err in errors if 'locked' in err),
+        'wall_time_s': round(wall_time, 3),
+        'writes_per_s': round(len(latencies) / wall_time, 1) if wall_time else None,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+            'p50': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            'p95': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+            'p99': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+            'max': round(max(latencies) * 1000, 2) if latencies else None,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLite write concurrency benchmark')
+    parser.add_argument('--mode', choices=['default', 'tuned', 'both'], default='both')
+    parser.add_argument('--workers', type=int, default=3, help='worker processes (gunicorn --workers)')
+    parser.add_argument('--threads', type=int, default=4, help='writer threads per worker')
+    parser.add_argument('--writes', type=int, default=50, help='history saves per thread')
+    parser.add_argument('--payload-kb', type=int, default=20, help='size of the analysis_results JSON')
+    parser.add_argument('--output', help='write the JSON report to this file as well as stdout')
+    args = parser.parse_args(argv)
+
+    modes = ['default', 'tuned'] if args.mode == 'both' else [args.mode]
+    report = {
+        'benchmark': 'sqlite_concurrency',
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {
+            'workers': args.workers,
+            'threads': args.threads,
+            'writes': args.writes,
+            'payload_kb': args.payload_kb,
+        },
+        'results': [run_mode(mode, args.workers, args.threads, args.writes, args.payload_kb) for mode in modes],
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,7 @@ from sqlalchemy import inspect
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Import app context and models
-from run import create_app, db
+from app import create_app, db
 from app.models.history import History, AnalysisImage
 from app.models.user import User
 
@@ -68,6 +68,23 @@ def migrate_database():
                     print(f"Adding column {column_name} to History table...")
                     conn.execute(f"ALTER TABLE history ADD COLUMN {column_name} {column_type}")
                     print(f"Added {column_name} column.")
+
+            # Composite indexes used by the paginated history listing
+            print("Ensuring history pagination indexes exist...")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id_timestamp ON history (user_id, timestamp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id_username_timestamp ON history (user_id, profile_username, timestamp)")
+
+            # Older rows were saved with zero counts; copy them out of the stored
+            # analysis so the listing never has to read analysis_results
+            print("Backfilling follower and post counts...")
+            for column_name, key in (("profile_follower_count", "followers_count"),
+                                     ("profile_post_count", "posts_count")):
+                result = conn.execute(
+                    f"UPDATE history SET {column_name} = CAST(json_extract(analysis_results, '$.{key}') AS INTEGER) "
+                    f"WHERE ({column_name} IS NULL OR {column_name} = 0) "
+                    f"AND json_extract(analysis_results, '$.{key}') > 0"
+                )
+                print(f"Backfilled {column_name} on {result.rowcount} rows.")
         
         print("Migration completed successfully!")
 
@@ -66,6 +66,8 @@ def run_migrations():
         try:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id ON history (user_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id_timestamp ON history (user_id, timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id_username_timestamp ON history (user_id, profile_username, timestamp)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_image_history_id ON analysis_image (history_id)")
             print("Indexes created successfully")
         except Exception as e: